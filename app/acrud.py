@@ -0,0 +1,103 @@
+import asyncio
+import time
+from . import crud
+from .aiodb import pool
+from .storage import get_storage, _daily_summary_query, _summary_row
+from .metrics import instrument
+from .registry import _city_row
+from .retention import choose_tier, _SERIES_QUERIES, _series_point
+import logging
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Async counterparts of the read paths in crud, registry and retention for
+# the FastAPI routes. They build the same SQL and rows as the sync versions
+# and run it on the pooled connections of app.aiodb.
+
+@instrument("acrud")
+async def get_daily_summary(city=None, start_date=None, end_date=None, after=None, limit=None):
+    try:
+        storage = get_storage()
+        if storage.name != 'sqlite':
+            return await asyncio.to_thread(storage.daily_summary, city, start_date, end_date, after, limit)
+        sql, params = _daily_summary_query(city, start_date, end_date, after)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = await pool.fetchall(sql, params)
+        return [_summary_row(row) for row in rows]
+    except Exception as e:
+        logger.error(f"Error retrieving daily summary: {e}")
+        return []
+
+@instrument("acrud")
+async def fetch_alerts(city=None, start=None, end=None, after_id=None, limit=None):
+    try:
+        sql, params = crud._alerts_query(city, start, end, after_id)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [dict(alert) for alert in await pool.fetchall(sql, params)]
+    except Exception as e:
+        logger.error(f"Error fetching alerts: {e}")
+        return []
+
+@instrument("acrud")
+async def load_alert_rules():
+    try:
+        rows = await pool.fetchall('SELECT id, city, condition, temp_threshold, created_at FROM alert_rules ORDER BY id')
+        return [dict(rule) for rule in rows]
+    except Exception as e:
+        logger.error(f"Error loading alert rules: {e}")
+        return []
+
+@instrument("acrud")
+async def clear_all_alerts():
+    try:
+        await pool.execute('DELETE FROM alerts')
+        logger.info("All alerts cleared")
+        return True
+    except Exception as e:
+        logger.error(f"Error clearing alerts: {e}")
+        return False
+
+@instrument("acrud")
+async def get_latest_forecast(city, start=None):
+    try:
+        return await pool.run(crud._latest_forecast, city, start)
+    except Exception as e:
+        logger.error(f"Error retrieving forecast for {city}: {e}")
+        return None, []
+
+@instrument("acrud")
+async def get_forecast_error(city=None, start=None, end=None, bucket_hours=3):
+    try:
+        sql, params = crud._forecast_error_query(city, start, end, bucket_hours)
+        return [crud._forecast_error_row(row) for row in await pool.fetchall(sql, params)]
+    except Exception as e:
+        logger.error(f"Error computing forecast error: {e}")
+        return []
+
+@instrument("acrud")
+async def list_cities():
+    try:
+        return [_city_row(row) for row in await pool.fetchall("SELECT * FROM cities ORDER BY name")]
+    except Exception as e:
+        logger.error(f"Error listing cities: {e}")
+        return []
+
+@instrument("acrud")
+async def get_weather_series(city, start, end, resolution=None, now=None):
+    tier = resolution or choose_tier(start, end, now or time.time())
+    try:
+        rows = await pool.fetchall(_SERIES_QUERIES[tier], (city, start, end))
+        return {'city': city, 'resolution': tier, 'points': [_series_point(row) for row in rows]}
+    except Exception as e:
+        logger.error(f"Error retrieving weather series: {e}")
+        return {'city': city, 'resolution': tier, 'points': []}
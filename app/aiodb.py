@@ -0,0 +1,96 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .config import settings
+from .storage import get_db_connection
+import logging
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# SQLite has no async driver, so async code hands queries to a small pool of
+# worker threads that each keep one connection open for their lifetime.
+# Coroutines awaiting a query hold no thread, the event loop never blocks
+# on the database, and connections are reused instead of being opened (and
+# PRAGMA-configured) per request. WAL lets the pooled readers run alongside
+# the ingest writer.
+
+class AsyncSQLitePool:
+
+    def __init__(self, size=None):
+        self.size = size
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._executor = None
+        self._connections = []
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.size or settings.db_pool_size,
+                                                        thread_name_prefix="sqlite")
+        return self._executor
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.path == settings.database_path:
+            return conn
+        if conn is not None:
+            self._discard(conn)
+        conn = get_db_connection(check_same_thread=False)
+        self._local.conn = conn
+        self._local.path = settings.database_path
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        conn.close()
+
+    def _call(self, fn, args):
+        conn = self._connection()
+        try:
+            return fn(conn, *args)
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+
+    async def run(self, fn, *args):
+        # fn(conn, *args) runs on a pool thread with that thread's connection.
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), self._call, fn, args)
+
+    async def fetchall(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def fetchone(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def execute(self, sql, params=()):
+        def write(conn):
+            with conn:
+                return conn.execute(sql, params).rowcount
+        return await self.run(write)
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+        logger.info(f"Closed {len(connections)} pooled SQLite connections")
+
+pool = AsyncSQLitePool()
@@ -0,0 +1,70 @@
+import threading
+from bisect import bisect_left, insort
+import logging
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+class AlertRuleIndex:
+    # In-memory view of alert_rules keyed by (city, condition), each holding
+    # its thresholds in sorted order. An observation only looks up its own
+    # key and slices off the thresholds it exceeds, so evaluation costs
+    # O(log k + matches) regardless of history size.
+    #
+    # Lists are replaced rather than mutated, so readers on the ingest path
+    # never need the lock.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rules = {}
+
+    def load(self, rules):
+        index = {}
+        for rule in rules:
+            insort(index.setdefault((rule['city'], rule['condition']), []), float(rule['temp_threshold']))
+        with self._lock:
+            self._rules = index
+        logger.info(f"Loaded {len(rules)} alert rules")
+
+    def add(self, city, condition, temp_threshold):
+        with self._lock:
+            thresholds = list(self._rules.get((city, condition), []))
+            if float(temp_threshold) not in thresholds:
+                insort(thresholds, float(temp_threshold))
+                self._rules[(city, condition)] = thresholds
+
+    def remove(self, city, condition, temp_threshold):
+        with self._lock:
+            thresholds = [t for t in self._rules.get((city, condition), []) if t != float(temp_threshold)]
+            if thresholds:
+                self._rules[(city, condition)] = thresholds
+            else:
+                self._rules.pop((city, condition), None)
+
+    def __len__(self):
+        return sum(len(thresholds) for thresholds in self._rules.values())
+
+    def match(self, city, condition, temp):
+        thresholds = self._rules.get((city, condition))
+        if not thresholds:
+            return []
+        # Alerts fire when temp is strictly above the threshold.
+        return thresholds[:bisect_left(thresholds, temp)]
+
+    def evaluate(self, observations):
+        # observations are (city, condition, temp, dt) tuples; returns rows
+        # ready for insertion into alerts.
+        if not self._rules:
+            return []
+        alerts = []
+        for city, condition, temp, dt in observations:
+            for threshold in self.match(city, condition, temp):
+                alerts.append((city, condition, threshold, dt))
+        return alerts
+
+alert_rules = AlertRuleIndex()
@@ -0,0 +1,193 @@
+import threading
+from itertools import chain
+import numpy as np
+from .config import settings
+from .storage import get_db_connection, get_storage
+from .metrics import instrument
+import logging
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Range statistics over raw observations, computed with NumPy over per-city
+# column arrays. Turning SQLite rows into Python objects dominates the cost
+# of a range query, so ColumnStore keeps each city's columns in memory after
+# the first bulk load and only pulls rows added since (id > last seen id).
+
+COLUMNS = ('dt', 'temp', 'feels_like', 'humidity', 'wind_speed')
+_EMPTY = np.empty((0, len(COLUMNS)))
+
+class ColumnStore:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._database_path = None
+        self._last_id = 0
+        self._tables = {}
+
+    def _reset(self):
+        self._database_path = settings.database_path
+        self._last_id = 0
+        self._tables = {}
+
+    def _load_city(self, conn, city):
+        # Runs in the same snapshot as _sync, so every row seen here has
+        # id <= _last_id and will not be pulled in again incrementally.
+        cursor = conn.execute("""
+            SELECT dt, temp, feels_like, humidity, wind_speed
+            FROM weather
+            WHERE city = ?
+            ORDER BY dt
+        """, (city,))
+        flat = np.fromiter(chain.from_iterable(cursor), dtype=np.float64)
+        return flat.reshape(-1, len(COLUMNS))
+
+    def _sync(self, conn, cities):
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM weather").fetchone()[0]
+        if self._database_path != settings.database_path or max_id < self._last_id:
+            self._reset()
+        pending = {}
+        if self._tables:
+            for row in conn.execute("""
+                SELECT city, dt, temp, feels_like, humidity, wind_speed FROM weather WHERE id > ? AND id <= ?
+            """, (self._last_id, max_id)):
+                if row[0] in self._tables:
+                    pending.setdefault(row[0], []).append(row[1:])
+        self._last_id = max_id
+        for city, rows in pending.items():
+            table = np.concatenate((self._tables[city], np.array(rows, dtype=np.float64)))
+            if not np.all(table[1:, 0] >= table[:-1, 0]):
+                table = table[np.argsort(table[:, 0], kind='stable')]
+            self._tables[city] = table
+        for city in cities:
+            if city not in self._tables:
+                self._tables[city] = self._load_city(conn, city)
+                continue
+            # Compaction deletes the oldest raw rows; drop them here too.
+            oldest = conn.execute("SELECT MIN(dt) FROM weather WHERE city = ?", (city,)).fetchone()[0]
+            table = self._tables[city]
+            if oldest is None:
+                self._tables[city] = _EMPTY
+            elif len(table) and table[0, 0] < oldest:
+                self._tables[city] = table[np.searchsorted(table[:, 0], oldest):]
+
+    def load(self, cities, start, end):
+        with self._lock:
+            conn = get_db_connection()
+            try:
+                # One read transaction so the bulk loads and the incremental
+                # sync see the same snapshot.
+                conn.isolation_level = None
+                conn.execute("BEGIN")
+                cities = cities or list_cities(conn)
+                self._sync(conn, cities)
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+            tables = {city: self._tables[city] for city in cities}
+        result = {}
+        for city, table in tables.items():
+            lo = np.searchsorted(table[:, 0], start, side='left')
+            hi = np.searchsorted(table[:, 0], end, side='right')
+            result[city] = {name: table[lo:hi, i] for i, name in enumerate(COLUMNS)}
+        return result
+
+column_store = ColumnStore()
+
+def list_cities(conn):
+    return [row[0] for row in conn.execute("SELECT DISTINCT city FROM daily_rollup ORDER BY city")]
+
+def load_range(cities, start, end):
+    # The columnar backend scans its own store; on SQLite the in-memory
+    # column cache above avoids converting rows on every query.
+    storage = get_storage()
+    if storage.name != 'sqlite':
+        return storage.scan(cities, start, end)
+    return column_store.load(cities, start, end)
+
+def heat_index(temp_c, humidity):
+    # NWS heat index: Steadman's simple formula below ~80F, otherwise the
+    # Rothfusz regression with its low- and high-humidity adjustments.
+    t = temp_c * 9 / 5 + 32
+    rh = humidity
+    simple = 0.5 * (t + 61.0 + (t - 68.0) * 1.2 + rh * 0.094)
+    full = (-42.379 + 2.04901523 * t + 10.14333127 * rh - 0.22475541 * t * rh
+            - 0.00683783 * t * t - 0.05481717 * rh * rh + 0.00122874 * t * t * rh
+            + 0.00085282 * t * rh * rh - 0.00000199 * t * t * rh * rh)
+    dry = (rh < 13) & (t >= 80) & (t <= 112)
+    full = np.where(dry, full - (13 - rh) / 4 * np.sqrt(np.clip(17 - np.abs(t - 95), 0, None) / 17), full)
+    humid = (rh > 85) & (t >= 80) & (t <= 87)
+    full = np.where(humid, full + (rh - 85) / 10 * (87 - t) / 5, full)
+    hi = np.where((simple + t) / 2 >= 80, full, simple)
+    return (hi - 32) * 5 / 9
+
+def rolling_mean(values, window):
+    if window < 1 or len(values) < window:
+        return np.empty(0)
+    cumsum = np.cumsum(np.insert(values, 0, 0.0))
+    return (cumsum[window:] - cumsum[:-window]) / window
+
+def _round(value):
+    return round(float(value), 2)
+
+def city_stats(columns, percentiles):
+    temp = columns['temp']
+    if not len(temp):
+        return {'count': 0}
+    hi = heat_index(temp, columns['humidity'])
+    delta = columns['feels_like'] - temp
+    return {
+        'count': int(len(temp)),
+        'mean_temp': _round(temp.mean()),
+        'min_temp': _round(temp.min()),
+        'max_temp': _round(temp.max()),
+        'std_temp': _round(temp.std()),
+        'percentiles': {str(p): _round(v) for p, v in zip(percentiles, np.percentile(temp, percentiles))},
+        'mean_feels_like_delta': _round(delta.mean()),
+        'max_feels_like_delta': _round(np.abs(delta).max()),
+        'mean_heat_index': _round(hi.mean()),
+        'max_heat_index': _round(hi.max()),
+        'mean_humidity': _round(columns['humidity'].mean()),
+        'mean_wind_speed': _round(columns['wind_speed'].mean())
+    }
+
+@instrument("analytics")
+def range_stats(cities, start, end, percentiles=(5, 50, 95)):
+    data = load_range(cities, start, end)
+    return {city: city_stats(columns, percentiles) for city, columns in data.items()}
+
+@instrument("analytics")
+def compare_cities(cities, start, end, metric='temp'):
+    if metric not in COLUMNS[1:]:
+        raise ValueError(f"Unknown metric: {metric}")
+    data = {city: columns for city, columns in load_range(cities, start, end).items() if len(columns['dt'])}
+    if not data:
+        return {'metric': metric, 'overall_mean': None, 'cities': []}
+    names = list(data)
+    counts = np.array([len(columns['dt']) for columns in data.values()])
+    values = np.concatenate([columns[metric] for columns in data.values()])
+    means = np.add.reduceat(values, np.concatenate(([0], np.cumsum(counts)[:-1]))) / counts
+    overall = float(values.mean())
+    return {
+        'metric': metric,
+        'overall_mean': _round(overall),
+        'cities': [{'city': names[i], 'mean': _round(means[i]), 'delta_from_overall': _round(means[i] - overall),
+                    'rank': rank + 1, 'count': int(counts[i])} for rank, i in enumerate(np.argsort(-means))]
+    }
+
+@instrument("analytics")
+def rolling_series(city, start, end, window):
+    columns = load_range([city], start, end)[city]
+    means = rolling_mean(columns['temp'], window)
+    # Each mean is stamped with the last reading in its window.
+    return {
+        'city': city,
+        'window': window,
+        'points': [{'ts': int(ts), 'rolling_mean_temp': _round(v)}
+                   for ts, v in zip(columns['dt'][window - 1:], means)]
+    }
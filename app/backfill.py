@@ -0,0 +1,387 @@
+import argparse
+import csv
+import gzip
+import io
+import itertools
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from .config import settings
+from .migrations import rebuild_daily_rollups
+from .storage import get_db_connection
+from . import crud
+import logging
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Bulk import of historical observations:
+#
+#   python -m app.backfill history/*.csv.gz exports/*.jsonl bulk.json
+#
+# Files are read as a stream of chunks of backfill_chunk_size records. Worker
+# processes decode and normalize the chunks while the main process writes
+# the previous ones, at most two chunks per worker in flight, so memory
+# stays flat however large the input is. Each chunk is one executemany
+# transaction that also records the file position reached, so an
+# interrupted run picks up after the last committed chunk. Rows already
+# stored are skipped by the unique (city, dt) index, which makes re-imports
+# harmless.
+#
+# For the load, the rollup trigger and the other weather indexes are
+# dropped; afterwards the indexes are recreated in one sorted pass and the
+# daily rollups rebuilt from the table. Alert rules are not evaluated for
+# historical rows.
+#
+# Accepted inputs, optionally gzip-compressed (.gz):
+#   .csv           with a header row; either our columns (city, main, temp,
+#                  feels_like, humidity, wind_speed, dt) or an OpenWeather
+#                  history bulk export (city_name, weather_main, ...)
+#   .jsonl/.ndjson one record per line, flat like the CSV or an OpenWeather
+#                  weather payload
+#   .json          an array of such records (OpenWeather history bulk), or a
+#                  history API response with a "list" of readings
+#
+# Temperatures in OpenWeather-shaped records are taken to be Kelvin, the
+# API's default "standard" units, and flat records Celsius; --units
+# overrides both.
+
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.json': 'json'}
+UNITS = ('auto', 'standard', 'metric')
+
+INSERT_WEATHER = """
+    INSERT OR IGNORE INTO weather (city, main, temp, feels_like, humidity, wind_speed, dt)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+def detect_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return FORMATS.get(os.path.splitext(name)[1].lower())
+
+def _open(path):
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+def normalize(record, units='auto', city=None):
+    # Returns the weather row for one input record, in the same form as
+    # crud.save_weather_data_batch stores it.
+    if isinstance(record.get('main'), dict):
+        # OpenWeather payload: current weather, history API or bulk JSON.
+        owm = True
+        main = record['main']
+        values = (record.get('name') or record.get('city_name') or city, record['weather'][0]['main'],
+                  main['temp'], main.get('feels_like', main['temp']), main['humidity'],
+                  (record.get('wind') or {}).get('speed', 0), record['dt'])
+    else:
+        owm = 'city_name' in record or 'weather_main' in record
+        values = (record.get('city') or record.get('city_name') or city,
+                  record.get('main') or record.get('weather_main'), record['temp'],
+                  record.get('feels_like') or record['temp'], record['humidity'],
+                  record.get('wind_speed') or 0, record['dt'])
+    name, condition, temp, feels_like, humidity, wind_speed, dt = values
+    if not name or not condition:
+        raise ValueError("record has no city or condition")
+    offset = 273.15 if units == 'standard' or (units == 'auto' and owm) else 0.0
+    return (name, condition, round(float(temp) - offset, 2), round(float(feels_like) - offset, 2),
+            int(float(humidity)), float(wind_speed), int(float(dt)))
+
+def _csv_converter(header, units='auto', city=None):
+    # Builds the row function for a CSV header once per chunk; going by
+    # column index is several times faster than csv.DictReader + normalize.
+    columns = {name.strip(): i for i, name in enumerate(header or ())}
+    owm = 'city_name' in columns or 'weather_main' in columns
+    offset = 273.15 if units == 'standard' or (units == 'auto' and owm) else 0.0
+    city_i = columns.get('city', columns.get('city_name'))
+    main_i = columns.get('main', columns.get('weather_main'))
+    missing = [name for name in ('temp', 'humidity', 'dt') if name not in columns]
+    if main_i is None:
+        missing.append('main')
+    if city_i is None and not city:
+        missing.append('city')
+    if missing:
+        raise ValueError(f"CSV header has no {', '.join(missing)} column")
+    temp_i, humidity_i, dt_i = columns['temp'], columns['humidity'], columns['dt']
+    feels_i = columns.get('feels_like', temp_i)
+    wind_i = columns.get('wind_speed')
+
+    def convert(row):
+        name = row[city_i] if city_i is not None else city
+        if not name or not row[main_i]:
+            raise ValueError("record has no city or condition")
+        return (name, row[main_i], round(float(row[temp_i]) - offset, 2),
+                round(float(row[feels_i] or row[temp_i]) - offset, 2), int(float(row[humidity_i])),
+                float(row[wind_i] or 0) if wind_i is not None else 0.0, int(float(row[dt_i])))
+    return convert
+
+def parse_chunk(kind, header, items, units='auto', city=None):
+    # Runs in the worker processes. Returns the chunk's rows, sorted by
+    # (city, dt) so inserts walk the unique index in order, and the number
+    # of records that could not be read.
+    if kind == 'csv':
+        items = csv.reader(io.StringIO(b"".join(items).decode("utf-8")))
+        convert = _csv_converter(header, units, city)
+    elif kind == 'jsonl':
+        items = (line for line in items if line.strip())
+        convert = lambda line: normalize(json.loads(line), units, city)
+    else:
+        convert = lambda record: normalize(record, units, city)
+    rows = []
+    rejected = 0
+    while True:
+        # A bad record only skips itself: the loop resumes the same iterator.
+        try:
+            for item in items:
+                rows.append(convert(item))
+            break
+        except (KeyError, IndexError, TypeError, ValueError, AttributeError):
+            rejected += 1
+    rows.sort(key=lambda row: (row[0], row[6]))
+    return rows, rejected
+
+JSON_BLOCK = 1 << 20
+
+def _iter_json_array(text, buf):
+    # Yields the elements of a top-level JSON array without holding the
+    # whole document; buf is what has been read so far, from the bracket on.
+    decoder = json.JSONDecoder()
+    pos = 1
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos == len(buf):
+            buf, pos = text.read(JSON_BLOCK), 0
+            if not buf:
+                raise ValueError("unterminated JSON array")
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # The element runs past the end of the buffer.
+            more = text.read(JSON_BLOCK)
+            if not more:
+                raise
+            buf, pos = buf[pos:] + more, 0
+            continue
+        yield value
+        pos = end
+
+def _iter_json_records(f):
+    text = io.TextIOWrapper(f, encoding="utf-8-sig")
+    buf = text.read(JSON_BLOCK).lstrip()
+    if buf.startswith("["):
+        yield from _iter_json_array(text, buf)
+        return
+    doc = json.loads(buf + text.read())
+    # History API responses name the city once, next to the list.
+    city = doc.get('city')
+    name = city.get('name') if isinstance(city, dict) else doc.get('city_name')
+    for record in doc.get('list', [doc]):
+        if name and isinstance(record, dict):
+            record.setdefault('name', name)
+        yield record
+
+def read_chunks(path, fmt, chunk_size, records=0, offset=None):
+    # Yields (kind, header, items, records, offset) per chunk, where records
+    # and offset are the position just past the chunk: what the checkpoint
+    # stores and what a resumed run starts from. CSV and JSONL chunks are
+    # raw lines, left for the workers to decode, and resume by seeking to
+    # the byte offset. JSON arrays are split here and resume by skipping
+    # records. Quoted CSV fields must not contain line breaks.
+    with _open(path) as f:
+        if fmt == 'json':
+            records_iter = itertools.islice(_iter_json_records(f), records, None)
+            while True:
+                items = list(itertools.islice(records_iter, chunk_size))
+                if not items:
+                    return
+                records += len(items)
+                yield 'records', None, items, records, None
+        header = None
+        position = 0
+        if fmt == 'csv':
+            line = f.readline()
+            header = next(csv.reader([line.decode("utf-8-sig")]), None)
+            position = len(line)
+        if offset:
+            f.seek(offset)
+            position = offset
+        lines = []
+        for line in f:
+            lines.append(line)
+            position += len(line)
+            if len(lines) >= chunk_size:
+                records += len(lines)
+                yield fmt, header, lines, records, position
+                lines = []
+        if lines:
+            records += len(lines)
+            yield fmt, header, lines, records, position
+
+def _parsed(chunks, executor, units, city, window):
+    # Parses chunks on the executor, in order, with at most window chunks
+    # submitted ahead of the one being written.
+    if executor is None:
+        for kind, header, items, records, offset in chunks:
+            yield parse_chunk(kind, header, items, units, city) + (records, offset)
+        return
+    pending = deque()
+    for kind, header, items, records, offset in chunks:
+        pending.append((executor.submit(parse_chunk, kind, header, items, units, city), records, offset))
+        if len(pending) >= window:
+            future, records, offset = pending.popleft()
+            yield future.result() + (records, offset)
+    while pending:
+        future, records, offset = pending.popleft()
+        yield future.result() + (records, offset)
+
+def defer_indexes(conn):
+    # Drops the weather triggers and non-unique indexes, saving their SQL
+    # first. The unique (city, dt) index stays: it is what skips rows that
+    # are already stored.
+    with conn:
+        # DDL does not open a transaction by itself in sqlite3; without this
+        # the drops would commit one by one.
+        conn.execute("BEGIN IMMEDIATE")
+        unique = {row['name'] for row in conn.execute("PRAGMA index_list(weather)") if row['unique']}
+        deferred = [row for row in conn.execute("""
+            SELECT type, name, sql FROM sqlite_master
+            WHERE tbl_name = 'weather' AND type IN ('index', 'trigger') AND sql IS NOT NULL
+        """) if row['name'] not in unique]
+        for row in deferred:
+            conn.execute("INSERT OR REPLACE INTO backfill_deferred (name, sql) VALUES (?, ?)", (row['name'], row['sql']))
+            conn.execute(f"DROP {row['type'].upper()} {row['name']}")
+    if deferred:
+        logger.info(f"Deferred {', '.join(row['name'] for row in deferred)} until the backfill finishes")
+
+def restore_indexes(conn):
+    # Recreates whatever defer_indexes dropped, here or in a run that was
+    # killed, and rebuilds the daily rollups the trigger did not maintain.
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        deferred = conn.execute("SELECT name, sql FROM backfill_deferred").fetchall()
+        if not deferred:
+            return False
+        started = time.perf_counter()
+        for row in deferred:
+            conn.execute(row['sql'])
+        conn.execute("DELETE FROM backfill_deferred")
+        rebuild_daily_rollups(conn)
+        # Summary ETags (app.responses) follow the weather sequence, which
+        # the rebuild alone leaves where it was.
+        conn.execute("UPDATE sqlite_sequence SET seq = seq + 1 WHERE name = 'weather'")
+    logger.info(f"Recreated {len(deferred)} indexes and triggers and rebuilt daily rollups "
+                f"in {time.perf_counter() - started:.1f}s")
+    return True
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+def _save_checkpoint(conn, source, fingerprint, records, offset, rows_inserted, done):
+    conn.execute("""
+        INSERT INTO backfill_checkpoint (source, fingerprint, records, offset, rows_inserted, done, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (source) DO UPDATE SET
+            fingerprint = excluded.fingerprint, records = excluded.records, offset = excluded.offset,
+            rows_inserted = excluded.rows_inserted, done = excluded.done, updated_at = excluded.updated_at
+    """, (source, fingerprint, records, offset, rows_inserted, done, time.time()))
+
+def backfill_file(conn, path, executor=None, fmt=None, units='auto', city=None, chunk_size=None,
+                  window=2, restart=False):
+    fmt = fmt or detect_format(path)
+    if fmt is None:
+        raise ValueError(f"Cannot tell the format of {path}; pass --format")
+    chunk_size = chunk_size or settings.backfill_chunk_size
+    source = os.path.abspath(path)
+    fingerprint = _fingerprint(path)
+    stats = {'records': 0, 'inserted': 0, 'rejected': 0}
+    records, offset, inserted = 0, None, 0
+    checkpoint = conn.execute("SELECT * FROM backfill_checkpoint WHERE source = ?", (source,)).fetchone()
+    if checkpoint is not None and not restart:
+        if checkpoint['fingerprint'] != fingerprint:
+            logger.warning(f"{path} changed since its checkpoint; importing it from the start")
+        elif checkpoint['done']:
+            logger.info(f"Skipping {path}: already imported ({checkpoint['rows_inserted']} rows)")
+            return stats
+        else:
+            records, offset, inserted = checkpoint['records'], checkpoint['offset'], checkpoint['rows_inserted']
+            logger.info(f"Resuming {path} after {records} records")
+    defer_indexes(conn)
+    started = time.perf_counter()
+    chunks = read_chunks(path, fmt, chunk_size, records, offset)
+    for rows, rejected, records, offset in _parsed(chunks, executor, units, city, window):
+        with conn:
+            before = conn.total_changes
+            conn.executemany(INSERT_WEATHER, rows)
+            added = conn.total_changes - before
+            inserted += added
+            _save_checkpoint(conn, source, fingerprint, records, offset, inserted, 0)
+        stats['records'] += len(rows) + rejected
+        stats['inserted'] += added
+        stats['rejected'] += rejected
+        elapsed = time.perf_counter() - started
+        logger.info(f"{path}: {records} records read, {inserted} rows inserted "
+                    f"({stats['records'] / elapsed:,.0f} records/s)")
+    with conn:
+        _save_checkpoint(conn, source, fingerprint, records, offset, inserted, 1)
+    if stats['rejected']:
+        logger.warning(f"{path}: skipped {stats['rejected']} records that could not be read")
+    return stats
+
+def backfill(paths, fmt=None, units='auto', city=None, workers=None, chunk_size=None, restart=False):
+    # Imports every file and returns the totals. With no paths it only
+    # finishes a run that was killed before it could restore the indexes.
+    workers = settings.backfill_workers if workers is None else workers
+    crud.create_tables()
+    conn = get_db_connection()
+    # A larger page cache keeps the unique index's upper levels in memory.
+    conn.execute("PRAGMA cache_size = -65536")
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 and paths else None
+    totals = {'files': 0, 'records': 0, 'inserted': 0, 'rejected': 0}
+    started = time.perf_counter()
+    try:
+        for path in paths:
+            stats = backfill_file(conn, path, executor, fmt, units, city, chunk_size, 2 * max(workers, 1), restart)
+            totals['files'] += 1
+            for key, value in stats.items():
+                totals[key] += value
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        try:
+            restore_indexes(conn)
+        finally:
+            conn.close()
+    totals['seconds'] = round(time.perf_counter() - started, 2)
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description="Import historical weather observations in bulk")
+    parser.add_argument("paths", nargs="*", help="CSV, JSONL or JSON files, optionally .gz")
+    parser.add_argument("--database", default=settings.database_path)
+    parser.add_argument("--format", choices=sorted(set(FORMATS.values())),
+                        help="input format (default: from the file extension)")
+    parser.add_argument("--units", choices=UNITS, default="auto",
+                        help="temperature units: standard (Kelvin) or metric (Celsius)")
+    parser.add_argument("--city", help="city for records that do not name one")
+    parser.add_argument("--workers", type=int, default=settings.backfill_workers, help="parser processes")
+    parser.add_argument("--chunk-size", type=int, default=settings.backfill_chunk_size,
+                        help="records per chunk and per transaction")
+    parser.add_argument("--restart", action="store_true", help="ignore checkpoints and import files from the start")
+    args = parser.parse_args()
+
+    settings.database_path = args.database
+    totals = backfill(args.paths, args.format, args.units, args.city, args.workers, args.chunk_size, args.restart)
+    print(f"Imported {totals['inserted']:,} new rows from {totals['records']:,} records in {totals['files']} files "
+          f"({totals['rejected']:,} unreadable) in {totals['seconds']:.1f}s")
+
+if __name__ == "__main__":
+    main()
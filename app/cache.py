@@ -0,0 +1,168 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from .config import settings
+from . import metrics
+import logging
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class TTLCache:
+    # Bounded LRU cache whose entries expire ttl seconds after they were
+    # stored. get_or_load lets only one caller per key run the loader; other
+    # callers missing on the same key wait for that result instead of
+    # issuing their own upstream request.
+
+    def __init__(self, maxsize, ttl, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        self._inflight = {}
+        self._async_inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def _lookup(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def get(self, key):
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (self._clock() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader, cacheable=lambda value: True):
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                self.misses += 1
+                call = self._inflight[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = loader(key)
+            if cacheable(call.result):
+                self.put(key, call.result)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
+
+    async def get_or_load_async(self, key, loader, cacheable=lambda value: True):
+        # Event-loop counterpart of get_or_load: loader is a coroutine
+        # function, and callers missing on a key that is already loading
+        # await the leader's future instead of holding a thread.
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            future = self._async_inflight.get(key)
+            leader = future is None or future.get_loop() is not loop
+            if leader:
+                self.misses += 1
+                future = self._async_inflight[key] = loop.create_future()
+                # Nobody may be waiting; mark a failure as retrieved.
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            else:
+                self.coalesced += 1
+        if not leader:
+            return await asyncio.shield(future)
+        try:
+            result = await loader(key)
+            if cacheable(result):
+                self.put(key, result)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                if self._async_inflight.get(key) is future:
+                    del self._async_inflight[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+def city_key(city: str):
+    return city.strip().lower()
+
+weather_cache = TTLCache(settings.weather_cache_size, settings.weather_cache_ttl)
+
+metrics.callback("weather_cache_entries", "Entries held in the current-weather cache.", lambda: weather_cache.stats()['size'])
+metrics.callback("weather_cache_requests_total", "Current-weather cache lookups by result.",
+                 lambda: {("hit",): weather_cache.hits, ("miss",): weather_cache.misses,
+                          ("coalesced",): weather_cache.coalesced},
+                 labelnames=("result",), kind="counter")
+metrics.callback("weather_cache_evictions_total", "Entries evicted from the current-weather cache.",
+                 lambda: weather_cache.evictions, kind="counter")
@@ -5,7 +5,77 @@ load_dotenv()
 
 class Settings:
     openweather_api_key = os.getenv("OPENWEATHER_API_KEY")
+    openweather_base_url = os.getenv("OPENWEATHER_BASE_URL", "http://api.openweathermap.org/data/2.5")
     email_user = os.getenv("EMAIL_USER")
     email_password = os.getenv("EMAIL_PASSWORD")
+    database_path = os.getenv("DATABASE_PATH", "weather.db")
+    # Buffered ingest writer
+    write_batch_size = int(os.getenv("WRITE_BATCH_SIZE", "500"))
+    write_flush_interval = float(os.getenv("WRITE_FLUSH_INTERVAL", "1.0"))
+    write_queue_size = int(os.getenv("WRITE_QUEUE_SIZE", "50000"))
+    # Bulk backfill (python -m app.backfill): parser processes and records
+    # per chunk, each chunk being one transaction and one checkpoint
+    backfill_workers = int(os.getenv("BACKFILL_WORKERS", str(os.cpu_count() or 1)))
+    backfill_chunk_size = int(os.getenv("BACKFILL_CHUNK_SIZE", "50000"))
+    # In-memory rolling stats (/stats/rolling/): window lengths with s/m/h/d
+    # suffixes, readings kept per city, and how often rows written by other
+    # processes are pulled in from the weather table
+    rolling_windows = os.getenv("ROLLING_WINDOWS", "1h,3h,6h,24h")
+    rolling_capacity = int(os.getenv("ROLLING_CAPACITY", "2048"))
+    rolling_sync_interval = float(os.getenv("ROLLING_SYNC_INTERVAL", "5"))
+    # Retention tiers: raw rows, then hourly rollups, then daily rollups forever
+    retention_raw_days = float(os.getenv("RETENTION_RAW_DAYS", "7"))
+    retention_hourly_days = float(os.getenv("RETENTION_HOURLY_DAYS", "90"))
+    compaction_interval_minutes = int(os.getenv("COMPACTION_INTERVAL_MINUTES", "60"))
+    vacuum_pages_per_run = int(os.getenv("VACUUM_PAGES_PER_RUN", "2000"))
+    # Current-weather cache; OpenWeather refreshes observations about every 10 minutes
+    weather_cache_ttl = float(os.getenv("WEATHER_CACHE_TTL", "600"))
+    weather_cache_size = int(os.getenv("WEATHER_CACHE_SIZE", "1024"))
+    # Upstream fetch engine
+    fetch_concurrency = int(os.getenv("FETCH_CONCURRENCY", "16"))
+    fetch_connect_timeout = float(os.getenv("FETCH_CONNECT_TIMEOUT", "3.05"))
+    fetch_read_timeout = float(os.getenv("FETCH_READ_TIMEOUT", "10"))
+    # Upstream resilience: timeouts and 5xx/429 responses are retried with
+    # jittered exponential backoff, repeated failures open a circuit breaker
+    # per host, and a token bucket holds every request to the API quota
+    # (upstream_requests_per_minute, in bursts of at most upstream_burst)
+    fetch_retries = int(os.getenv("FETCH_RETRIES", "2"))
+    fetch_backoff_base = float(os.getenv("FETCH_BACKOFF_BASE", "0.5"))
+    fetch_backoff_max = float(os.getenv("FETCH_BACKOFF_MAX", "8"))
+    circuit_failure_threshold = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+    circuit_reset_timeout = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+    upstream_rate_limit = os.getenv("UPSTREAM_RATE_LIMIT", "true").lower() in ("1", "true", "yes")
+    upstream_burst = int(os.getenv("UPSTREAM_BURST", "10"))
+    rate_limit_max_wait = float(os.getenv("RATE_LIMIT_MAX_WAIT", "5"))
+    # Backend for daily summaries and range scans: "sqlite", or "duckdb" for a
+    # columnar replica of the weather table (defaults to DATABASE_PATH with a
+    # .duckdb suffix)
+    storage_backend = os.getenv("STORAGE_BACKEND", "sqlite")
+    duckdb_path = os.getenv("DUCKDB_PATH")
+    # Async request path: upstream connections shared by all in-flight
+    # requests, and SQLite connections (one per pool thread) serving them
+    async_fetch_max_connections = int(os.getenv("ASYNC_FETCH_MAX_CONNECTIONS", "256"))
+    async_fetch_clients = int(os.getenv("ASYNC_FETCH_CLIENTS", "16"))
+    db_pool_size = int(os.getenv("DB_POOL_SIZE", "8"))
+    # Responses at least this many bytes are gzip-compressed for clients
+    # that accept it
+    gzip_minimum_size = int(os.getenv("GZIP_MINIMUM_SIZE", "1000"))
+    gzip_compress_level = int(os.getenv("GZIP_COMPRESS_LEVEL", "5"))
+    # City polling: per-city intervals adapt between the min and max, and each
+    # scheduler tick spends at most its share of the upstream request budget
+    poll_interval = float(os.getenv("POLL_INTERVAL", "300"))
+    poll_interval_min = float(os.getenv("POLL_INTERVAL_MIN", "120"))
+    poll_interval_max = float(os.getenv("POLL_INTERVAL_MAX", "1800"))
+    poll_change_threshold = float(os.getenv("POLL_CHANGE_THRESHOLD", "1.0"))
+    forecast_interval = float(os.getenv("FORECAST_INTERVAL", "3600"))
+    poll_tick_seconds = float(os.getenv("POLL_TICK_SECONDS", "10"))
+    upstream_requests_per_minute = float(os.getenv("UPSTREAM_REQUESTS_PER_MINUTE", "60"))
+    # Scheduler coordination across workers and nodes sharing the database
+    node_id = os.getenv("NODE_ID")
+    scheduler_lease_ttl = float(os.getenv("SCHEDULER_LEASE_TTL", "30"))
+    scheduler_heartbeat_interval = float(os.getenv("SCHEDULER_HEARTBEAT_INTERVAL", "10"))
+    scheduler_sharding = os.getenv("SCHEDULER_SHARDING", "false").lower() in ("1", "true", "yes")
+    # Sampling profiler, toggled at runtime through /profiler/start and /profiler/stop
+    profiler_interval = float(os.getenv("PROFILER_INTERVAL", "0.01"))
 
 settings = Settings()
@@ -0,0 +1,200 @@
+import hashlib
+import os
+import socket
+import threading
+import time
+import uuid
+from bisect import bisect
+from .config import settings
+from .storage import get_db_connection
+from .cache import city_key
+from . import metrics
+import logging
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Every uvicorn worker and replica runs the scheduler, but the jobs ask the
+# coordinator what to do. The process holding the "scheduler" lease row is
+# the leader: it polls every city and runs compaction. If it dies, its lease
+# expires after scheduler_lease_ttl seconds and the next heartbeat of another
+# process takes over. With sharding on, polling is instead split across all
+# live nodes by a consistent-hash ring over their heartbeat rows, and only
+# compaction stays with the leader.
+
+LEASE_NAME = "scheduler"
+RING_REPLICAS = 64
+
+def acquire_lease(conn, name, holder, ttl, now):
+    # Takes the lease if it is free or expired, or renews it if we already
+    # hold it; a single upsert, so two contenders cannot both win.
+    with conn:
+        cursor = conn.execute("""
+            INSERT INTO scheduler_lease (name, holder, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+            WHERE scheduler_lease.holder = excluded.holder OR scheduler_lease.expires_at < ?
+        """, (name, holder, now + ttl, now))
+    return cursor.rowcount == 1
+
+def release_lease(conn, name, holder):
+    with conn:
+        conn.execute("DELETE FROM scheduler_lease WHERE name = ? AND holder = ?", (name, holder))
+
+def lease_holder(conn, name, now):
+    row = conn.execute("SELECT holder FROM scheduler_lease WHERE name = ? AND expires_at >= ?",
+                       (name, now)).fetchone()
+    return row[0] if row else None
+
+def heartbeat(conn, node_id, now):
+    with conn:
+        conn.execute("""
+            INSERT INTO scheduler_nodes (node_id, started_at, heartbeat_at) VALUES (?, ?, ?)
+            ON CONFLICT (node_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at
+        """, (node_id, now, now))
+
+def live_nodes(conn, now, ttl):
+    with conn:
+        conn.execute("DELETE FROM scheduler_nodes WHERE heartbeat_at < ?", (now - ttl,))
+    return [row[0] for row in conn.execute("SELECT node_id FROM scheduler_nodes ORDER BY node_id")]
+
+def remove_node(conn, node_id):
+    with conn:
+        conn.execute("DELETE FROM scheduler_nodes WHERE node_id = ?", (node_id,))
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+class HashRing:
+    # Each node owns RING_REPLICAS points on the ring, so when a node joins
+    # or leaves only about 1/N of the cities change owner.
+
+    def __init__(self, nodes, replicas=RING_REPLICAS):
+        points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas))
+        self._keys = [point[0] for point in points]
+        self._nodes = [point[1] for point in points]
+
+    def owner(self, key):
+        if not self._keys:
+            return None
+        return self._nodes[bisect(self._keys, _hash(key)) % len(self._keys)]
+
+def default_node_id():
+    return settings.node_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class Coordinator:
+
+    def __init__(self, node_id=None, lease_ttl=None, heartbeat_interval=None, sharding=None, clock=time.time):
+        self.node_id = node_id
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.sharding = sharding
+        self._clock = clock
+        self._lease_deadline = 0
+        self._nodes = []
+        self._ring = HashRing([])
+        self._started = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_leader(self):
+        # A coordinator that was never started is a standalone process
+        # (tests, benchmarks, direct calls) and does all the work itself.
+        if not self._started:
+            return True
+        return self._clock() < self._lease_deadline
+
+    @property
+    def nodes(self):
+        return list(self._nodes)
+
+    def assigned(self, cities):
+        cities = list(cities)
+        if not self._started:
+            return cities
+        if self.sharding:
+            ring = self._ring
+            return [city for city in cities if ring.owner(city_key(city)) == self.node_id]
+        return cities if self.is_leader else []
+
+    def start(self):
+        if self._started:
+            return
+        self.node_id = self.node_id or default_node_id()
+        self.lease_ttl = self.lease_ttl or settings.scheduler_lease_ttl
+        self.heartbeat_interval = self.heartbeat_interval or settings.scheduler_heartbeat_interval
+        if self.sharding is None:
+            self.sharding = settings.scheduler_sharding
+        self._nodes = [self.node_id]
+        self._ring = HashRing(self._nodes)
+        self._started = True
+        self._stop.clear()
+        logger.info(f"Coordinator started for node {self.node_id} (sharding={self.sharding})")
+        # The first tick runs inline so the first scheduled round already
+        # knows whether this process leads.
+        self.tick()
+        self._thread = threading.Thread(target=self._run, name="coordinator", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            self.tick()
+
+    def tick(self):
+        now = self._clock()
+        try:
+            conn = get_db_connection()
+            try:
+                heartbeat(conn, self.node_id, now)
+                acquired = acquire_lease(conn, LEASE_NAME, self.node_id, self.lease_ttl, now)
+                nodes = live_nodes(conn, now, self.lease_ttl) if self.sharding else [self.node_id]
+            finally:
+                conn.close()
+        except Exception as e:
+            # Leadership simply lapses when the lease cannot be renewed.
+            logger.error(f"Error renewing scheduler lease for {self.node_id}: {e}")
+            return
+        was_leader = self.is_leader
+        self._lease_deadline = now + self.lease_ttl if acquired else 0
+        if acquired and not was_leader:
+            logger.info(f"Node {self.node_id} became scheduler leader")
+        elif was_leader and not acquired:
+            logger.warning(f"Node {self.node_id} lost the scheduler lease")
+        if self.node_id not in nodes:
+            nodes.append(self.node_id)
+        nodes.sort()
+        if nodes != self._nodes:
+            logger.info(f"Rebalancing cities across {len(nodes)} nodes")
+            self._nodes = nodes
+            self._ring = HashRing(nodes)
+
+    def stop(self):
+        if not self._started:
+            return
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            conn = get_db_connection()
+            try:
+                release_lease(conn, LEASE_NAME, self.node_id)
+                remove_node(conn, self.node_id)
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.error(f"Error releasing scheduler lease for {self.node_id}: {e}")
+        self._lease_deadline = 0
+        self._started = False
+        logger.info(f"Coordinator stopped for node {self.node_id}")
+
+coordinator = Coordinator()
+
+metrics.callback("weather_scheduler_leader", "1 while this process holds the scheduler lease.",
+                 lambda: int(coordinator.is_leader))
+metrics.callback("weather_scheduler_nodes", "Live nodes sharing the polling work.", lambda: len(coordinator.nodes))
@@ -1,6 +1,11 @@
-import sqlite3
 import logging
 from datetime import datetime
+from .config import settings
+from .migrations import migrate
+from .storage import get_db_connection, get_storage, SQLiteStorage, _stream_rows
+from .alerts import alert_rules
+from .rolling import rolling_stats
+from .metrics import instrument
 
 # Setup logger
 logger = logging.getLogger(__name__)
@@ -10,160 +15,284 @@ formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(messag
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
-def get_db_connection():
-    conn = sqlite3.connect('weather.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+# Weather rows are always written to SQLite; the configured storage backend
+# serves the daily summary and range scans.
+_sqlite = SQLiteStorage()
 
+@instrument("crud")
 def create_tables():
     try:
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS weather (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    city TEXT NOT NULL,
-                    main TEXT NOT NULL,
-                    temp REAL NOT NULL,
-                    feels_like REAL NOT NULL,
-                    humidity INTEGER NOT NULL,
-                    wind_speed REAL NOT NULL,
-                    dt INTEGER NOT NULL
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS daily_summary (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    city TEXT NOT NULL,
-                    date TEXT NOT NULL,
-                    avg_temp REAL NOT NULL,
-                    max_temp REAL NOT NULL,
-                    min_temp REAL NOT NULL,
-                    avg_humidity REAL NOT NULL,
-                    avg_wind_speed REAL NOT NULL,
-                    dominant_condition TEXT NOT NULL
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS alerts (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    city TEXT NOT NULL,
-                    condition TEXT NOT NULL,
-                    temp_threshold REAL NOT NULL,
-                    alert_time TEXT NOT NULL
-                )
-            """)
-            conn.commit()
-            logger.info("Tables created successfully")
+            version = migrate(conn)
+            logger.info(f"Tables created successfully (schema version {version})")
+        alert_rules.load(load_alert_rules())
+        rolling_stats.rebuild()
     except Exception as e:
         logger.error(f"Error creating tables: {e}")
 
 def save_weather_data(weather_data):
+    logger.info(f"Attempting to save weather data: {weather_data}")
+    if save_weather_data_batch([weather_data]):
+        logger.info(f"Weather data saved for {weather_data['city']}: {weather_data}")
+
+@instrument("crud")
+def save_weather_data_batch(rows):
+    if not rows:
+        return 0
+    try:
+        params = [(row['city'], row['main'], round(row['temp'], 2),
+                   round(row['feels_like'], 2), row['humidity'],
+                   row.get('wind_speed', 0), row['dt']) for row in rows]
+        triggered = alert_rules.evaluate((p[0], p[1], p[2], p[6]) for p in params)
+        conn = get_db_connection()
+        try:
+            with conn:
+                # Repeated forecast rows for the same (city, dt) are ignored.
+                _sqlite.save_weather(params, conn)
+                if triggered:
+                    conn.executemany("""
+                        INSERT OR IGNORE INTO alerts (city, condition, temp_threshold, alert_time)
+                        VALUES (?, ?, ?, ?)
+                    """, triggered)
+        finally:
+            conn.close()
+        rolling_stats.add_many(params)
+        logger.info(f"Saved batch of {len(rows)} weather rows, {len(triggered)} alerts triggered")
+        return len(rows)
+    except Exception as e:
+        logger.error(f"Error saving weather data batch of {len(rows)} rows: {e}")
+        return 0
+
+@instrument("crud")
+def get_daily_summary(city=None, start_date=None, end_date=None, after=None, limit=None):
+    try:
+        logger.info(f"Retrieving daily summary for city={city} from {start_date} to {end_date}")
+        daily_summary = get_storage().daily_summary(city, start_date, end_date, after, limit)
+        logger.info(f"Daily summary retrieved: {len(daily_summary)} rows")
+        return daily_summary
+    except Exception as e:
+        logger.error(f"Error retrieving daily summary: {e}")
+        return []
+
+def iter_daily_summary(city=None, start_date=None, end_date=None, after=None, batch_size=500):
+    return get_storage().iter_daily_summary(city, start_date, end_date, after, batch_size)
+
+@instrument("crud")
+def check_alert_thresholds(city, temp_threshold, condition):
     try:
-        logger.info(f"Attempting to save weather data: {weather_data}")
+        logger.info(f"Checking alert thresholds for city: {city} with condition: {condition} and threshold: {temp_threshold}")
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO weather (city, main, temp, feels_like, humidity, wind_speed, dt)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (weather_data['city'], weather_data['main'], round(weather_data['temp'], 2),
-                  round(weather_data['feels_like'], 2), weather_data['humidity'], 
-                  weather_data.get('wind_speed', 0), weather_data['dt']))
+            # Served by idx_weather_city_main_temp; existing alerts are skipped
+            # by the unique key on alerts instead of a lookup per row.
+            conn.execute('''
+                INSERT OR IGNORE INTO alerts (city, condition, temp_threshold, alert_time)
+                SELECT city, main, ?, dt
+                FROM weather
+                WHERE city = ? AND main = ? AND temp > ?
+            ''', (temp_threshold, city, condition, temp_threshold))
             conn.commit()
-            logger.info(f"Weather data saved for {weather_data['city']}: {weather_data}")
+            logger.info(f"Alerts checked and saved for city: {city} if any")
     except Exception as e:
-        logger.error(f"Error saving weather data: {e}")
+        logger.error(f"Error checking alert thresholds: {e}")
+
 
-def get_daily_summary():
+@instrument("crud")
+def save_forecasts(rows, issued_at):
+    # One executemany per issue. Fetching the same forecast again within the
+    # same issue (hour) replaces the earlier values instead of adding rows.
+    if not rows:
+        return 0
     try:
-        logger.info("Retrieving daily summary")
+        params = [(row['city'], row['dt'], issued_at, row['main'], round(row['temp'], 2),
+                   round(row['feels_like'], 2), row['humidity'], row.get('wind_speed', 0)) for row in rows]
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT city, date(dt, 'unixepoch') as date, AVG(temp) as avg_temp, MAX(temp) as max_temp, MIN(temp) as min_temp, AVG(humidity) as avg_humidity, AVG(wind_speed) as avg_wind_speed, main
-                FROM weather
-                GROUP BY city, date(dt, 'unixepoch'), main
-            ''')
-            result = cursor.fetchall()
-            daily_summary = []
-            for row in result:
-                dominant_condition = row['main']
-                daily_summary.append({
-                    'city': row['city'],
-                    'date': row['date'],
-                    'avg_temp': round(row['avg_temp'], 2),
-                    'max_temp': round(row['max_temp'], 2),
-                    'min_temp': round(row['min_temp'], 2),
-                    'avg_humidity': round(row['avg_humidity'], 2),
-                    'avg_wind_speed': round(row['avg_wind_speed'], 2),
-                    'dominant_condition': dominant_condition
-                })
-            save_daily_summary(daily_summary)
-            logger.info(f"Daily summary retrieved and saved: {daily_summary}")
-            return daily_summary
+            conn.executemany("""
+                INSERT INTO forecast (city, target_dt, issued_at, main, temp, feels_like, humidity, wind_speed)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (city, target_dt, issued_at) DO UPDATE SET
+                    main = excluded.main,
+                    temp = excluded.temp,
+                    feels_like = excluded.feels_like,
+                    humidity = excluded.humidity,
+                    wind_speed = excluded.wind_speed
+            """, params)
+        logger.info(f"Saved {len(rows)} forecast rows issued at {issued_at}")
+        return len(rows)
     except Exception as e:
-        logger.error(f"Error retrieving daily summary: {e}")
+        logger.error(f"Error saving {len(rows)} forecast rows: {e}")
+        return 0
+
+def _latest_forecast(conn, city, start=None):
+    issued_at = conn.execute("SELECT MAX(issued_at) FROM forecast WHERE city = ?", (city,)).fetchone()[0]
+    if issued_at is None:
+        return None, []
+    rows = conn.execute("""
+        SELECT target_dt, main, temp, feels_like, humidity, wind_speed
+        FROM forecast
+        WHERE city = ? AND target_dt >= ? AND issued_at = ?
+        ORDER BY target_dt
+    """, (city, start or 0, issued_at)).fetchall()
+    return issued_at, [dict(row) for row in rows]
+
+@instrument("crud")
+def get_latest_forecast(city, start=None):
+    try:
+        with get_db_connection() as conn:
+            return _latest_forecast(conn, city, start)
+    except Exception as e:
+        logger.error(f"Error retrieving forecast for {city}: {e}")
+        return None, []
+
+# Each forecast is scored against the observation closest to its target
+# time within FORECAST_MATCH_WINDOW seconds. The join is an index range on
+# weather (city, dt) per forecast, so the cost grows with the number of
+# forecasts in range, not with the size of the weather table.
+FORECAST_MATCH_WINDOW = 1800
+
+def _forecast_error_query(city=None, start=None, end=None, bucket_hours=3):
+    clauses, params = [], []
+    if city:
+        clauses.append("f.city = ?")
+        params.append(city)
+    if start is not None:
+        clauses.append("f.target_dt >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append("f.target_dt <= ?")
+        params.append(end)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    bucket_hours = int(bucket_hours)
+    bucket = bucket_hours * 3600
+    sql = f"""
+        SELECT lead, COUNT(*) AS forecasts, COUNT(observed_temp) AS matched,
+               AVG(temp - observed_temp) AS bias,
+               AVG(ABS(temp - observed_temp)) AS mae,
+               AVG((temp - observed_temp) * (temp - observed_temp)) AS mse,
+               AVG(CASE WHEN observed_main IS NULL THEN NULL WHEN main = observed_main THEN 1.0 ELSE 0.0 END)
+                   AS condition_accuracy
+        FROM (
+            -- With a single MIN() aggregate, SQLite takes the bare
+            -- columns from the row holding the minimum: the nearest observation.
+            SELECT (f.target_dt - f.issued_at) / {bucket} * {bucket_hours} AS lead, f.temp, f.main,
+                   o.temp AS observed_temp, o.main AS observed_main, MIN(ABS(o.dt - f.target_dt))
+            FROM forecast f
+            LEFT JOIN weather o ON o.city = f.city AND o.dt BETWEEN f.target_dt - {FORECAST_MATCH_WINDOW}
+                                                               AND f.target_dt + {FORECAST_MATCH_WINDOW}
+            {where}
+            GROUP BY f.city, f.target_dt, f.issued_at
+        )
+        GROUP BY lead
+        ORDER BY lead
+    """
+    return sql, params
+
+def _round_or_none(value, digits=2):
+    return round(value, digits) if value is not None else None
+
+def _forecast_error_row(row):
+    return {
+        'lead_hours': row['lead'],
+        'forecasts': row['forecasts'],
+        'matched': row['matched'],
+        'bias': _round_or_none(row['bias']),
+        'mae': _round_or_none(row['mae']),
+        'rmse': _round_or_none(row['mse'] ** 0.5 if row['mse'] is not None else None),
+        'condition_accuracy': _round_or_none(row['condition_accuracy'], 3)
+    }
+
+@instrument("crud")
+def get_forecast_error(city=None, start=None, end=None, bucket_hours=3):
+    try:
+        sql, params = _forecast_error_query(city, start, end, bucket_hours)
+        with get_db_connection() as conn:
+            return [_forecast_error_row(row) for row in conn.execute(sql, params).fetchall()]
+    except Exception as e:
+        logger.error(f"Error computing forecast error: {e}")
         return []
 
-def save_daily_summary(daily_summary):
+@instrument("crud")
+def save_alert_rule(city, condition, temp_threshold):
     try:
-        logger.info(f"Attempting to save daily summary: {daily_summary}")
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            for summary in daily_summary:
-                cursor.execute("""
-                    INSERT INTO daily_summary (city, date, avg_temp, max_temp, min_temp, avg_humidity, avg_wind_speed, dominant_condition)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (summary['city'], summary['date'], summary['avg_temp'],
-                      summary['max_temp'], summary['min_temp'], summary['avg_humidity'], summary['avg_wind_speed'], summary['dominant_condition']))
+            conn.execute("""
+                INSERT OR IGNORE INTO alert_rules (city, condition, temp_threshold, created_at)
+                VALUES (?, ?, ?, strftime('%s', 'now'))
+            """, (city, condition, temp_threshold))
             conn.commit()
-            logger.info(f"Daily summary saved")
+        alert_rules.add(city, condition, temp_threshold)
+        logger.info(f"Alert rule saved for {city}: {condition} above {temp_threshold}")
+        return True
     except Exception as e:
-        logger.error(f"Error saving daily summary: {e}")
+        logger.error(f"Error saving alert rule: {e}")
+        return False
 
-def check_alert_thresholds(city, temp_threshold, condition):
+@instrument("crud")
+def load_alert_rules():
     try:
-        logger.info(f"Checking alert thresholds for city: {city} with condition: {condition} and threshold: {temp_threshold}")
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT city, temp, dt
-                FROM weather
-                WHERE temp > ? AND main = ? AND city = ?
-            ''', (temp_threshold, condition, city))
-            alerts = cursor.fetchall()
-            for alert in alerts:
-                alert_time = int(alert['dt'])
-                # Check if alert already exists
-                cursor.execute("""
-                    SELECT * FROM alerts
-                    WHERE city = ? AND condition = ? AND temp_threshold = ? AND alert_time = ?
-                """, (city, condition, temp_threshold, alert_time))
-                existing_alert = cursor.fetchone()
-                if not existing_alert:
-                    cursor.execute("""
-                        INSERT INTO alerts (city, condition, temp_threshold, alert_time)
-                        VALUES (?, ?, ?, ?)
-                    """, (city, condition, temp_threshold, alert_time))
+            cursor = conn.execute('SELECT id, city, condition, temp_threshold, created_at FROM alert_rules ORDER BY id')
+            return [dict(rule) for rule in cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"Error loading alert rules: {e}")
+        return []
+
+@instrument("crud")
+def delete_alert_rule(rule_id):
+    try:
+        with get_db_connection() as conn:
+            rule = conn.execute('SELECT city, condition, temp_threshold FROM alert_rules WHERE id = ?',
+                                (rule_id,)).fetchone()
+            if rule is None:
+                return False
+            conn.execute('DELETE FROM alert_rules WHERE id = ?', (rule_id,))
             conn.commit()
-            logger.info(f"Alerts checked and saved for city: {city} if any")
+        alert_rules.remove(rule['city'], rule['condition'], rule['temp_threshold'])
+        logger.info(f"Alert rule {rule_id} deleted")
+        return True
     except Exception as e:
-        logger.error(f"Error checking alert thresholds: {e}")
+        logger.error(f"Error deleting alert rule: {e}")
+        return False
 
+def _alerts_query(city=None, start=None, end=None, after_id=None):
+    clauses, params = [], []
+    if city:
+        clauses.append("city = ?")
+        params.append(city)
+    if start is not None:
+        clauses.append("CAST(alert_time AS INTEGER) >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append("CAST(alert_time AS INTEGER) <= ?")
+        params.append(end)
+    if after_id is not None:
+        clauses.append("id > ?")
+        params.append(after_id)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return f"SELECT * FROM alerts {where} ORDER BY id", params
 
-def fetch_alerts():
+@instrument("crud")
+def fetch_alerts(city=None, start=None, end=None, after_id=None, limit=None):
     try:
-        logger.info("Fetching alerts")
+        logger.info(f"Fetching alerts for city={city} from {start} to {end} after id {after_id}")
+        sql, params = _alerts_query(city, start, end, after_id)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM alerts')
+            cursor.execute(sql, params)
             alerts = cursor.fetchall()
-            logger.info(f"Alerts retrieved: {alerts}")
+            logger.info(f"Alerts retrieved: {len(alerts)}")
             return [dict(alert) for alert in alerts]
     except Exception as e:
         logger.error(f"Error fetching alerts: {e}")
         return []
-    
+
+def iter_alerts(city=None, start=None, end=None, after_id=None, batch_size=500):
+    sql, params = _alerts_query(city, start, end, after_id)
+    return _stream_rows(sql, params, dict, batch_size)
+
+@instrument("crud")
 def clear_all_alerts():
     try:
         logger.info("Clearing all alerts")
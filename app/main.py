@@ -1,7 +1,25 @@
-from fastapi import FastAPI, HTTPException
-from .scheduler import start_scheduler, fetch_weather_data
-from .crud import create_tables, get_daily_summary, check_alert_thresholds, save_weather_data, fetch_alerts, clear_all_alerts
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from typing import List
+from fastapi.responses import StreamingResponse, PlainTextResponse, Response
+from .scheduler import start_scheduler, fetch_weather_data_async
+from .crud import (create_tables, check_alert_thresholds, save_alert_rule, delete_alert_rule, iter_alerts,
+                   iter_daily_summary)
+from .pagination import decode_cursor, page, ndjson
+from . import analytics, registry, acrud, upstream, storage
+from .aiodb import pool
+from .writer import writer
+from .cache import weather_cache, city_key
+from .rolling import rolling_stats
+from .config import settings
+from . import metrics
+from .profiler import profiler
+from .coordination import coordinator
+from .responses import FastJSONResponse, conditional, not_modified, data_versions
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 import logging
+import math
 import time
 
 logger = logging.getLogger(__name__)
@@ -11,53 +29,256 @@ formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(messag
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
+app.add_middleware(GZipMiddleware, minimum_size=settings.gzip_minimum_size, compresslevel=settings.gzip_compress_level)
+app.add_middleware(metrics.MetricsMiddleware)
 
 create_tables()
 logger.info("Starting up the Weather Data Processing System")
-start_scheduler()
+scheduler = start_scheduler()
+
+@app.on_event("shutdown")
+async def shutdown():
+    scheduler.shutdown(wait=False)
+    coordinator.stop()
+    await upstream.aclose()
+    pool.close()
+    data_versions.close()
+    storage.close()
+    logger.info("Draining pending weather writes")
+    writer.close()
+
+# Routes that only wait on I/O are coroutines served from the event loop
+# through the async upstream client and the pooled SQLite connections; a
+# slow upstream fetch then holds no thread. Routes doing CPU-bound work
+# (analytics, metrics rendering) or rare writes stay plain functions and run
+# on the threadpool.
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Weather Data Processing System"}
 
 @app.get("/fetch-weather/{city}")
-def fetch_weather(city: str):
+async def fetch_weather(city: str):
     logger.info(f"Fetching weather data for city: {city}")
-    weather_data = fetch_weather_data(city)
-    if "Error" in weather_data:
-        raise HTTPException(status_code=500, detail=weather_data)
-    save_weather_data(weather_data)
+    # Cached per city; concurrent misses share one upstream fetch, which also
+    # queues the observation for storage exactly once.
+    weather_data = await weather_cache.get_or_load_async(city_key(city), lambda key: fetch_weather_data_async(city),
+                                                         cacheable=lambda data: isinstance(data, dict))
+    if not isinstance(weather_data, dict):
+        # Upstream trouble maps to a gateway status; 503s say when to retry.
+        headers = None
+        if weather_data.http_status == 503:
+            headers = {"Retry-After": str(max(1, math.ceil(weather_data.retry_after or 0)))}
+        raise HTTPException(status_code=weather_data.http_status,
+                            detail=f"Error fetching weather data for {city}: {weather_data}", headers=headers)
     return weather_data
 
+@app.get("/scheduler/status")
+async def scheduler_status():
+    return {"node_id": coordinator.node_id, "leader": coordinator.is_leader,
+            "sharding": coordinator.sharding, "nodes": coordinator.nodes}
+
+@app.get("/cities/")
+async def get_cities():
+    return {"cities": await acrud.list_cities()}
+
+@app.post("/cities/")
+def add_city(city: str):
+    city = city.strip()
+    if not city:
+        raise HTTPException(status_code=400, detail="city must not be empty")
+    if not registry.add_city(city):
+        raise HTTPException(status_code=409, detail=f"City already registered: {city}")
+    return {"status": "success", "message": f"{city} will be polled on the next scheduler tick"}
+
+@app.delete("/cities/{city}")
+def remove_city(city: str):
+    if not registry.remove_city(city):
+        raise HTTPException(status_code=404, detail="City not found")
+    return {"status": "success", "message": f"{city} removed from polling"}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return weather_cache.stats()
+
+@app.get("/metrics")
+def get_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.post("/profiler/start")
+def start_profiler(interval: Optional[float] = Query(None, gt=0, le=1)):
+    if not profiler.start(interval or settings.profiler_interval):
+        raise HTTPException(status_code=409, detail="Profiler is already running")
+    return {"status": "started", "interval": profiler.interval}
+
+@app.post("/profiler/stop")
+def stop_profiler():
+    if not profiler.stop():
+        raise HTTPException(status_code=409, detail="Profiler is not running")
+    return profiler.report()
+
+@app.get("/profiler")
+def profiler_report(limit: int = Query(20, ge=1, le=500),
+                    format: str = Query("json", pattern="^(json|collapsed)$")):
+    if format == "collapsed":
+        return PlainTextResponse(profiler.collapsed())
+    return profiler.report(limit)
+
+def _decode_cursor(cursor, size):
+    if cursor is None:
+        return None
+    try:
+        values = decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(values) != size:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
+    return values
+
+def _time_range(start, end):
+    end = end if end is not None else int(time.time())
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    return end
+
+# /weather-summary/ and /alerts/ carry an ETag and Last-Modified derived
+# from a data-version marker, so a client polling unchanged data gets an
+# empty 304 without the payload being queried or serialized again. Their
+# rows are plain dicts, so the response is built directly and skips
+# FastAPI's jsonable_encoder pass.
+
 @app.get("/weather-summary/")
-def weather_summary():
+async def weather_summary(request: Request, city: Optional[str] = None, start_date: Optional[str] = None,
+                          end_date: Optional[str] = None, days: Optional[int] = None,
+                          cursor: Optional[str] = None, limit: int = Query(1000, ge=1, le=10000),
+                          format: str = Query("json", pattern="^(json|ndjson)$")):
     logger.info("Fetching daily weather summary")
-    start_time = time.time()
-    summary = get_daily_summary()
-    elapsed_time = time.time() - start_time
-    logger.info(f"Fetched daily weather summary in {elapsed_time:.2f} seconds")
+    if days is not None:
+        if days < 1:
+            raise HTTPException(status_code=400, detail="days must be at least 1")
+        start_date = (datetime.now(timezone.utc).date() - timedelta(days=days - 1)).isoformat()
+    after = _decode_cursor(cursor, 2)
+    headers, unchanged = conditional(request, 'weather', start_date)
+    if unchanged:
+        return not_modified(headers)
+    if format == "ndjson":
+        return StreamingResponse(ndjson(iter_daily_summary(city, start_date, end_date, after)),
+                                 media_type="application/x-ndjson", headers=headers)
+    summary = await acrud.get_daily_summary(city, start_date, end_date, after, limit + 1)
+    summary, next_cursor, has_more = page(summary, limit, lambda row: [row['city'], row['date']], cursor)
     if not summary:
         logger.warning("No weather data found for summary")
-    return {"daily_summary": summary}
+    return FastJSONResponse({"daily_summary": summary, "next_cursor": next_cursor, "has_more": has_more},
+                            headers=headers)
+
+@app.get("/weather-series/{city}")
+async def weather_series(city: str, start: int, end: Optional[int] = None,
+                         resolution: Optional[str] = Query(None, pattern="^(raw|hourly|daily)$")):
+    end = _time_range(start, end)
+    return await acrud.get_weather_series(city, start, end, resolution)
+
+@app.get("/forecast/{city}")
+async def forecast(city: str):
+    issued_at, entries = await acrud.get_latest_forecast(city, int(time.time()))
+    if issued_at is None:
+        raise HTTPException(status_code=404, detail=f"No forecast stored for {city}")
+    return {"city": city, "issued_at": issued_at, "forecast": entries}
+
+@app.get("/forecast-error/")
+async def forecast_error(city: Optional[str] = None, start: Optional[int] = None, end: Optional[int] = None,
+                         bucket_hours: int = Query(3, ge=1, le=120)):
+    if start is not None and end is not None and end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    lead_times = await acrud.get_forecast_error(city, start, end, bucket_hours)
+    return {"city": city, "bucket_hours": bucket_hours, "lead_times": lead_times}
+
+@app.get("/analytics/stats")
+def analytics_stats(start: int, end: Optional[int] = None, cities: Optional[List[str]] = Query(None),
+                    percentiles: List[float] = Query([5, 50, 95])):
+    end = _time_range(start, end)
+    if any(p < 0 or p > 100 for p in percentiles):
+        raise HTTPException(status_code=400, detail="percentiles must be between 0 and 100")
+    try:
+        return {"stats": analytics.range_stats(cities, start, end, percentiles)}
+    except Exception as e:
+        logger.error(f"Error computing range statistics: {e}")
+        raise HTTPException(status_code=500, detail="Error computing range statistics")
+
+@app.get("/analytics/compare")
+def analytics_compare(start: int, end: Optional[int] = None, cities: Optional[List[str]] = Query(None),
+                      metric: str = Query("temp", pattern="^(temp|feels_like|humidity|wind_speed)$")):
+    end = _time_range(start, end)
+    try:
+        return analytics.compare_cities(cities, start, end, metric)
+    except Exception as e:
+        logger.error(f"Error comparing cities: {e}")
+        raise HTTPException(status_code=500, detail="Error comparing cities")
+
+@app.get("/analytics/rolling/{city}")
+def analytics_rolling(city: str, start: int, end: Optional[int] = None, window: int = Query(12, ge=1, le=10000)):
+    end = _time_range(start, end)
+    try:
+        return analytics.rolling_series(city, start, end, window)
+    except Exception as e:
+        logger.error(f"Error computing rolling mean: {e}")
+        raise HTTPException(status_code=500, detail="Error computing rolling mean")
+
+# Served from memory; at most one cheap incremental read of the weather
+# table every rolling_sync_interval seconds, hence a sync route.
+@app.get("/stats/rolling/{city}")
+def stats_rolling(city: str, window: Optional[str] = None):
+    if window is not None and window not in rolling_stats.windows:
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown window {window!r}, expected one of: {', '.join(rolling_stats.windows)}")
+    now = time.time()
+    stats = rolling_stats.get(city, now)
+    if stats is None:
+        raise HTTPException(status_code=404, detail=f"No recent observations for {city}")
+    windows = stats['windows'] if window is None else {window: stats['windows'][window]}
+    return {"city": city, "as_of": int(now), "latest": stats['latest'], "windows": windows}
 
 @app.post("/set-threshold/")
 def set_threshold(city: str, condition: str, temp_threshold: float):
     logger.info(f"Setting alert threshold for {city}: {condition} at {temp_threshold}°C")
+    if not save_alert_rule(city, condition, temp_threshold):
+        raise HTTPException(status_code=500, detail="Error saving alert rule")
+    # New observations are evaluated at ingest; this covers existing history once.
     check_alert_thresholds(city, temp_threshold, condition)
     return {"status": "Threshold set and checked"}
 
+@app.get("/alert-rules/")
+async def get_alert_rules():
+    return {"rules": await acrud.load_alert_rules()}
+
+@app.delete("/alert-rules/{rule_id}")
+def remove_alert_rule(rule_id: int):
+    if not delete_alert_rule(rule_id):
+        raise HTTPException(status_code=404, detail="Alert rule not found")
+    return {"status": "success", "message": f"Alert rule {rule_id} deleted"}
+
 @app.get("/alerts/")
-def get_alerts():
+async def get_alerts(request: Request, city: Optional[str] = None, start: Optional[int] = None,
+                     end: Optional[int] = None, cursor: Optional[str] = None, limit: int = Query(500, ge=1, le=10000),
+                     format: str = Query("json", pattern="^(json|ndjson)$")):
     logger.info("Fetching alerts")
-    alerts = fetch_alerts()
-    return {"alerts": alerts}
+    after = _decode_cursor(cursor, 1)
+    after_id = after[0] if after else None
+    headers, unchanged = conditional(request, 'alerts')
+    if unchanged:
+        return not_modified(headers)
+    if format == "ndjson":
+        return StreamingResponse(ndjson(iter_alerts(city, start, end, after_id)),
+                                 media_type="application/x-ndjson", headers=headers)
+    alerts = await acrud.fetch_alerts(city, start, end, after_id, limit + 1)
+    alerts, next_cursor, has_more = page(alerts, limit, lambda row: [row['id']], cursor)
+    return FastJSONResponse({"alerts": alerts, "next_cursor": next_cursor, "has_more": has_more}, headers=headers)
 
 @app.delete("/clear-alerts/")
-def clear_alerts():
+async def clear_alerts():
     try:
         logger.info("Clearing all alerts")
-        success = clear_all_alerts()
+        success = await acrud.clear_all_alerts()
         if not success:
             raise HTTPException(status_code=500, detail="Error clearing alerts")
         return {"status": "success", "message": "All alerts cleared"}
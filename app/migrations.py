@@ -0,0 +1,298 @@
+import logging
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Schema versions are tracked in PRAGMA user_version. Each migration runs in
+# its own transaction together with the version bump, so an interrupted
+# upgrade leaves the database at the last completed version. Migrations must
+# also be safe on databases created before versioning existed (version 0),
+# which may already contain some of the tables.
+
+def rebuild_daily_rollups(conn):
+    logger.info("Rebuilding daily rollups from weather history")
+    conn.execute("DELETE FROM daily_rollup")
+    conn.execute("DELETE FROM daily_condition")
+    conn.execute("""
+        INSERT INTO daily_rollup (city, date, temp_sum, temp_count, temp_min, temp_max, humidity_sum, wind_speed_sum)
+        SELECT city, date(dt, 'unixepoch'), SUM(temp), COUNT(*), MIN(temp), MAX(temp), SUM(humidity), SUM(wind_speed)
+        FROM weather
+        GROUP BY city, date(dt, 'unixepoch')
+    """)
+    conn.execute("""
+        INSERT INTO daily_condition (city, date, main, count)
+        SELECT city, date(dt, 'unixepoch'), main, COUNT(*)
+        FROM weather
+        GROUP BY city, date(dt, 'unixepoch'), main
+    """)
+
+def _base_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS weather (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            city TEXT NOT NULL,
+            main TEXT NOT NULL,
+            temp REAL NOT NULL,
+            feels_like REAL NOT NULL,
+            humidity INTEGER NOT NULL,
+            wind_speed REAL NOT NULL,
+            dt INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            city TEXT NOT NULL,
+            condition TEXT NOT NULL,
+            temp_threshold REAL NOT NULL,
+            alert_time TEXT NOT NULL
+        )
+    """)
+
+def _daily_rollups(conn):
+    # Daily rollups are maintained at ingest time by the trigger below,
+    # so summaries never have to rescan the weather table.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_rollup (
+            city TEXT NOT NULL,
+            date TEXT NOT NULL,
+            temp_sum REAL NOT NULL,
+            temp_count INTEGER NOT NULL,
+            temp_min REAL NOT NULL,
+            temp_max REAL NOT NULL,
+            humidity_sum REAL NOT NULL,
+            wind_speed_sum REAL NOT NULL,
+            PRIMARY KEY (city, date)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_daily_rollup_date ON daily_rollup (date)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_condition (
+            city TEXT NOT NULL,
+            date TEXT NOT NULL,
+            main TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (city, date, main)
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS weather_daily_rollup AFTER INSERT ON weather
+        BEGIN
+            INSERT INTO daily_rollup (city, date, temp_sum, temp_count, temp_min, temp_max, humidity_sum, wind_speed_sum)
+            VALUES (NEW.city, date(NEW.dt, 'unixepoch'), NEW.temp, 1, NEW.temp, NEW.temp, NEW.humidity, NEW.wind_speed)
+            ON CONFLICT (city, date) DO UPDATE SET
+                temp_sum = temp_sum + excluded.temp_sum,
+                temp_count = temp_count + 1,
+                temp_min = MIN(temp_min, excluded.temp_min),
+                temp_max = MAX(temp_max, excluded.temp_max),
+                humidity_sum = humidity_sum + excluded.humidity_sum,
+                wind_speed_sum = wind_speed_sum + excluded.wind_speed_sum;
+            INSERT INTO daily_condition (city, date, main, count)
+            VALUES (NEW.city, date(NEW.dt, 'unixepoch'), NEW.main, 1)
+            ON CONFLICT (city, date, main) DO UPDATE SET count = count + 1;
+        END
+    """)
+    rebuild_daily_rollups(conn)
+
+def _indexes_and_uniqueness(conn):
+    # Repeated forecast fetches stored the same (city, dt) many times; keep
+    # the first copy so the unique index can be built, then fix the rollups.
+    removed = conn.execute("""
+        DELETE FROM weather
+        WHERE id NOT IN (SELECT MIN(id) FROM weather GROUP BY city, dt)
+    """).rowcount
+    if removed:
+        logger.info(f"Removed {removed} duplicate weather rows")
+        rebuild_daily_rollups(conn)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_weather_city_dt ON weather (city, dt)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_weather_city_main_temp ON weather (city, main, temp)")
+    conn.execute("""
+        DELETE FROM alerts
+        WHERE id NOT IN (SELECT MIN(id) FROM alerts GROUP BY city, condition, temp_threshold, alert_time)
+    """)
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_alerts_unique
+        ON alerts (city, condition, temp_threshold, alert_time)
+    """)
+    # The append-only summary table is superseded by daily_rollup.
+    conn.execute("DROP TABLE IF EXISTS daily_summary")
+
+def _alert_rules(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS alert_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            city TEXT NOT NULL,
+            condition TEXT NOT NULL,
+            temp_threshold REAL NOT NULL,
+            created_at INTEGER NOT NULL,
+            UNIQUE (city, condition, temp_threshold)
+        )
+    """)
+
+def _alerts_city_index(conn):
+    # Secondary indexes carry the rowid, so (city) alone serves
+    # "WHERE city = ? AND id > ? ORDER BY id" keyset pages.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_alerts_city ON alerts (city)")
+
+def _hourly_tier(conn):
+    # Raw rows older than the retention window are folded into this table by
+    # app.retention before being deleted; the dt index serves that sweep.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS weather_hourly (
+            city TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            temp_sum REAL NOT NULL,
+            temp_count INTEGER NOT NULL,
+            temp_min REAL NOT NULL,
+            temp_max REAL NOT NULL,
+            feels_like_sum REAL NOT NULL,
+            humidity_sum REAL NOT NULL,
+            wind_speed_sum REAL NOT NULL,
+            PRIMARY KEY (city, hour)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_weather_dt ON weather (dt)")
+
+def _scheduler_coordination(conn):
+    # One row per named lease; the holder keeps it by renewing expires_at.
+    # Nodes heartbeat so sharded polling can see who is alive.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scheduler_lease (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scheduler_nodes (
+            node_id TEXT PRIMARY KEY,
+            started_at REAL NOT NULL,
+            heartbeat_at REAL NOT NULL
+        )
+    """)
+
+def _city_registry(conn):
+    # Polled cities and their adaptive schedule. Seeded with the cities the
+    # scheduler used to hardcode; all are due on the first tick.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cities (
+            name TEXT PRIMARY KEY COLLATE NOCASE,
+            added_at INTEGER NOT NULL,
+            poll_interval REAL NOT NULL,
+            next_poll_at REAL NOT NULL,
+            next_forecast_at REAL NOT NULL,
+            last_polled_at REAL,
+            last_temp REAL,
+            last_main TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cities_next_poll ON cities (next_poll_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cities_next_forecast ON cities (next_forecast_at)")
+    conn.executemany("""
+        INSERT OR IGNORE INTO cities (name, added_at, poll_interval, next_poll_at, next_forecast_at)
+        VALUES (?, strftime('%s', 'now'), 300, 0, 0)
+    """, [(city,) for city in ("Delhi", "Mumbai", "Chennai", "Bangalore", "Kolkata", "Hyderabad")])
+
+def _forecast_store(conn):
+    # Forecasts used to be written into weather next to real observations.
+    # Rows dated in the future can only be predictions, so they move here;
+    # older ones cannot be told apart from observations and stay.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS forecast (
+            city TEXT NOT NULL,
+            target_dt INTEGER NOT NULL,
+            issued_at INTEGER NOT NULL,
+            main TEXT NOT NULL,
+            temp REAL NOT NULL,
+            feels_like REAL NOT NULL,
+            humidity INTEGER NOT NULL,
+            wind_speed REAL NOT NULL,
+            PRIMARY KEY (city, target_dt, issued_at)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_forecast_target ON forecast (target_dt)")
+    conn.execute("""
+        INSERT OR IGNORE INTO forecast (city, target_dt, issued_at, main, temp, feels_like, humidity, wind_speed)
+        SELECT city, dt, CAST(strftime('%s', 'now') AS INTEGER), main, temp, feels_like, humidity, wind_speed
+        FROM weather
+        WHERE dt > CAST(strftime('%s', 'now') AS INTEGER)
+    """)
+    moved = conn.execute("DELETE FROM weather WHERE dt > CAST(strftime('%s', 'now') AS INTEGER)").rowcount
+    if moved:
+        logger.info(f"Moved {moved} forecast rows out of the weather table")
+        rebuild_daily_rollups(conn)
+
+def _backfill_checkpoints(conn):
+    # app.backfill records how far it got in each source file, committed
+    # with the rows, and the SQL of the weather indexes and triggers it
+    # dropped for the load so they can be recreated even after a crash.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS backfill_checkpoint (
+            source TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            records INTEGER NOT NULL,
+            offset INTEGER,
+            rows_inserted INTEGER NOT NULL,
+            done INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS backfill_deferred (
+            name TEXT PRIMARY KEY,
+            sql TEXT NOT NULL
+        )
+    """)
+
+MIGRATIONS = [
+    (1, "base schema", _base_schema),
+    (2, "daily rollups", _daily_rollups),
+    (3, "indexes and uniqueness constraints", _indexes_and_uniqueness),
+    (4, "persistent alert rules", _alert_rules),
+    (5, "alerts pagination index", _alerts_city_index),
+    (6, "hourly retention tier", _hourly_tier),
+    (7, "scheduler lease and node heartbeats", _scheduler_coordination),
+    (8, "city registry", _city_registry),
+    (9, "forecast store", _forecast_store),
+    (10, "backfill checkpoints", _backfill_checkpoints),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn, target=LATEST_VERSION):
+    current = get_schema_version(conn)
+    if current == 0 and conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0:
+        # Only takes effect before the first table exists; older files are
+        # converted by app.retention on its first run.
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        for version, name, apply in MIGRATIONS:
+            if version <= current or version > target:
+                continue
+            logger.info(f"Applying migration {version}: {name}")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have applied it while we waited for the lock.
+                if get_schema_version(conn) >= version:
+                    conn.execute("COMMIT")
+                    continue
+                apply(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    finally:
+        conn.isolation_level = isolation_level
+    return get_schema_version(conn)
@@ -0,0 +1,31 @@
+import base64
+import json
+
+# Opaque keyset cursors: the sort key of the last row on a page, encoded so
+# clients pass it back verbatim rather than building it themselves.
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if not isinstance(values, list):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return values
+
+def page(rows, limit, key, cursor=None):
+    # rows were fetched with limit + 1, so an extra row means there is more.
+    # The cursor always points after the last row returned (or stays where
+    # it was on an empty page), so clients can resume later for new rows.
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        cursor = encode_cursor(key(rows[-1]))
+    return rows, cursor, has_more
+
+def ndjson(rows):
+    for row in rows:
+        yield json.dumps(row) + "\n"
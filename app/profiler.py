@@ -0,0 +1,114 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+import logging
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Statistical profiler for a running server. While enabled, a background
+# thread snapshots every thread's stack through sys._current_frames() each
+# interval seconds; nothing is added to the profiled code paths, so the cost
+# is one stack walk per thread per sample and it can be left off by default.
+
+MAX_DEPTH = 64
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class SamplingProfiler:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.interval = None
+        self.samples = 0
+        self.started_at = None
+        self._self_counts = Counter()
+        self._total_counts = Counter()
+        self._stacks = Counter()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=0.01):
+        with self._lock:
+            if self.running:
+                return False
+            self.reset()
+            self.interval = interval
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"Sampling profiler started with interval {interval}s")
+        return True
+
+    def stop(self):
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return False
+            self._stop.set()
+            self._thread = None
+        thread.join()
+        logger.info(f"Sampling profiler stopped after {self.samples} samples")
+        return True
+
+    def reset(self):
+        self.samples = 0
+        self._self_counts = Counter()
+        self._total_counts = Counter()
+        self._stacks = Counter()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.sample(exclude=own)
+
+    def sample(self, exclude=None):
+        for ident, frame in sys._current_frames().items():
+            if ident == exclude:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if not stack:
+                continue
+            stack.reverse()
+            self._self_counts[stack[-1]] += 1
+            self._total_counts.update(set(stack))
+            self._stacks[";".join(stack)] += 1
+        self.samples += 1
+
+    def report(self, limit=20):
+        samples = self.samples or 1
+        def top(counts):
+            return [{'function': name, 'samples': count, 'percent': round(count * 100 / samples, 2)}
+                    for name, count in counts.most_common(limit)]
+        return {
+            'running': self.running,
+            'interval': self.interval,
+            'started_at': self.started_at,
+            'samples': self.samples,
+            'self': top(self._self_counts),
+            'cumulative': top(self._total_counts)
+        }
+
+    def collapsed(self):
+        # One "frame;frame;frame count" line per distinct stack, the input
+        # format of flamegraph.pl and speedscope.
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+profiler = SamplingProfiler()
@@ -0,0 +1,158 @@
+import random
+import time
+from .config import settings
+from .storage import get_db_connection
+from .metrics import instrument
+import logging
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# The cities table is both the list of polled cities and their schedule.
+# Each city carries its own next_poll_at, so polls are spread out by when
+# cities were added and last polled rather than firing together, and every
+# reschedule adds +/-JITTER of the interval so they never fall into step.
+# Stable cities drift towards poll_interval_max; a condition change or a
+# temperature move of poll_change_threshold pulls them back towards the min.
+
+JITTER = 0.1
+SLOWDOWN = 1.5
+SPEEDUP = 0.5
+
+def _jittered(interval):
+    return interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+def next_interval(interval, previous, current):
+    # previous and current are (temp, main) readings; previous is None for
+    # a city that has not been polled yet.
+    interval = min(max(interval, settings.poll_interval_min), settings.poll_interval_max)
+    if previous is None or previous[0] is None:
+        return interval
+    changed = previous[1] != current[1] or abs(current[0] - previous[0]) >= settings.poll_change_threshold
+    if changed:
+        return max(settings.poll_interval_min, interval * SPEEDUP)
+    return min(settings.poll_interval_max, interval * SLOWDOWN)
+
+def _city_row(row):
+    return {
+        'name': row['name'],
+        'added_at': row['added_at'],
+        'poll_interval': round(row['poll_interval'], 1),
+        'next_poll_at': round(row['next_poll_at'], 1),
+        'next_forecast_at': round(row['next_forecast_at'], 1),
+        'last_polled_at': row['last_polled_at'],
+        'last_temp': row['last_temp'],
+        'last_main': row['last_main']
+    }
+
+@instrument("registry")
+def add_city(name, now=None):
+    now = now or time.time()
+    try:
+        with get_db_connection() as conn:
+            # Due on the next tick; after that it keeps its own cadence.
+            cursor = conn.execute("""
+                INSERT OR IGNORE INTO cities (name, added_at, poll_interval, next_poll_at, next_forecast_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (name, int(now), settings.poll_interval, now, now))
+        if cursor.rowcount:
+            logger.info(f"Added city to registry: {name}")
+        return cursor.rowcount == 1
+    except Exception as e:
+        logger.error(f"Error adding city {name}: {e}")
+        return False
+
+@instrument("registry")
+def remove_city(name):
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.execute("DELETE FROM cities WHERE name = ?", (name,))
+        if cursor.rowcount:
+            logger.info(f"Removed city from registry: {name}")
+        return cursor.rowcount > 0
+    except Exception as e:
+        logger.error(f"Error removing city {name}: {e}")
+        return False
+
+@instrument("registry")
+def list_cities():
+    try:
+        with get_db_connection() as conn:
+            return [_city_row(row) for row in conn.execute("SELECT * FROM cities ORDER BY name")]
+    except Exception as e:
+        logger.error(f"Error listing cities: {e}")
+        return []
+
+def due_cities(column, now):
+    # Oldest first, so a backlog that exceeds the request budget is worked
+    # off in order instead of starving some cities.
+    if column not in ('next_poll_at', 'next_forecast_at'):
+        raise ValueError(f"Unknown schedule column: {column}")
+    try:
+        with get_db_connection() as conn:
+            return [row[0] for row in conn.execute(
+                f"SELECT name FROM cities WHERE {column} <= ? ORDER BY {column}", (now,))]
+    except Exception as e:
+        logger.error(f"Error reading due cities: {e}")
+        return []
+
+def count_due(now=None):
+    now = now or time.time()
+    with get_db_connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM cities WHERE next_poll_at <= ?", (now,)).fetchone()[0]
+
+@instrument("registry")
+def record_observations(results, now=None):
+    # results maps city to the fetch result: a weather dict on success or
+    # an upstream.UpstreamError, in which case the city keeps its interval.
+    now = now or time.time()
+    if not results:
+        return 0
+    try:
+        conn = get_db_connection()
+        try:
+            placeholders = ",".join("?" * len(results))
+            current = {row['name'].lower(): row for row in conn.execute(
+                f"SELECT name, poll_interval, last_temp, last_main FROM cities WHERE name IN ({placeholders})",
+                list(results))}
+            updates = []
+            for city, data in results.items():
+                row = current.get(city.lower())
+                if row is None:
+                    continue
+                if isinstance(data, dict):
+                    interval = next_interval(row['poll_interval'], (row['last_temp'], row['last_main']),
+                                             (data['temp'], data['main']))
+                    updates.append((interval, now + _jittered(interval), now, data['temp'], data['main'], row['name']))
+                else:
+                    interval = row['poll_interval']
+                    updates.append((interval, now + _jittered(interval), now, row['last_temp'], row['last_main'],
+                                    row['name']))
+            with conn:
+                conn.executemany("""
+                    UPDATE cities SET poll_interval = ?, next_poll_at = ?, last_polled_at = ?, last_temp = ?, last_main = ?
+                    WHERE name = ?
+                """, updates)
+        finally:
+            conn.close()
+        return len(updates)
+    except Exception as e:
+        logger.error(f"Error rescheduling {len(results)} cities: {e}")
+        return 0
+
+@instrument("registry")
+def record_forecasts(cities, now=None):
+    now = now or time.time()
+    try:
+        with get_db_connection() as conn:
+            conn.executemany("UPDATE cities SET next_forecast_at = ? WHERE name = ?",
+                             [(now + _jittered(settings.forecast_interval), city) for city in cities])
+        return len(cities)
+    except Exception as e:
+        logger.error(f"Error rescheduling forecasts for {len(cities)} cities: {e}")
+        return 0
@@ -0,0 +1,130 @@
+import hashlib
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi.responses import JSONResponse, Response
+from .config import settings
+from .storage import get_db_connection
+import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+if orjson is not None:
+    class FastJSONResponse(JSONResponse):
+        # orjson encodes large payloads several times faster than the json
+        # module; the analytics routes hand it numpy scalars as well.
+        def render(self, content):
+            return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+else:
+    FastJSONResponse = JSONResponse
+
+# Each cacheable resource has a marker that changes whenever its data does:
+# the AUTOINCREMENT sequence of the table it is built from, plus the row
+# count where rows are also deleted. Markers are only re-read after
+# PRAGMA data_version reports a commit from another connection, so checking
+# a conditional request costs one pragma on a connection kept open here and
+# no table reads.
+
+MARKERS = {
+    # Daily rollups only change through weather inserts (their trigger).
+    'weather': "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'weather'), 0)",
+    # Alerts are also cleared, which leaves the sequence where it was.
+    'alerts': "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'alerts'), 0), "
+              "(SELECT COUNT(*) FROM alerts)"
+}
+
+class DataVersions:
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = None
+        self._path = None
+        self._data_version = None
+        self._markers = {}
+        self._changed_at = {}
+
+    def _connection(self):
+        if self._conn is not None and self._path == settings.database_path:
+            return self._conn
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = get_db_connection(check_same_thread=False)
+        self._path = settings.database_path
+        self._data_version = None
+        self._markers = {}
+        return self._conn
+
+    def current(self, resource):
+        # Returns (marker, changed_at) for the resource; changed_at is when
+        # this process first saw the marker, used for Last-Modified.
+        with self._lock:
+            conn = self._connection()
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version or not self._markers:
+                now = self._clock()
+                for name, sql in MARKERS.items():
+                    marker = tuple(conn.execute(sql).fetchone())
+                    if self._markers.get(name) != marker:
+                        self._markers[name] = marker
+                        self._changed_at[name] = now
+                self._data_version = data_version
+            return self._markers[resource], self._changed_at[resource]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+            self._markers = {}
+
+data_versions = DataVersions()
+
+def make_etag(resource, marker, *variant):
+    # The payload also depends on the query, so that is part of the tag.
+    digest = hashlib.blake2b(repr((resource, marker, variant)).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+def _etag_matches(if_none_match, etag):
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+def _not_modified_since(if_modified_since, changed_at):
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return since is not None and int(changed_at) <= since.timestamp()
+
+def conditional(request, resource, *variant):
+    # Returns (headers, not_modified). If-None-Match takes precedence over
+    # If-Modified-Since, as in RFC 9110.
+    marker, changed_at = data_versions.current(resource)
+    headers = {
+        "ETag": make_etag(resource, marker, str(request.url.query), *variant),
+        "Last-Modified": formatdate(changed_at, usegmt=True),
+        "Cache-Control": "no-cache"
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return headers, _etag_matches(if_none_match, headers["ETag"])
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        return headers, _not_modified_since(if_modified_since, changed_at)
+    return headers, False
+
+def not_modified(headers):
+    return Response(status_code=304, headers=headers)
@@ -0,0 +1,155 @@
+import time
+from .config import settings
+from .storage import get_db_connection
+from .metrics import instrument
+import logging
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Three tiers of the weather time series:
+#   raw     - weather rows, kept for retention_raw_days
+#   hourly  - weather_hourly, folded from raw rows by compact(), kept for
+#             retention_hourly_days
+#   daily   - daily_rollup, maintained at ingest and kept forever
+HOUR = 3600
+DAY = 86400
+
+# A range is only served from a finer tier when it is short enough for that
+# tier to be worth its point count.
+RAW_MAX_SPAN = 2 * DAY
+HOURLY_MAX_SPAN = 60 * DAY
+
+def raw_cutoff(now):
+    # Aligned to the hour so a bucket is never split between raw and hourly.
+    cutoff = int(now - settings.retention_raw_days * DAY)
+    return cutoff - cutoff % HOUR
+
+def hourly_cutoff(now):
+    cutoff = int(now - settings.retention_hourly_days * DAY)
+    return cutoff - cutoff % DAY
+
+def _ensure_incremental_vacuum(conn):
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return
+    # Files created before auto_vacuum was enabled need one full VACUUM to
+    # switch modes; later runs only release free pages incrementally.
+    logger.info("Converting database to incremental auto_vacuum")
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+
+@instrument("retention")
+def compact(now=None):
+    now = now or time.time()
+    raw_before = raw_cutoff(now)
+    hourly_before = hourly_cutoff(now)
+    try:
+        logger.info(f"Compacting raw rows before {raw_before} and hourly rows before {hourly_before}")
+        conn = get_db_connection()
+        try:
+            with conn:
+                rolled_up = conn.execute("""
+                    INSERT INTO weather_hourly (city, hour, temp_sum, temp_count, temp_min, temp_max,
+                                                feels_like_sum, humidity_sum, wind_speed_sum)
+                    SELECT city, dt - dt % 3600, SUM(temp), COUNT(*), MIN(temp), MAX(temp),
+                           SUM(feels_like), SUM(humidity), SUM(wind_speed)
+                    FROM weather
+                    WHERE dt < ?
+                    GROUP BY city, dt - dt % 3600
+                    ON CONFLICT (city, hour) DO UPDATE SET
+                        temp_sum = temp_sum + excluded.temp_sum,
+                        temp_count = temp_count + excluded.temp_count,
+                        temp_min = MIN(temp_min, excluded.temp_min),
+                        temp_max = MAX(temp_max, excluded.temp_max),
+                        feels_like_sum = feels_like_sum + excluded.feels_like_sum,
+                        humidity_sum = humidity_sum + excluded.humidity_sum,
+                        wind_speed_sum = wind_speed_sum + excluded.wind_speed_sum
+                """, (raw_before,)).rowcount
+                raw_deleted = conn.execute("DELETE FROM weather WHERE dt < ?", (raw_before,)).rowcount
+                hourly_deleted = conn.execute("DELETE FROM weather_hourly WHERE hour < ?",
+                                              (hourly_before,)).rowcount
+                # Forecasts can only be scored against raw observations.
+                forecast_deleted = conn.execute("DELETE FROM forecast WHERE target_dt < ?",
+                                                (raw_before,)).rowcount
+            _ensure_incremental_vacuum(conn)
+            conn.execute(f"PRAGMA incremental_vacuum({settings.vacuum_pages_per_run})").fetchall()
+        finally:
+            conn.close()
+        result = {'hourly_upserted': rolled_up, 'raw_deleted': raw_deleted, 'hourly_deleted': hourly_deleted,
+                  'forecast_deleted': forecast_deleted}
+        logger.info(f"Compaction finished: {result}")
+        return result
+    except Exception as e:
+        logger.error(f"Error compacting weather data: {e}")
+        return None
+
+def choose_tier(start, end, now=None):
+    now = now or time.time()
+    span = end - start
+    if start >= raw_cutoff(now) and span <= RAW_MAX_SPAN:
+        return 'raw'
+    if start >= hourly_cutoff(now) and span <= HOURLY_MAX_SPAN:
+        return 'hourly'
+    return 'daily'
+
+_SERIES_QUERIES = {
+    # Each query yields (ts, count, temp_sum, temp_min, temp_max, humidity_sum, wind_speed_sum).
+    'raw': """
+        SELECT dt, 1, temp, temp, temp, humidity, wind_speed
+        FROM weather
+        WHERE city = ? AND dt BETWEEN ? AND ?
+        ORDER BY dt
+    """,
+    # Hours still held as raw rows are bucketed on the fly and merged with
+    # the compacted ones.
+    'hourly': """
+        SELECT hour, SUM(n), SUM(t), MIN(lo), MAX(hi), SUM(h), SUM(w)
+        FROM (
+            SELECT hour, temp_count AS n, temp_sum AS t, temp_min AS lo, temp_max AS hi,
+                   humidity_sum AS h, wind_speed_sum AS w
+            FROM weather_hourly
+            WHERE city = ?1 AND hour BETWEEN ?2 - ?2 % 3600 AND ?3
+            UNION ALL
+            SELECT dt - dt % 3600, 1, temp, temp, temp, humidity, wind_speed
+            FROM weather
+            WHERE city = ?1 AND dt BETWEEN ?2 - ?2 % 3600 AND ?3
+        )
+        GROUP BY hour
+        ORDER BY hour
+    """,
+    'daily': """
+        SELECT CAST(strftime('%s', date) AS INTEGER), temp_count, temp_sum, temp_min, temp_max,
+               humidity_sum, wind_speed_sum
+        FROM daily_rollup
+        WHERE city = ? AND date BETWEEN date(?, 'unixepoch') AND date(?, 'unixepoch')
+        ORDER BY date
+    """,
+}
+
+def _series_point(row):
+    return {
+        'ts': row[0],
+        'avg_temp': round(row[2] / row[1], 2),
+        'min_temp': round(row[3], 2),
+        'max_temp': round(row[4], 2),
+        'avg_humidity': round(row[5] / row[1], 2),
+        'avg_wind_speed': round(row[6] / row[1], 2),
+        'count': row[1]
+    }
+
+@instrument("retention")
+def get_weather_series(city, start, end, resolution=None, now=None):
+    tier = resolution or choose_tier(start, end, now)
+    try:
+        logger.info(f"Retrieving {tier} series for {city} from {start} to {end}")
+        with get_db_connection() as conn:
+            rows = conn.execute(_SERIES_QUERIES[tier], (city, start, end)).fetchall()
+        return {'city': city, 'resolution': tier, 'points': [_series_point(row) for row in rows]}
+    except Exception as e:
+        logger.error(f"Error retrieving weather series: {e}")
+        return {'city': city, 'resolution': tier, 'points': []}
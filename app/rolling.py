@@ -0,0 +1,231 @@
+import re
+import threading
+import time
+from array import array
+from collections import deque
+from .config import settings
+from .storage import get_db_connection
+from .cache import city_key
+from . import metrics
+import logging
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Sliding-window temperature statistics per city over the last few hours,
+# kept in memory so /stats/rolling/ never queries the weather table. Each
+# city holds its recent readings in array-backed ring buffers. Every
+# configured window keeps a running sum plus two monotonic deques of
+# buffer positions: temperatures decreasing from the front for the max,
+# increasing for the min. A reading is pushed once and popped at most once
+# from each, so updates and queries are O(1) amortized.
+#
+# The ingest path (crud.save_weather_data_batch) feeds readings as they are
+# committed. Rows written by other processes sharing the database are pulled
+# in by id at most every rolling_sync_interval seconds, and create_tables
+# rebuilds everything from the table at startup. Readings that are not newer
+# than a city's latest one are ignored.
+
+_DURATION = re.compile(r"^(\d+(?:\.\d+)?)([smhd]?)$")
+_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+def parse_windows(spec):
+    # "1h,3h,24h" -> {'1h': 3600, '3h': 10800, '24h': 86400}, smallest first.
+    windows = {}
+    for label in (part.strip() for part in spec.split(",")):
+        match = _DURATION.match(label)
+        if not match:
+            raise ValueError(f"Invalid rolling window: {label!r}")
+        windows[label] = float(match.group(1)) * _UNITS[match.group(2)]
+    return dict(sorted(windows.items(), key=lambda item: item[1]))
+
+class _Window:
+    __slots__ = ('seconds', 'start', 'total', 'maxima', 'minima')
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.start = 0
+        # Temperatures are stored rounded to 2 decimals, so the sum is kept
+        # in hundredths as an exact integer and never drifts.
+        self.total = 0
+        self.maxima = deque()
+        self.minima = deque()
+
+class CitySeries:
+    # The last `capacity` readings of one city. Readings are numbered in
+    # arrival order and reading n lives at position n % capacity; `first`
+    # is the oldest number still held and `end` the next one to assign.
+    __slots__ = ('capacity', 'dts', 'temps', 'first', 'end', 'windows')
+
+    def __init__(self, capacity, windows):
+        self.capacity = capacity
+        self.dts = array('q', bytes(8 * capacity))
+        self.temps = array('d', bytes(8 * capacity))
+        self.first = 0
+        self.end = 0
+        self.windows = [_Window(seconds) for seconds in windows]
+
+    def _drop_oldest(self, window):
+        seq = window.start
+        window.total -= round(self.temps[seq % self.capacity] * 100)
+        if window.maxima[0] == seq:
+            window.maxima.popleft()
+        if window.minima[0] == seq:
+            window.minima.popleft()
+        window.start += 1
+
+    def _expire(self, window, now):
+        cutoff = now - window.seconds
+        while window.start < self.end and self.dts[window.start % self.capacity] <= cutoff:
+            self._drop_oldest(window)
+
+    @property
+    def latest(self):
+        if self.end == self.first:
+            return None
+        position = (self.end - 1) % self.capacity
+        return self.dts[position], self.temps[position]
+
+    def append(self, dt, temp):
+        latest = self.latest
+        if latest is not None and dt <= latest[0]:
+            return False
+        if self.end - self.first == self.capacity:
+            # Full: the oldest reading leaves every window still holding it.
+            for window in self.windows:
+                if window.start == self.first:
+                    self._drop_oldest(window)
+            self.first += 1
+        seq = self.end
+        self.dts[seq % self.capacity] = dt
+        self.temps[seq % self.capacity] = temp
+        self.end += 1
+        hundredths = round(temp * 100)
+        temps, capacity = self.temps, self.capacity
+        for window in self.windows:
+            maxima, minima = window.maxima, window.minima
+            while maxima and temps[maxima[-1] % capacity] <= temp:
+                maxima.pop()
+            maxima.append(seq)
+            while minima and temps[minima[-1] % capacity] >= temp:
+                minima.pop()
+            minima.append(seq)
+            window.total += hundredths
+            self._expire(window, dt)
+        return True
+
+    def stats(self, now):
+        result = []
+        for window in self.windows:
+            self._expire(window, now)
+            count = self.end - window.start
+            if not count:
+                result.append({'count': 0, 'min': None, 'max': None, 'mean': None, 'since': None})
+                continue
+            result.append({
+                'count': count,
+                'min': self.temps[window.minima[0] % self.capacity],
+                'max': self.temps[window.maxima[0] % self.capacity],
+                'mean': round(window.total / count / 100, 2),
+                'since': self.dts[window.start % self.capacity]
+            })
+        return result
+
+class RollingStats:
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._configure()
+
+    def _configure(self):
+        self.windows = parse_windows(settings.rolling_windows)
+        self.capacity = settings.rolling_capacity
+        self._series = {}
+        self._database_path = settings.database_path
+        self._last_id = 0
+        self._synced_at = self._clock()
+
+    def __len__(self):
+        return len(self._series)
+
+    def _append(self, city, dt, temp):
+        series = self._series.get(city_key(city))
+        if series is None:
+            series = self._series[city_key(city)] = CitySeries(self.capacity, self.windows.values())
+        return series.append(dt, temp)
+
+    def add_many(self, rows):
+        # rows are weather params as stored: (city, main, temp, feels_like,
+        # humidity, wind_speed, dt).
+        with self._lock:
+            for row in rows:
+                self._append(row[0], int(row[6]), row[2])
+
+    def rebuild(self):
+        # Reloads the readings inside the largest window from the weather
+        # table, picking up window and capacity settings again.
+        with self._lock:
+            self._configure()
+            horizon = self._clock() - max(self.windows.values())
+            try:
+                conn = get_db_connection()
+                try:
+                    self._last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM weather").fetchone()[0]
+                    count = 0
+                    for city, dt, temp in conn.execute("""
+                        SELECT city, dt, temp FROM weather WHERE dt > ? AND id <= ? ORDER BY dt
+                    """, (horizon, self._last_id)):
+                        count += self._append(city, dt, temp)
+                finally:
+                    conn.close()
+                logger.info(f"Rolling stats rebuilt from {count} readings of {len(self._series)} cities")
+            except Exception as e:
+                logger.error(f"Error rebuilding rolling stats: {e}")
+
+    def _sync(self):
+        # Called with the lock held.
+        now = self._clock()
+        if now - self._synced_at < settings.rolling_sync_interval:
+            return
+        self._synced_at = now
+        try:
+            conn = get_db_connection()
+            try:
+                max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM weather").fetchone()[0]
+                rows = conn.execute("""
+                    SELECT city, dt, temp FROM weather WHERE id > ? AND id <= ? AND dt > ? ORDER BY id
+                """, (self._last_id, max_id, now - max(self.windows.values()))).fetchall()
+            finally:
+                conn.close()
+            self._last_id = max_id
+            for city, dt, temp in rows:
+                self._append(city, dt, temp)
+        except Exception as e:
+            logger.error(f"Error syncing rolling stats: {e}")
+
+    def get(self, city, now=None):
+        # Returns {'latest': ..., 'windows': {label: stats}} for the city, or
+        # None if it has no readings in the largest window.
+        if self._database_path != settings.database_path:
+            self.rebuild()
+        now = self._clock() if now is None else now
+        with self._lock:
+            self._sync()
+            series = self._series.get(city_key(city))
+            if series is None or series.latest is None:
+                return None
+            stats = series.stats(now)
+            if not stats[-1]['count']:
+                return None
+            dt, temp = series.latest
+            return {'latest': {'dt': dt, 'temp': temp}, 'windows': dict(zip(self.windows, stats))}
+
+rolling_stats = RollingStats()
+
+metrics.callback("weather_rolling_cities", "Cities tracked by the in-memory rolling stats.", lambda: len(rolling_stats))
@@ -1,8 +1,17 @@
+import time
+from datetime import datetime
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED
 from apscheduler.triggers.interval import IntervalTrigger
-import requests
 from .config import settings
-from .crud import save_weather_data
+from .writer import writer
+from .crud import save_forecasts
+from .cache import weather_cache, city_key
+from . import upstream, metrics
+from .metrics import instrument
+from .retention import compact
+from .coordination import coordinator
+from . import registry
 import logging
 
 # Setup logger
@@ -13,43 +22,63 @@ formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(messag
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
+def _weather_url(city):
+    return f"{settings.openweather_base_url}/weather?q={city}&appid={settings.openweather_api_key}"
+
+def parse_weather(city, data):
+    return {
+        'city': city,
+        'main': data['weather'][0]['main'],
+        'temp': data['main']['temp'] - 273.15,
+        'feels_like': data['main']['feels_like'] - 273.15,
+        'humidity': data['main']['humidity'],
+        'wind_speed': data['wind']['speed'],
+        'dt': data['dt']
+    }
+
 def fetch_weather_data(city: str):
+    # Returns the parsed reading, or the upstream.UpstreamError describing
+    # why there is none.
     logger.info(f"Started fetching weather data for city: {city}")
     try:
-        api_key = settings.openweather_api_key
-        url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}"
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        weather_data = {
-            'city': city,
-            'main': data['weather'][0]['main'],
-            'temp': data['main']['temp'] - 273.15,
-            'feels_like': data['main']['feels_like'] - 273.15,
-            'humidity': data['main']['humidity'],
-            'wind_speed': data['wind']['speed'],
-            'dt': data['dt']
-        }
+        data = upstream.get_json(_weather_url(city))
+        weather_data = parse_weather(city, data)
+        logger.info(f"Weather data fetched for {city}: {weather_data}")
+        writer.submit(weather_data)
+        return weather_data
+    except upstream.UpstreamError as e:
+        logger.error(f"Error fetching weather data for {city}: {e}")
+        return e
+    except Exception as e:
+        logger.error(f"Unexpected weather payload for {city}: {e}")
+        return upstream.UpstreamError("invalid", f"Unexpected payload: {e}")
+
+async def fetch_weather_data_async(city: str):
+    # Same as fetch_weather_data for the async request path; the scheduler
+    # keeps the threaded client.
+    logger.info(f"Started fetching weather data for city: {city}")
+    try:
+        data = await upstream.get_json_async(_weather_url(city))
+        weather_data = parse_weather(city, data)
         logger.info(f"Weather data fetched for {city}: {weather_data}")
-        save_weather_data(weather_data)
+        writer.submit(weather_data)
         return weather_data
-    except requests.exceptions.RequestException as e:
+    except upstream.UpstreamError as e:
         logger.error(f"Error fetching weather data for {city}: {e}")
-        return f"Error fetching weather data for {city}: {e}"
+        return e
     except Exception as e:
-        logger.error(f"Unexpected error: {e}")
-        return f"Unexpected error: {e}"
+        logger.error(f"Unexpected weather payload for {city}: {e}")
+        return upstream.UpstreamError("invalid", f"Unexpected payload: {e}")
 
 def fetch_weather_forecast(city: str):
     logger.info(f"Started fetching weather forecast data for city: {city}")
     try:
         api_key = settings.openweather_api_key
-        url = f"http://api.openweathermap.org/data/2.5/forecast?q={city}&appid={api_key}"
-        response = requests.get(url)
-        response.raise_for_status()
-        forecast_data = response.json()
+        url = f"{settings.openweather_base_url}/forecast?q={city}&appid={api_key}"
+        forecast_data = upstream.get_json(url)
+        rows = []
         for entry in forecast_data['list']:
-            weather_data = {
+            rows.append({
                 'city': city,
                 'main': entry['weather'][0]['main'],
                 'temp': entry['main']['temp'] - 273.15,
@@ -57,21 +86,86 @@ def fetch_weather_forecast(city: str):
                 'humidity': entry['main']['humidity'],
                 'wind_speed': entry['wind']['speed'],
                 'dt': entry['dt']
-            }
-            save_weather_data(weather_data)
+            })
+        # Forecasts live in their own table, keyed by the hour they were
+        # issued, so they never mix with observations.
+        now = int(time.time())
+        save_forecasts(rows, now - now % 3600)
         logger.info(f"Weather forecast data fetched for {city}")
         return forecast_data
-    except requests.exceptions.RequestException as e:
+    except upstream.UpstreamError as e:
         logger.error(f"Error fetching weather forecast data for {city}: {e}")
-        return f"Error fetching weather forecast data for {city}: {e}"
+        return e
     except Exception as e:
-        logger.error(f"Unexpected error: {e}")
-        return f"Unexpected error: {e}"
+        logger.error(f"Unexpected forecast payload for {city}: {e}")
+        return upstream.UpstreamError("invalid", f"Unexpected payload: {e}")
+
+@instrument("scheduler")
+def poll_weather(cities):
+    results = upstream.fetch_many(fetch_weather_data, coordinator.assigned(cities))
+    # Warm the /fetch-weather cache with what the round just fetched.
+    for city, weather_data in results.items():
+        if isinstance(weather_data, dict):
+            weather_cache.put(city_key(city), weather_data)
+    return results
+
+@instrument("scheduler")
+def poll_forecasts(cities):
+    return upstream.fetch_many(fetch_weather_forecast, coordinator.assigned(cities))
+
+def tick_budget():
+    return max(1, int(settings.upstream_requests_per_minute * settings.poll_tick_seconds / 60))
+
+@instrument("scheduler")
+def poll_due(now=None):
+    # Runs every poll_tick_seconds and polls the cities whose next_poll_at
+    # has passed, oldest first, spending at most this tick's share of the
+    # upstream request budget. Leftover budget goes to due forecasts.
+    now = now or time.time()
+    budget = tick_budget()
+    due = coordinator.assigned(registry.due_cities('next_poll_at', now))[:budget]
+    if due:
+        registry.record_observations(poll_weather(due), now)
+    budget -= len(due)
+    forecasts = coordinator.assigned(registry.due_cities('next_forecast_at', now))[:budget]
+    if forecasts:
+        poll_forecasts(forecasts)
+        registry.record_forecasts(forecasts, now)
+    return {'weather': len(due), 'forecasts': len(forecasts)}
+
+metrics.callback("weather_poll_due_cities", "Registry cities whose poll is due.", registry.count_due)
+
+def compact_if_leader():
+    if coordinator.is_leader:
+        return compact()
+
+JOB_LAG = metrics.histogram("weather_scheduler_job_lag_seconds",
+                            "Delay between a job's scheduled run time and its submission.", ("job",))
+JOB_EVENTS = metrics.counter("weather_scheduler_job_events_total",
+                             "Scheduler job runs by outcome (executed, error, missed).", ("job", "event"))
+
+_EVENT_NAMES = {EVENT_JOB_EXECUTED: "executed", EVENT_JOB_ERROR: "error", EVENT_JOB_MISSED: "missed"}
+
+def _job_listener(event):
+    if event.code == EVENT_JOB_SUBMITTED:
+        for run_time in event.scheduled_run_times:
+            lag = (datetime.now(run_time.tzinfo) - run_time).total_seconds()
+            JOB_LAG.labels(event.job_id).observe(max(lag, 0))
+        return
+    JOB_EVENTS.labels(event.job_id, _EVENT_NAMES[event.code]).inc()
+    if event.code == EVENT_JOB_MISSED:
+        logger.warning(f"Scheduler job {event.job_id} missed its run at {event.scheduled_run_time}")
 
 def start_scheduler():
+    # A single short tick job polls whichever registry cities are due, fanned
+    # out over the shared upstream pool. Every process schedules the jobs,
+    # and the coordinator decides which cities (if any) this process polls.
+    coordinator.start()
     scheduler = BackgroundScheduler()
-    cities = ["Delhi", "Mumbai", "Chennai", "Bangalore", "Kolkata", "Hyderabad"]
-    for city in cities:
-        scheduler.add_job(fetch_weather_data, 'interval', minutes=5, args=[city])
-        scheduler.add_job(fetch_weather_forecast, 'interval', hours=1, args=[city])
+    scheduler.add_listener(_job_listener, EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+    scheduler.add_job(poll_due, 'interval', id='poll_due', seconds=settings.poll_tick_seconds,
+                      max_instances=1, coalesce=True)
+    scheduler.add_job(compact_if_leader, 'interval', id='compact', minutes=settings.compaction_interval_minutes,
+                      max_instances=1, coalesce=True)
     scheduler.start()
+    return scheduler
@@ -0,0 +1,377 @@
+import os
+import sqlite3
+import threading
+from itertools import chain
+import numpy as np
+from .config import settings
+import logging
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Storage backends for weather observations and the analytical reads over
+# them: daily summaries and range scans. SQLite is the system of record and
+# also holds alerts, rules, forecasts and the scheduler tables. The DuckDB
+# backend is a columnar replica of the weather table, pulled from SQLite
+# incrementally by id before each read, so the write path is the same for
+# both and the replica can be deleted and rebuilt at any time.
+
+SCAN_COLUMNS = ('dt', 'temp', 'feels_like', 'humidity', 'wind_speed')
+
+def get_db_connection(check_same_thread=True):
+    conn = sqlite3.connect(settings.database_path, timeout=5.0, check_same_thread=check_same_thread)
+    conn.row_factory = sqlite3.Row
+    # In WAL mode (set once by migrate) synchronous=NORMAL stays
+    # corruption-safe and only fsyncs at checkpoints, not on every commit.
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+def _stream_rows(sql, params, convert, batch_size):
+    # Rows are pulled from the cursor batch by batch, so memory stays
+    # bounded by batch_size however large the result is. The generator may
+    # be resumed from different threads by the ASGI server.
+    conn = get_db_connection(check_same_thread=False)
+    try:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield convert(row)
+    except Exception as e:
+        logger.error(f"Error streaming rows: {e}")
+    finally:
+        conn.close()
+
+def _daily_summary_query(city=None, start_date=None, end_date=None, after=None):
+    clauses, params = [], []
+    if city:
+        clauses.append("r.city = ?")
+        params.append(city)
+    if start_date:
+        clauses.append("r.date >= ?")
+        params.append(start_date)
+    if end_date:
+        clauses.append("r.date <= ?")
+        params.append(end_date)
+    if after:
+        # Keyset pagination on the (city, date) primary key.
+        clauses.append("(r.city, r.date) > (?, ?)")
+        params.extend(after)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    sql = f'''
+        SELECT r.city, r.date,
+               r.temp_sum / r.temp_count AS avg_temp, r.temp_max AS max_temp, r.temp_min AS min_temp,
+               r.humidity_sum / r.temp_count AS avg_humidity,
+               r.wind_speed_sum / r.temp_count AS avg_wind_speed,
+               (SELECT c.main FROM daily_condition c
+                WHERE c.city = r.city AND c.date = r.date
+                ORDER BY c.count DESC, c.main LIMIT 1) AS dominant_condition
+        FROM daily_rollup r
+        {where}
+        ORDER BY r.city, r.date
+    '''
+    return sql, params
+
+def _round(value):
+    # Sums come out a few ulps apart depending on the order an engine adds
+    # them in; dropping that noise first keeps halfway cases rounding the
+    # same on every backend.
+    return round(round(value, 9), 2)
+
+def _summary_row(row):
+    return {
+        'city': row[0],
+        'date': row[1],
+        'avg_temp': _round(row[2]),
+        'max_temp': _round(row[3]),
+        'min_temp': _round(row[4]),
+        'avg_humidity': _round(row[5]),
+        'avg_wind_speed': _round(row[6]),
+        'dominant_condition': row[7]
+    }
+
+def _columns(flat):
+    table = flat.reshape(-1, len(SCAN_COLUMNS))
+    return {name: table[:, i] for i, name in enumerate(SCAN_COLUMNS)}
+
+class StorageBackend:
+    name = None
+
+    def save_weather(self, params):
+        # params are (city, main, temp, feels_like, humidity, wind_speed, dt)
+        # tuples; a repeated (city, dt) is ignored.
+        raise NotImplementedError
+
+    def daily_summary(self, city=None, start_date=None, end_date=None, after=None, limit=None):
+        raise NotImplementedError
+
+    def iter_daily_summary(self, city=None, start_date=None, end_date=None, after=None, batch_size=500):
+        raise NotImplementedError
+
+    def scan(self, cities, start, end):
+        # Returns {city: {column: array}} for SCAN_COLUMNS, ordered by dt;
+        # cities=None scans every city.
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class SQLiteStorage(StorageBackend):
+    name = 'sqlite'
+
+    def save_weather(self, params, conn=None):
+        # Callers that also write alerts pass their connection so both
+        # land in one transaction.
+        sql = """
+            INSERT OR IGNORE INTO weather (city, main, temp, feels_like, humidity, wind_speed, dt)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """
+        if conn is not None:
+            conn.executemany(sql, params)
+            return len(params)
+        with get_db_connection() as conn:
+            conn.executemany(sql, params)
+        return len(params)
+
+    def daily_summary(self, city=None, start_date=None, end_date=None, after=None, limit=None):
+        sql, params = _daily_summary_query(city, start_date, end_date, after)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with get_db_connection() as conn:
+            return [_summary_row(row) for row in conn.execute(sql, params)]
+
+    def iter_daily_summary(self, city=None, start_date=None, end_date=None, after=None, batch_size=500):
+        sql, params = _daily_summary_query(city, start_date, end_date, after)
+        return _stream_rows(sql, params, _summary_row, batch_size)
+
+    def scan(self, cities, start, end):
+        with get_db_connection() as conn:
+            cities = cities or [row[0] for row in conn.execute(
+                "SELECT DISTINCT city FROM daily_rollup ORDER BY city")]
+            result = {}
+            for city in cities:
+                cursor = conn.execute("""
+                    SELECT dt, temp, feels_like, humidity, wind_speed
+                    FROM weather
+                    WHERE city = ? AND dt BETWEEN ? AND ?
+                    ORDER BY dt
+                """, (city, start, end))
+                result[city] = _columns(np.fromiter(chain.from_iterable(cursor), dtype=np.float64))
+        return result
+
+# epoch_ms() gives a timezone-naive timestamp, so days are UTC like
+# SQLite's date(dt, 'unixepoch'). Conditions are counted per day first so
+# the dominant one is picked with the same tie-break as daily_condition.
+DUCKDB_SUMMARY = """
+    WITH observations AS (
+        SELECT city, CAST(CAST(epoch_ms(dt * 1000) AS DATE) AS VARCHAR) AS date,
+               main, temp, humidity, wind_speed
+        FROM weather
+    ), per_condition AS (
+        SELECT city, date, main, COUNT(*) AS n, SUM(temp) AS temp_sum, MAX(temp) AS temp_max,
+               MIN(temp) AS temp_min, SUM(humidity) AS humidity_sum, SUM(wind_speed) AS wind_speed_sum
+        FROM observations
+        {where}
+        GROUP BY city, date, main
+    )
+    SELECT city, date, SUM(temp_sum) / SUM(n), MAX(temp_max), MIN(temp_min),
+           SUM(humidity_sum) / SUM(n), SUM(wind_speed_sum) / SUM(n),
+           first(main ORDER BY n DESC, main)
+    FROM per_condition
+    GROUP BY city, date
+    ORDER BY city, date
+"""
+
+class DuckDBStorage(StorageBackend):
+    name = 'duckdb'
+
+    def __init__(self, path, replicate=False):
+        # With replicate, every read first pulls new rows from the SQLite
+        # weather table; otherwise rows only arrive through save_weather.
+        if duckdb is None:
+            raise RuntimeError("STORAGE_BACKEND=duckdb needs the duckdb package")
+        self.path = path
+        self.replicate = replicate
+        self._lock = threading.Lock()
+        self._conn = duckdb.connect(path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS weather (
+                city VARCHAR NOT NULL,
+                main VARCHAR NOT NULL,
+                temp DOUBLE NOT NULL,
+                feels_like DOUBLE NOT NULL,
+                humidity INTEGER NOT NULL,
+                wind_speed DOUBLE NOT NULL,
+                dt BIGINT NOT NULL
+            )
+        """)
+        # High-water mark of the SQLite weather ids already copied.
+        self._conn.execute("CREATE TABLE IF NOT EXISTS replica_state (last_id BIGINT NOT NULL)")
+        if self._conn.execute("SELECT COUNT(*) FROM replica_state").fetchone()[0] == 0:
+            self._conn.execute("INSERT INTO replica_state VALUES (0)")
+
+    def _append(self, params, dedupe=True):
+        # Rows go in as one columnar batch; row-at-a-time inserts are
+        # orders of magnitude slower in DuckDB. With dedupe, keys already
+        # stored or repeated within the batch are skipped like SQLite's OR
+        # IGNORE; rows copied from SQLite are unique already.
+        columns = list(zip(*params))
+        batch = {name: np.array(values, dtype=str if name in ('city', 'main') else None)
+                 for name, values in zip(('city', 'main', 'temp', 'feels_like', 'humidity', 'wind_speed', 'dt'),
+                                         columns)}
+        self._conn.register('batch', batch)
+        try:
+            if not dedupe:
+                self._conn.execute("INSERT INTO weather SELECT city, main, temp, feels_like, humidity, "
+                                   "wind_speed, dt FROM batch")
+                return
+            # Only stored rows in the batch's time range can collide, and
+            # DuckDB's zone maps skip the rest of the table.
+            self._conn.execute("""
+                INSERT INTO weather
+                SELECT b.city, b.main, b.temp, b.feels_like, b.humidity, b.wind_speed, b.dt
+                FROM (SELECT *, row_number() OVER () AS position FROM batch) b
+                ANTI JOIN (SELECT city, dt FROM weather WHERE dt BETWEEN ? AND ?) w
+                    ON w.city = b.city AND w.dt = b.dt
+                QUALIFY row_number() OVER (PARTITION BY b.city, b.dt ORDER BY b.position) = 1
+            """, (int(batch['dt'].min()), int(batch['dt'].max())))
+        finally:
+            self._conn.unregister('batch')
+
+    def save_weather(self, params):
+        if not params:
+            return 0
+        with self._lock:
+            self._append(params)
+        return len(params)
+
+    def sync(self, batch_size=100000):
+        # Copies SQLite weather rows added since the last sync.
+        if not self.replicate:
+            return 0
+        with self._lock:
+            last_id = self._conn.execute("SELECT last_id FROM replica_state").fetchone()[0]
+            copied = 0
+            with get_db_connection() as conn:
+                while True:
+                    rows = conn.execute("""
+                        SELECT id, city, main, temp, feels_like, humidity, wind_speed, dt
+                        FROM weather WHERE id > ? ORDER BY id LIMIT ?
+                    """, (last_id, batch_size)).fetchall()
+                    if not rows:
+                        break
+                    self._append([tuple(row[1:]) for row in rows], dedupe=False)
+                    last_id = rows[-1][0]
+                    self._conn.execute("UPDATE replica_state SET last_id = ?", (last_id,))
+                    copied += len(rows)
+            if copied:
+                logger.info(f"Copied {copied} weather rows into the DuckDB replica")
+            return copied
+
+    def _summary_sql(self, city, start_date, end_date, after, limit):
+        clauses, params = [], []
+        if city:
+            clauses.append("city = ?")
+            params.append(city)
+        if start_date:
+            clauses.append("date >= ?")
+            params.append(start_date)
+        if end_date:
+            clauses.append("date <= ?")
+            params.append(end_date)
+        if after:
+            clauses.append("(city > ? OR (city = ? AND date > ?))")
+            params.extend([after[0], after[0], after[1]])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = DUCKDB_SUMMARY.format(where=where)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return sql, params
+
+    def daily_summary(self, city=None, start_date=None, end_date=None, after=None, limit=None):
+        self.sync()
+        sql, params = self._summary_sql(city, start_date, end_date, after, limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [_summary_row(row) for row in rows]
+
+    def iter_daily_summary(self, city=None, start_date=None, end_date=None, after=None, batch_size=500):
+        # The aggregated result is one row per city and day, small enough
+        # to materialize before streaming it out.
+        yield from self.daily_summary(city, start_date, end_date, after)
+
+    def scan(self, cities, start, end):
+        self.sync()
+        with self._lock:
+            if not cities:
+                cities = [row[0] for row in self._conn.execute(
+                    "SELECT DISTINCT city FROM weather ORDER BY city").fetchall()]
+            placeholders = ",".join("?" * len(cities))
+            columns = self._conn.execute(f"""
+                SELECT city, dt, temp, feels_like, humidity, wind_speed
+                FROM weather
+                WHERE city IN ({placeholders}) AND dt BETWEEN ? AND ?
+                ORDER BY city, dt
+            """, list(cities) + [start, end]).fetchnumpy()
+        # Rows come back grouped by city; split the columns at the boundaries.
+        city_column = np.asarray(columns['city'], dtype=object)
+        bounds = np.flatnonzero(city_column[1:] != city_column[:-1]) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(city_column)]))
+        empty = {name: np.empty(0) for name in SCAN_COLUMNS}
+        result = {city: empty for city in cities}
+        for lo, hi in zip(starts, ends):
+            if hi > lo:
+                result[city_column[lo]] = {name: np.asarray(columns[name][lo:hi], dtype=np.float64)
+                                           for name in SCAN_COLUMNS}
+        return result
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+BACKENDS = {'sqlite': SQLiteStorage, 'duckdb': DuckDBStorage}
+
+_lock = threading.Lock()
+_storage = None
+
+def duckdb_path():
+    return settings.duckdb_path or os.path.splitext(settings.database_path)[0] + ".duckdb"
+
+def get_storage():
+    # One backend per process, reopened if the configured backend or
+    # database path changes (as the tests do).
+    global _storage
+    name = settings.storage_backend
+    key = (name, settings.database_path)
+    with _lock:
+        if _storage is None or _storage[0] != key:
+            if name not in BACKENDS:
+                raise ValueError(f"Unknown storage backend: {name}")
+            if _storage is not None:
+                _storage[1].close()
+            backend = SQLiteStorage() if name == 'sqlite' else DuckDBStorage(duckdb_path(), replicate=True)
+            _storage = (key, backend)
+        return _storage[1]
+
+def close():
+    global _storage
+    with _lock:
+        if _storage is not None:
+            _storage[1].close()
+        _storage = None
@@ -0,0 +1,404 @@
+import asyncio
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from .config import settings
+from . import metrics
+import logging
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+REQUEST_DURATION = metrics.histogram("weather_upstream_request_duration_seconds",
+                                     "Upstream request latency by endpoint.", ("endpoint",))
+REQUESTS = metrics.counter("weather_upstream_requests_total",
+                           "Upstream requests by endpoint and outcome.", ("endpoint", "outcome"))
+RETRIES = metrics.counter("weather_upstream_retries_total",
+                          "Upstream requests retried after a transient failure, by endpoint.", ("endpoint",))
+
+_lock = threading.Lock()
+_session = None
+_executor = None
+_async_client = None
+_breakers = {}
+_rate_limiter = None
+
+class UpstreamError(Exception):
+    # Structured failure of an upstream call. kind is one of timeout,
+    # connection, http, not_found, invalid, rate_limited (our own request
+    # budget is spent) or circuit_open (the host is failing and calls are
+    # short-circuited until the breaker lets a probe through).
+
+    def __init__(self, kind, message, status=None, attempts=1, retry_after=None):
+        super().__init__(message)
+        self.kind = kind
+        self.status = status
+        self.attempts = attempts
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        if self.kind in ("timeout", "connection"):
+            return True
+        return self.kind == "http" and (self.status == 429 or self.status >= 500)
+
+    @property
+    def http_status(self):
+        # What our own API answers when it cannot serve the request. Anything
+        # that says when to try again is passed on as 503 with Retry-After.
+        if self.kind == "not_found":
+            return 404
+        if self.kind in ("rate_limited", "circuit_open") or self.retry_after is not None:
+            return 503
+        if self.kind == "timeout":
+            return 504
+        return 502
+
+def _retry_after(value):
+    # Retry-After is either delta-seconds or an HTTP date.
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _http_error(status, retry_after, message):
+    kind = "not_found" if status == 404 else "http"
+    return UpstreamError(kind, message, status=status, retry_after=_retry_after(retry_after))
+
+class TokenBucket:
+    # Refills at rate tokens per second up to capacity. reserve() takes a
+    # token even when none is left, so concurrent callers queue up behind
+    # each other, and returns how long the caller has to wait before using it.
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = float(capacity)
+        self._updated = clock()
+
+    def reserve(self, max_wait=None):
+        # Returns None, without taking a token, if the wait would exceed max_wait.
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+class CircuitBreaker:
+    # closed: calls go through and consecutive failures are counted.
+    # open: calls fail fast until reset_timeout has passed.
+    # half_open: one probe call goes through; its outcome closes the
+    # breaker again or reopens it for another reset_timeout.
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and self._clock() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def retry_after(self):
+        with self._lock:
+            return max(0.0, self._opened_at + self.reset_timeout - self._clock())
+
+    def release(self):
+        # Gives back a probe slot that allow() handed out but was never used.
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"Circuit opened after {self.failures} consecutive upstream failures")
+                self.state = "open"
+                self._opened_at = self._clock()
+                self._probing = False
+
+def get_breaker(host):
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.setdefault(host, CircuitBreaker(settings.circuit_failure_threshold,
+                                                                settings.circuit_reset_timeout))
+    return breaker
+
+def get_rate_limiter():
+    # Shared by the threaded and async clients, since both spend the same
+    # quota; rebuilt when the budget settings change.
+    global _rate_limiter
+    rate = settings.upstream_requests_per_minute / 60
+    limiter = _rate_limiter
+    if limiter is None or limiter.rate != rate or limiter.capacity != settings.upstream_burst:
+        with _lock:
+            limiter = _rate_limiter = TokenBucket(rate, settings.upstream_burst)
+    return limiter
+
+_BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+metrics.callback("weather_upstream_circuit_state", "Circuit breaker per upstream host: 0 closed, 1 half-open, 2 open.",
+                 lambda: {(host,): _BREAKER_STATES[breaker.state] for host, breaker in list(_breakers.items())},
+                 ("host",))
+
+def _pending_fetches():
+    executor = _executor
+    return executor._work_queue.qsize() if executor is not None else 0
+
+metrics.callback("weather_upstream_pending_fetches", "Fetches queued for the upstream worker pool.",
+                 _pending_fetches)
+
+def get_session():
+    # One keep-alive pool shared by every fetch; sized so that each worker
+    # thread can hold its own connection to the upstream host.
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.fetch_concurrency)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.fetch_concurrency,
+                                               thread_name_prefix="upstream")
+    return _executor
+
+def _admit(url, endpoint, attempt):
+    # Checks the host's breaker and takes a token from the request budget
+    # before every attempt, retries included. Returns the breaker and how
+    # long to wait for the token.
+    host = urlsplit(url).netloc
+    breaker = get_breaker(host)
+    if not breaker.allow():
+        REQUESTS.labels(endpoint, "circuit_open").inc()
+        raise UpstreamError("circuit_open", f"Circuit open for {host}", attempts=attempt,
+                            retry_after=breaker.retry_after())
+    if not settings.upstream_rate_limit:
+        return breaker, 0.0
+    wait = get_rate_limiter().reserve(settings.rate_limit_max_wait)
+    if wait is None:
+        breaker.release()
+        REQUESTS.labels(endpoint, "rate_limited").inc()
+        raise UpstreamError("rate_limited", "Upstream request budget exhausted", attempts=attempt,
+                            retry_after=settings.rate_limit_max_wait)
+    return breaker, wait
+
+def _backoff(error, attempt):
+    # Full-jitter exponential backoff, or None when the failure should not
+    # be retried. A Retry-After longer than the backoff cap gives up rather
+    # than hold a worker that long.
+    if not error.retryable or attempt > settings.fetch_retries:
+        return None
+    delay = random.uniform(0, min(settings.fetch_backoff_max, settings.fetch_backoff_base * 2 ** (attempt - 1)))
+    if error.retry_after is not None:
+        if error.retry_after > settings.fetch_backoff_max:
+            return None
+        delay = max(delay, error.retry_after)
+    return delay
+
+def _after_failure(breaker, error, endpoint, attempt):
+    # Records the failure with the breaker and returns the backoff before
+    # the next attempt, or None to give up. Only failures that say the host
+    # is unwell count against it: a 404 or a bad payload still means it
+    # answered.
+    if error.retryable:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    error.attempts = attempt
+    delay = _backoff(error, attempt)
+    if delay is not None:
+        RETRIES.labels(endpoint).inc()
+        logger.warning(f"Retrying {endpoint} in {delay:.2f}s after attempt {attempt}: {error}")
+    return delay
+
+def _get_json_once(url, endpoint):
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        response = get_session().get(url, timeout=(settings.fetch_connect_timeout, settings.fetch_read_timeout))
+        outcome = str(response.status_code)
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.HTTPError as e:
+        raise _http_error(e.response.status_code, e.response.headers.get("Retry-After"), str(e)) from e
+    except requests.exceptions.Timeout as e:
+        raise UpstreamError("timeout", str(e)) from e
+    except ValueError as e:
+        # Includes requests' JSONDecodeError and InvalidURL.
+        raise UpstreamError("invalid", str(e)) from e
+    except requests.exceptions.RequestException as e:
+        raise UpstreamError("connection", str(e)) from e
+    finally:
+        REQUEST_DURATION.labels(endpoint).observe(time.perf_counter() - start)
+        REQUESTS.labels(endpoint, outcome).inc()
+
+def get_json(url: str):
+    # Raises UpstreamError once retries are exhausted or the failure is not
+    # worth retrying.
+    endpoint = urlsplit(url).path.rsplit("/", 1)[-1]
+    attempt = 1
+    while True:
+        breaker, wait = _admit(url, endpoint, attempt)
+        try:
+            if wait:
+                time.sleep(wait)
+            data = _get_json_once(url, endpoint)
+        except UpstreamError as e:
+            delay = _after_failure(breaker, e, endpoint, attempt)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+        except BaseException:
+            # Cancelled or failed unexpectedly; do not hold a half-open probe.
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+            return data
+
+def get_async_client():
+    # Used by the async request path. An httpx pool belongs to the event
+    # loop that created it, so a new loop gets new clients. Connections are
+    # split over async_fetch_clients smaller pools handed out round-robin:
+    # httpcore scans every connection of a pool on each request, which with
+    # hundreds of connections in one pool costs more than the requests.
+    global _async_client
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client[0] is not loop:
+        per_client = max(1, settings.async_fetch_max_connections // settings.async_fetch_clients)
+        # Loading the CA bundle dominates client construction; build it once.
+        ssl_context = httpx.create_ssl_context()
+        clients = [httpx.AsyncClient(
+            verify=ssl_context,
+            limits=httpx.Limits(max_connections=per_client, max_keepalive_connections=per_client),
+            timeout=httpx.Timeout(settings.fetch_read_timeout, connect=settings.fetch_connect_timeout, pool=None))
+            for _ in range(settings.async_fetch_clients)]
+        _async_client = (loop, clients, itertools.cycle(clients))
+    return next(_async_client[2])
+
+async def _get_json_once_async(url, endpoint):
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        response = await get_async_client().get(url)
+        outcome = str(response.status_code)
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPStatusError as e:
+        raise _http_error(e.response.status_code, e.response.headers.get("Retry-After"), str(e)) from e
+    except httpx.TimeoutException as e:
+        raise UpstreamError("timeout", str(e) or type(e).__name__) from e
+    except httpx.HTTPError as e:
+        raise UpstreamError("connection", str(e) or type(e).__name__) from e
+    except ValueError as e:
+        raise UpstreamError("invalid", str(e)) from e
+    finally:
+        REQUEST_DURATION.labels(endpoint).observe(time.perf_counter() - start)
+        REQUESTS.labels(endpoint, outcome).inc()
+
+async def get_json_async(url: str):
+    # Same retry, breaker and budget handling as get_json.
+    endpoint = urlsplit(url).path.rsplit("/", 1)[-1]
+    attempt = 1
+    while True:
+        breaker, wait = _admit(url, endpoint, attempt)
+        try:
+            if wait:
+                await asyncio.sleep(wait)
+            data = await _get_json_once_async(url, endpoint)
+        except UpstreamError as e:
+            delay = _after_failure(breaker, e, endpoint, attempt)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+        except BaseException:
+            # Cancelled or failed unexpectedly; do not hold a half-open probe.
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+            return data
+
+async def aclose():
+    global _async_client
+    if _async_client is not None and _async_client[0] is asyncio.get_running_loop():
+        await asyncio.gather(*[client.aclose() for client in _async_client[1]])
+    _async_client = None
+
+def fetch_many(fetch, cities):
+    # Runs fetch(city) for every city on the shared pool, so a polling round
+    # takes roughly len(cities) / fetch_concurrency request latencies.
+    cities = list(cities)
+    if not cities:
+        return {}
+    results = dict(zip(cities, get_executor().map(fetch, cities)))
+    logger.info(f"Fetched {len(results)} cities with concurrency {settings.fetch_concurrency}")
+    return results
+
+def close():
+    global _session, _executor, _rate_limiter
+    with _lock:
+        _breakers.clear()
+        _rate_limiter = None
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+        if _session is not None:
+            _session.close()
+            _session = None
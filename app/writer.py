@@ -0,0 +1,118 @@
+import atexit
+import queue
+import threading
+import time
+from .config import settings
+from .crud import save_weather_data_batch
+from . import metrics
+import logging
+
+# Setup logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+_STOP = object()
+
+class _FlushRequest:
+    def __init__(self):
+        self.done = threading.Event()
+
+class WeatherWriter:
+    # Queues observations and writes them from a single background thread,
+    # one executemany transaction per batch. A batch is flushed when it
+    # reaches batch_size rows or when its oldest row is flush_interval old.
+
+    def __init__(self, batch_size=None, flush_interval=None, queue_size=None):
+        self.batch_size = batch_size or settings.write_batch_size
+        self.flush_interval = flush_interval if flush_interval is not None else settings.write_flush_interval
+        self._queue = queue.Queue(maxsize=queue_size or settings.write_queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.batches_written = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="weather-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, row):
+        self.start()
+        self._queue.put(row)
+
+    def submit_many(self, rows):
+        self.start()
+        for row in rows:
+            self._queue.put(row)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def flush(self, timeout=None):
+        # Blocks until everything submitted before this call is committed.
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        request = _FlushRequest()
+        self._queue.put(request)
+        return request.done.wait(timeout)
+
+    def close(self, timeout=None):
+        with self._lock:
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                return
+            self._queue.put(_STOP)
+        thread.join(timeout)
+        logger.info(f"Weather writer drained: {self.rows_written} rows in {self.batches_written} batches")
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = deadline - time.monotonic() if batch else None
+            try:
+                item = self._queue.get(timeout=max(timeout, 0) if timeout is not None else None)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._write(batch)
+                return
+            if isinstance(item, _FlushRequest):
+                self._write(batch)
+                batch = []
+                item.done.set()
+                continue
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._write(batch)
+                batch = []
+
+    def _write(self, batch):
+        if not batch:
+            return
+        written = save_weather_data_batch(batch)
+        if written:
+            self.rows_written += written
+            self.batches_written += 1
+        else:
+            self.rows_failed += len(batch)
+            logger.error(f"Dropped batch of {len(batch)} weather rows")
+
+writer = WeatherWriter()
+atexit.register(writer.close)
+
+metrics.callback("weather_writer_queue_depth", "Observations waiting for the ingest writer.", writer.queue_depth)
+metrics.callback("weather_writer_rows_total", "Observations handled by the ingest writer.",
+                 lambda: {("written",): writer.rows_written, ("failed",): writer.rows_failed},
+                 labelnames=("outcome",), kind="counter")
+metrics.callback("weather_writer_batches_total", "Batches committed by the ingest writer.",
+                 lambda: writer.batches_written, kind="counter")
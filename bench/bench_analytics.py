@@ -0,0 +1,62 @@
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+import numpy as np
+from app import analytics, crud
+from app.config import settings
+
+# Times multi-city range statistics over a synthetic history loaded straight
+# into a throwaway database: the first (cold) bulk load into the column
+# store, then warm queries that only sync new rows.
+
+def populate(path, cities, readings, start):
+    rng = np.random.default_rng(7)
+    conn = sqlite3.connect(path)
+    # Bulk load without the rollup trigger; analytics only reads weather.
+    conn.execute("DROP TRIGGER IF EXISTS weather_daily_rollup")
+    for c in range(cities):
+        dt = start + np.arange(readings) * 300
+        temp = 25 + 8 * np.sin(dt / 86400 * 2 * np.pi) + rng.normal(0, 2, readings)
+        rows = zip([f"City{c}"] * readings, ["Clear"] * readings, temp.round(2).tolist(),
+                   (temp + rng.normal(1, 1, readings)).round(2).tolist(),
+                   rng.integers(20, 100, readings).tolist(), rng.uniform(0, 10, readings).round(2).tolist(),
+                   dt.tolist())
+        conn.executemany("INSERT INTO weather (city, main, temp, feels_like, humidity, wind_speed, dt) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("INSERT INTO daily_rollup VALUES (?, '2021-07-01', 0, 1, 0, 0, 0, 0)", (f"City{c}",))
+    conn.commit()
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vectorized range analytics")
+    parser.add_argument("--cities", type=int, default=20)
+    parser.add_argument("--readings", type=int, default=50000, help="readings per city")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    start = 1625270400
+    end = start + args.readings * 300
+    with tempfile.TemporaryDirectory() as tmpdir:
+        settings.database_path = os.path.join(tmpdir, "weather.db")
+        crud.create_tables()
+        populate(settings.database_path, args.cities, args.readings, start)
+        total = args.cities * args.readings
+        t0 = time.perf_counter()
+        analytics.column_store.load(None, start, end)
+        cold = time.perf_counter() - t0
+        print(f"cold column load: {total:,} rows across {args.cities} cities in {cold * 1000:.0f} ms")
+        for name, fn in (("range_stats", lambda: analytics.range_stats(None, start, end)),
+                         ("compare_cities", lambda: analytics.compare_cities(None, start, end))):
+            best = float("inf")
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                fn()
+                best = min(best, time.perf_counter() - t0)
+            print(f"{name} (warm): {total:,} rows in {best * 1000:.0f} ms ({total / best:,.0f} rows/s)")
+
+if __name__ == "__main__":
+    main()
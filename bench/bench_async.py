@@ -0,0 +1,143 @@
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+import httpx
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from app import crud
+from app.cache import weather_cache, city_key
+from app.config import settings
+from app.scheduler import fetch_weather_data
+from .mock_openweather import start_mock_server
+from .run import percentiles
+from .synthetic import city_names, generate_rows
+
+# Load test for the async request path. The real app and a copy of the
+# previous all-sync routes are served by uvicorn side by side and driven with
+# the same mix: many concurrent /fetch-weather/ cache misses against a slow
+# mock upstream, while a few clients keep reading /alerts/.
+
+def sync_app():
+    app = FastAPI()
+
+    @app.get("/fetch-weather/{city}")
+    def fetch_weather(city: str):
+        weather_data = weather_cache.get_or_load(city_key(city), lambda key: fetch_weather_data(city),
+                                                 cacheable=lambda data: isinstance(data, dict))
+        if not isinstance(weather_data, dict):
+            raise HTTPException(status_code=500, detail=str(weather_data))
+        return weather_data
+
+    @app.get("/alerts/")
+    def get_alerts(limit: int = 500):
+        return {"alerts": crud.fetch_alerts(limit=limit)}
+
+    return app
+
+def async_app():
+    with patch('app.scheduler.start_scheduler'):
+        from app.main import app
+    return app
+
+def serve(app, port):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning",
+                                           backlog=4096, timeout_keep_alive=120))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread
+
+async def drive(base_url, label, args):
+    # Spread over several small pools, like app.upstream does, so the
+    # driver's own connection bookkeeping does not limit the result.
+    clients = [httpx.AsyncClient(base_url=base_url, timeout=120,
+                                 limits=httpx.Limits(max_connections=max(1, args.concurrency // 16)))
+               for _ in range(16)]
+    reader_client = httpx.AsyncClient(base_url=base_url, timeout=120)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    failures = 0
+    read_latencies = []
+    done = asyncio.Event()
+
+    async def fetch(index, city):
+        nonlocal failures
+        async with semaphore:
+            response = await clients[index % len(clients)].get(f"/fetch-weather/{city}")
+            if response.status_code != 200:
+                failures += 1
+
+    async def read():
+        while not done.is_set():
+            start = time.perf_counter()
+            response = await reader_client.get("/alerts/", params={"limit": 100})
+            response.raise_for_status()
+            read_latencies.append((time.perf_counter() - start) * 1000)
+
+    readers = [asyncio.create_task(read()) for _ in range(args.readers)]
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*[fetch(index, f"{label}-{city}")
+                               for index, city in enumerate(city_names(args.requests))])
+        elapsed = time.perf_counter() - start
+        done.set()
+        await asyncio.gather(*readers)
+    finally:
+        for task in readers:
+            task.cancel()
+        await asyncio.gather(*[client.aclose() for client in clients + [reader_client]])
+    return {
+        'fetches': args.requests,
+        'failures': failures,
+        'seconds': round(elapsed, 2),
+        'fetches_per_sec': round(args.requests / elapsed, 1),
+        'alerts_reads': percentiles(read_latencies) if read_latencies else None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the sync and async request paths")
+    parser.add_argument("--requests", type=int, default=1000, help="/fetch-weather/ cache misses per run")
+    parser.add_argument("--concurrency", type=int, default=200, help="concurrent /fetch-weather/ clients")
+    parser.add_argument("--readers", type=int, default=4, help="clients looping on /alerts/ meanwhile")
+    parser.add_argument("--latency", type=float, default=0.5, help="mock upstream latency in seconds")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    # Measures the request paths, not the request budget.
+    settings.upstream_rate_limit = False
+
+    mock, settings.openweather_base_url = start_mock_server(latency=args.latency)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        settings.database_path = os.path.join(tmpdir, "weather.db")
+        crud.create_tables()
+        cities = city_names(20)
+        crud.save_weather_data_batch(list(generate_rows(cities, 50, int(time.time()) - 50 * 300)))
+        for city in cities:
+            crud.check_alert_thresholds(city, 20.0, 'Clear')
+
+        results = {}
+        for label, app in (("sync", sync_app()), ("async", async_app())):
+            weather_cache.clear()
+            server, thread = serve(app, args.port)
+            try:
+                results[label] = asyncio.run(drive(f"http://127.0.0.1:{args.port}", label, args))
+            finally:
+                server.should_exit = True
+                thread.join()
+    mock.shutdown()
+
+    print(f"requests={args.requests} concurrency={args.concurrency} readers={args.readers} "
+          f"upstream latency={args.latency}s")
+    for label, result in results.items():
+        reads = result['alerts_reads'] or {}
+        print(f"{label:6} {result['fetches_per_sec']:8.1f} fetches/s in {result['seconds']:6.2f}s "
+              f"({result['failures']} failed)  /alerts/ p50 {reads.get('p50_ms', 0):8.1f} ms "
+              f"p99 {reads.get('p99_ms', 0):8.1f} ms over {reads.get('samples', 0)} reads")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import csv
+import logging
+import os
+import resource
+import tempfile
+import time
+from app import backfill, crud
+from app.config import settings
+from .synthetic import city_names, generate_rows
+
+# Compares the old way of loading history, crud.save_weather_data per row,
+# with python -m app.backfill on the same synthetic CSV. The per-row path
+# is timed on a sample only; peak RSS shows whether the backfill's memory
+# stays flat as the file grows.
+
+def write_csv(path, cities, readings, start):
+    with open(path, "w", newline="") as f:
+        out = csv.writer(f)
+        out.writerow(["city", "main", "temp", "feels_like", "humidity", "wind_speed", "dt"])
+        for row in generate_rows(city_names(cities), readings, start):
+            out.writerow([row['city'], row['main'], round(row['temp'], 2), round(row['feels_like'], 2),
+                          row['humidity'], row['wind_speed'], row['dt']])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bulk backfill command")
+    parser.add_argument("--cities", type=int, default=100)
+    parser.add_argument("--readings", type=int, default=10000, help="readings per city, 5 minutes apart")
+    parser.add_argument("--per-row-rows", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=settings.backfill_workers)
+    parser.add_argument("--chunk-size", type=int, default=settings.backfill_chunk_size)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "history.csv")
+        write_csv(path, args.cities, args.readings, 1625097600)
+        total = args.cities * args.readings
+
+        settings.database_path = os.path.join(tmpdir, "per_row.db")
+        crud.create_tables()
+        sample = list(generate_rows(city_names(args.cities), args.per_row_rows // args.cities + 1, 1625097600))
+        sample = sample[:args.per_row_rows]
+        started = time.perf_counter()
+        for row in sample:
+            crud.save_weather_data(row)
+        per_row = len(sample) / (time.perf_counter() - started)
+
+        settings.database_path = os.path.join(tmpdir, "backfill.db")
+        totals = backfill.backfill([path], workers=args.workers, chunk_size=args.chunk_size)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    print(f"{total:,} rows: {args.cities} cities x {args.readings} readings")
+    print(f"per-row save_weather_data: {per_row:10,.0f} rows/s (sample of {len(sample):,})")
+    print(f"backfill (workers={args.workers}): {totals['inserted'] / totals['seconds']:10,.0f} rows/s, "
+          f"{totals['seconds']:.1f}s including index and rollup rebuild, peak RSS {peak:.0f} MB")
+
+if __name__ == "__main__":
+    main()
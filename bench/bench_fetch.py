@@ -0,0 +1,45 @@
+import argparse
+import time
+from app import upstream
+from app.config import settings
+from .mock_openweather import start_mock_server
+
+# Compares a sequential polling round (the old one-request-per-city loop)
+# with the pooled, concurrent fetch engine against the local mock server.
+
+def run_round(base_url, cities, concurrent):
+    def fetch(city):
+        return upstream.get_json(f"{base_url}/weather?q={city}&appid=bench")
+    start = time.perf_counter()
+    if concurrent:
+        upstream.fetch_many(fetch, cities)
+    else:
+        for city in cities:
+            fetch(city)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the upstream fetch engine")
+    parser.add_argument("--cities", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=settings.fetch_concurrency)
+    args = parser.parse_args()
+
+    settings.fetch_concurrency = args.concurrency
+    # Measures the fetch engine, not the request budget.
+    settings.upstream_rate_limit = False
+    upstream.close()
+    server, base_url = start_mock_server(latency=args.latency)
+    cities = [f"City{i}" for i in range(args.cities)]
+    try:
+        sequential = run_round(base_url, cities, concurrent=False)
+        pooled = run_round(base_url, cities, concurrent=True)
+    finally:
+        server.shutdown()
+        upstream.close()
+    print(f"cities={args.cities} latency={args.latency}s concurrency={args.concurrency}")
+    print(f"sequential: {sequential:.2f}s ({args.cities / sequential:.1f} req/s)")
+    print(f"pooled:     {pooled:.2f}s ({args.cities / pooled:.1f} req/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import gc
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from app import crud
+from app.config import settings
+from app.writer import WeatherWriter
+
+# Compares the legacy connection-and-commit-per-row insert path with the
+# buffered batch writer on a throwaway database.
+
+def make_rows(count, cities=50):
+    base = 1625247600
+    return [{'city': f"City{i % cities}", 'main': 'Clear', 'temp': 20 + i % 15,
+             'feels_like': 19 + i % 15, 'humidity': 50 + i % 40, 'wind_speed': 2.5,
+             'dt': base + i} for i in range(count)]
+
+def per_row_insert(rows):
+    for row in rows:
+        conn = sqlite3.connect(settings.database_path)
+        conn.execute("""
+            INSERT INTO weather (city, main, temp, feels_like, humidity, wind_speed, dt)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (row['city'], row['main'], row['temp'], row['feels_like'], row['humidity'],
+              row['wind_speed'], row['dt']))
+        conn.commit()
+        conn.close()
+
+def batched_insert(rows, batch_size):
+    writer = WeatherWriter(batch_size=batch_size, flush_interval=1.0)
+    writer.submit_many(rows)
+    writer.close()
+
+def timed(label, fn, rows):
+    start = time.perf_counter()
+    fn(rows)
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {len(rows)} rows in {elapsed:.2f}s ({len(rows) / elapsed:,.0f} rows/s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark weather ingest throughput")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--per-row-rows", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=settings.write_batch_size)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        settings.database_path = os.path.join(tmpdir, "legacy.db")
+        crud.create_tables()
+        gc.collect()
+        with sqlite3.connect(settings.database_path) as conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+        timed("per-row (legacy)", per_row_insert, make_rows(args.per_row_rows))
+
+        settings.database_path = os.path.join(tmpdir, "batched.db")
+        crud.create_tables()
+        timed(f"batched (size={args.batch_size})", lambda rows: batched_insert(rows, args.batch_size),
+              make_rows(args.rows))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from app.migrations import migrate
+
+# Builds a pre-versioning weather.db, then reports query plans and latencies
+# for the hot queries before and after running the migrations in place.
+
+CONDITIONS = ["Clear", "Clouds", "Rain", "Haze", "Mist"]
+
+QUERIES = {
+    "city_range_scan": ("SELECT temp, dt FROM weather WHERE city = ? AND dt BETWEEN ? AND ?",
+                        lambda p: (p["city"], p["start"], p["start"] + 86400 * 7)),
+    "alert_check": ("SELECT city, temp, dt FROM weather WHERE temp > ? AND main = ? AND city = ?",
+                    lambda p: (35.0, "Rain", p["city"])),
+    "duplicate_alert_lookup": ("SELECT * FROM alerts WHERE city = ? AND condition = ? AND temp_threshold = ? AND alert_time = ?",
+                               lambda p: (p["city"], "Rain", 35.0, str(p["start"]))),
+    "city_daily_summary": ("SELECT date(dt, 'unixepoch'), AVG(temp), MAX(temp), MIN(temp) FROM weather "
+                           "WHERE city = ? AND dt >= ? GROUP BY date(dt, 'unixepoch')",
+                           lambda p: (p["city"], p["start"])),
+}
+
+def build_legacy_db(path, cities, readings, seed=7):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE weather (id INTEGER PRIMARY KEY AUTOINCREMENT, city TEXT NOT NULL,
+        main TEXT NOT NULL, temp REAL NOT NULL, feels_like REAL NOT NULL, humidity INTEGER NOT NULL,
+        wind_speed REAL NOT NULL, dt INTEGER NOT NULL)""")
+    conn.execute("""CREATE TABLE daily_summary (id INTEGER PRIMARY KEY AUTOINCREMENT, city TEXT NOT NULL,
+        date TEXT NOT NULL, avg_temp REAL NOT NULL, max_temp REAL NOT NULL, min_temp REAL NOT NULL,
+        avg_humidity REAL NOT NULL, avg_wind_speed REAL NOT NULL, dominant_condition TEXT NOT NULL)""")
+    conn.execute("""CREATE TABLE alerts (id INTEGER PRIMARY KEY AUTOINCREMENT, city TEXT NOT NULL,
+        condition TEXT NOT NULL, temp_threshold REAL NOT NULL, alert_time TEXT NOT NULL)""")
+    base = 1625247600
+    for c in range(cities):
+        city = f"City{c}"
+        rows = [(city, rng.choice(CONDITIONS), rng.uniform(10, 45), rng.uniform(10, 45),
+                 rng.randint(20, 100), rng.uniform(0, 10), base + i * 300) for i in range(readings)]
+        # Every tenth reading duplicated, as repeated forecast fetches used to do.
+        rows += rows[::10]
+        conn.executemany("INSERT INTO weather (city, main, temp, feels_like, humidity, wind_speed, dt) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.executemany("INSERT INTO alerts (city, condition, temp_threshold, alert_time) VALUES (?, ?, ?, ?)",
+                         [(city, "Rain", 35.0, str(row[6])) for row in rows if row[1] == "Rain" and row[2] > 35])
+    conn.commit()
+    conn.close()
+    return {"city": f"City{cities // 2}", "start": base + readings * 150}
+
+def measure(conn, params, repeat):
+    results = {}
+    for name, (sql, args) in QUERIES.items():
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", args(params))]
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(sql, args(params)).fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = {"plan": plan, "median_ms": round(statistics.median(timings), 3)}
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Show query plans and latencies before/after migrations")
+    parser.add_argument("--cities", type=int, default=50)
+    parser.add_argument("--readings", type=int, default=5000, help="readings per city")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "weather.db")
+        params = build_legacy_db(path, args.cities, args.readings)
+        conn = sqlite3.connect(path)
+        before = measure(conn, params, args.repeat)
+        start = time.perf_counter()
+        migrate(conn)
+        migration_seconds = time.perf_counter() - start
+        after = measure(conn, params, args.repeat)
+        conn.close()
+
+    report = {"cities": args.cities, "readings_per_city": args.readings,
+              "migration_seconds": round(migration_seconds, 3), "before": before, "after": after}
+    for name in QUERIES:
+        print(f"{name}: {before[name]['median_ms']:.3f} ms -> {after[name]['median_ms']:.3f} ms")
+        print(f"  before: {'; '.join(before[name]['plan'])}")
+        print(f"  after:  {'; '.join(after[name]['plan'])}")
+    print(f"migration took {migration_seconds:.2f}s")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import logging
+import os
+import tempfile
+import time
+from app import crud, storage
+from app.config import settings
+from .synthetic import city_names, generate_rows, chunked
+
+# Compares the storage backends on the same synthetic history: loading it,
+# the full and single-city daily summaries, and range scans over a window
+# of every city and of one city. SQLite serves summaries from the rollup
+# tables kept at ingest; DuckDB aggregates its columnar copy of the raw rows.
+
+def params(rows):
+    return [(row['city'], row['main'], round(row['temp'], 2), round(row['feels_like'], 2), row['humidity'],
+             row['wind_speed'], row['dt']) for row in rows]
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SQLite and DuckDB storage backends")
+    parser.add_argument("--cities", type=int, default=50)
+    parser.add_argument("--readings", type=int, default=20000, help="readings per city, 5 minutes apart")
+    parser.add_argument("--chunk", type=int, default=50000, help="rows per save_weather call")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    if storage.duckdb is None:
+        parser.error("the duckdb package is not installed")
+
+    cities = city_names(args.cities)
+    start = 1625097600
+    end = start + args.readings * 300
+    window = (end - 7 * 86400, end)
+    total = args.cities * args.readings
+    with tempfile.TemporaryDirectory() as tmpdir:
+        settings.database_path = os.path.join(tmpdir, "weather.db")
+        crud.create_tables()
+        backends = {'sqlite': storage.SQLiteStorage(),
+                    'duckdb': storage.DuckDBStorage(os.path.join(tmpdir, "weather.duckdb"))}
+        results = {name: {} for name in backends}
+        for name, backend in backends.items():
+            t0 = time.perf_counter()
+            for chunk in chunked(generate_rows(cities, args.readings, start), args.chunk):
+                backend.save_weather(params(chunk))
+            results[name]['load'] = time.perf_counter() - t0
+
+        queries = {
+            'summary': lambda backend: backend.daily_summary(),
+            'summary_city': lambda backend: backend.daily_summary(city=cities[-1]),
+            'scan_7d_all': lambda backend: backend.scan(cities, *window),
+            'scan_all_1city': lambda backend: backend.scan([cities[0]], start, end),
+        }
+        for name, backend in backends.items():
+            for query, fn in queries.items():
+                results[name][query] = best_of(lambda: fn(backend), args.repeat)
+        size = {'sqlite': os.path.getsize(settings.database_path),
+                'duckdb': os.path.getsize(os.path.join(tmpdir, "weather.duckdb"))}
+        backends['duckdb'].close()
+
+    print(f"{total:,} rows: {args.cities} cities x {args.readings} readings")
+    print(f"{'':16}" + "".join(f"{name:>12}" for name in results))
+    for metric in ['load'] + list(queries):
+        print(f"{metric:16}" + "".join(f"{results[name][metric] * 1000:10.0f}ms" for name in results))
+    print(f"{'file size':16}" + "".join(f"{size[name] / 1e6:10.1f}MB" for name in results))
+
+if __name__ == "__main__":
+    main()
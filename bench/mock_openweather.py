@@ -0,0 +1,150 @@
+import argparse
+import collections
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Local stand-in for the OpenWeather /weather and /forecast endpoints so the
+# fetch engine can be exercised without network access. Responses are
+# deterministic per city and carry only the fields the app reads.
+#
+# Faults can be injected to exercise the client's retries, breaker and
+# timeouts: queue them on server.faults to hit the next requests in order,
+# or set server.fault_rate to fail that share of requests at random with one
+# of server.fault_kinds. The kinds are:
+#   error        500 Internal Server Error
+#   unavailable  503 with Retry-After
+#   throttle     429 Too Many Requests with Retry-After
+#   hang         no answer for server.hang_seconds, then the connection closes
+#   drop         the connection closes without an answer
+#   ok           a normal answer, to interleave with queued faults
+
+FAULT_KINDS = ("error", "unavailable", "throttle", "hang", "drop")
+
+CONDITIONS = ["Clear", "Clouds", "Rain", "Haze", "Mist", "Thunderstorm"]
+
+def _reading(rng, dt):
+    return {
+        "main": {
+            "temp": 273.15 + rng.uniform(5, 40),
+            "feels_like": 273.15 + rng.uniform(5, 42),
+            "humidity": rng.randint(20, 100),
+        },
+        "weather": [{"main": rng.choice(CONDITIONS)}],
+        "wind": {"speed": round(rng.uniform(0, 12), 2)},
+        "dt": dt,
+    }
+
+def current_payload(city, now=None):
+    now = int(now or time.time())
+    rng = random.Random(zlib.crc32(city.encode()) ^ (now // 600))
+    payload = _reading(rng, now - now % 600)
+    payload["name"] = city
+    return payload
+
+def forecast_payload(city, now=None, count=40):
+    now = int(now or time.time())
+    start = now - now % 10800 + 10800
+    rng = random.Random(zlib.crc32(city.encode()) ^ (start // 10800))
+    return {"cnt": count, "list": [_reading(rng, start + i * 10800) for i in range(count)]}
+
+class MockOpenWeatherHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        server.request_count += 1
+        fault = server.next_fault()
+        if fault in ("hang", "drop"):
+            if fault == "hang":
+                time.sleep(server.hang_seconds)
+            self.close_connection = True
+            return
+        if server.latency:
+            time.sleep(server.latency)
+        if fault == "error":
+            return self._send(500, {"cod": "500", "message": "Internal error"})
+        if fault == "unavailable":
+            return self._send(503, {"cod": "503", "message": "Service unavailable"},
+                              {"Retry-After": str(server.retry_after)})
+        if fault == "throttle":
+            return self._send(429, {"cod": 429, "message": "Your account is temporary blocked"},
+                              {"Retry-After": str(server.retry_after)})
+        parsed = urlparse(self.path)
+        city = parse_qs(parsed.query).get("q", [""])[0]
+        if not city:
+            return self._send(400, {"cod": "400", "message": "Nothing to geocode"})
+        if parsed.path.endswith("/weather"):
+            return self._send(200, current_payload(city))
+        if parsed.path.endswith("/forecast"):
+            return self._send(200, forecast_payload(city))
+        self._send(404, {"cod": "404", "message": "Not found"})
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class MockOpenWeatherServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops bursts of concurrent connects, which
+    # then stall for a full SYN retransmit.
+    request_queue_size = 1024
+
+    def next_fault(self):
+        with self.fault_lock:
+            if self.faults:
+                return self.faults.popleft()
+            if self.fault_rate and self.rng.random() < self.fault_rate:
+                return self.rng.choice(self.fault_kinds)
+            return "ok"
+
+def start_mock_server(host="127.0.0.1", port=0, latency=0.0, fault_rate=0.0, fault_kinds=FAULT_KINDS, seed=None):
+    server = MockOpenWeatherServer((host, port), MockOpenWeatherHandler)
+    server.latency = latency
+    server.request_count = 0
+    server.faults = collections.deque()
+    server.fault_rate = fault_rate
+    server.fault_kinds = tuple(fault_kinds)
+    server.fault_lock = threading.Lock()
+    server.rng = random.Random(seed)
+    server.hang_seconds = 30.0
+    server.retry_after = 1
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}/data/2.5"
+    return server, base_url
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local mock OpenWeather server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--fault-rate", type=float, default=0.0, help="share of requests that fail")
+    parser.add_argument("--faults", default=",".join(FAULT_KINDS),
+                        help="comma-separated fault kinds to pick from: " + ", ".join(FAULT_KINDS))
+    args = parser.parse_args()
+    kinds = [kind.strip() for kind in args.faults.split(",") if kind.strip()]
+    unknown = set(kinds) - set(FAULT_KINDS) - {"ok"}
+    if unknown:
+        parser.error(f"unknown fault kinds: {', '.join(sorted(unknown))}")
+    server, base_url = start_mock_server(args.host, args.port, args.latency, args.fault_rate, kinds)
+    print(f"Mock OpenWeather listening on {base_url} (set OPENWEATHER_BASE_URL to this)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,176 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+from app import crud, upstream
+from app.alerts import AlertRuleIndex
+from app.config import settings
+from app.writer import WeatherWriter, writer
+from .mock_openweather import start_mock_server
+from .synthetic import city_names, generate_rows, CONDITIONS
+
+# Reproducible benchmark harness. Every scenario runs against a throwaway
+# database and the local mock upstream, and the results are written as JSON
+# so runs can be diffed across commits with bench.compare.
+
+def percentiles(samples_ms):
+    ordered = sorted(samples_ms)
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+    return {'p50_ms': pick(0.50), 'p99_ms': pick(0.99), 'max_ms': round(ordered[-1], 3),
+            'samples': len(ordered)}
+
+def bench_ingest(args, cities, start):
+    # Rows go through the production path: writer queue, executemany,
+    # rollup trigger and alert-rule evaluation.
+    for city in cities:
+        crud.save_alert_rule(city, 'Clear', 30.0)
+    rows = generate_rows(cities, args.readings, start, seed=args.seed)
+    ingest_writer = WeatherWriter()
+    started = time.perf_counter()
+    ingest_writer.submit_many(rows)
+    ingest_writer.close()
+    elapsed = time.perf_counter() - started
+    return {'rows': ingest_writer.rows_written, 'seconds': round(elapsed, 3),
+            'rows_per_sec': round(ingest_writer.rows_written / elapsed, 1)}
+
+def bench_scheduler_round(args):
+    from app.scheduler import poll_weather
+    server, base_url = start_mock_server(latency=args.upstream_latency)
+    settings.openweather_base_url = base_url
+    # Measures the polling round, not the request budget.
+    settings.upstream_rate_limit = False
+    cities = city_names(args.round_cities)
+    timings = []
+    try:
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            poll_weather(cities)
+            timings.append((time.perf_counter() - started) * 1000)
+        writer.flush()
+    finally:
+        server.shutdown()
+        server.server_close()
+        upstream.close()
+    result = percentiles(timings)
+    result.update({'cities': len(cities), 'upstream_latency_s': args.upstream_latency,
+                   'concurrency': settings.fetch_concurrency})
+    return result
+
+def bench_endpoints(args, cities):
+    from fastapi.testclient import TestClient
+    with patch('app.scheduler.start_scheduler'):
+        from app.main import app
+    client = TestClient(app)
+    rng = random.Random(args.seed)
+    etags = {}
+
+    def revalidate(path, params=None):
+        # A polling client that sends back the ETag it was last given.
+        response = client.get(path, params=params, headers={'If-None-Match': etags.get(path, '')})
+        if response.status_code == 200:
+            etags[path] = response.headers['etag']
+        return response
+
+    requests = {
+        'weather_summary': lambda: client.get('/weather-summary/', params={'days': 7}),
+        'weather_summary_revalidate': lambda: revalidate('/weather-summary/', {'days': 7}),
+        'weather_summary_city': lambda: client.get('/weather-summary/', params={'city': rng.choice(cities)}),
+        'alerts': lambda: client.get('/alerts/'),
+        'alerts_city': lambda: client.get('/alerts/', params={'city': rng.choice(cities)}),
+        'alerts_revalidate': lambda: revalidate('/alerts/'),
+    }
+    results = {}
+    for name, request in requests.items():
+        request()
+        timings = []
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            response = request()
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code not in (200, 304):
+                raise RuntimeError(f"{name} returned {response.status_code}")
+        results[name] = percentiles(timings)
+    return results
+
+def bench_alert_evaluation(args):
+    rng = random.Random(args.seed)
+    cities = city_names(args.alert_cities)
+    index = AlertRuleIndex()
+    index.load([{'city': rng.choice(cities), 'condition': rng.choice(CONDITIONS),
+                 'temp_threshold': rng.uniform(0, 40)} for _ in range(args.alert_rules)])
+    observations = [(rng.choice(cities), rng.choice(CONDITIONS), rng.uniform(0, 45), i)
+                    for i in range(args.alert_observations)]
+    started = time.perf_counter()
+    triggered = index.evaluate(observations)
+    elapsed = time.perf_counter() - started
+    return {'rules': len(index), 'observations': len(observations), 'alerts': len(triggered),
+            'us_per_observation': round(elapsed / len(observations) * 1e6, 3)}
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the weather service benchmark suite")
+    parser.add_argument("--cities", type=int, default=200)
+    parser.add_argument("--readings", type=int, default=500, help="readings per city for the ingest scenario")
+    parser.add_argument("--round-cities", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--upstream-latency", type=float, default=0.05)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--alert-cities", type=int, default=1000)
+    parser.add_argument("--alert-rules", type=int, default=10000)
+    parser.add_argument("--alert-observations", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scenarios", default="ingest,scheduler,endpoints,alerts")
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    scenarios = set(args.scenarios.split(","))
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': int(time.time()),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'params': vars(args)
+        },
+        'results': {}
+    }
+    cities = city_names(args.cities)
+    start = int(time.time()) - args.readings * 300
+    with tempfile.TemporaryDirectory() as tmpdir:
+        settings.database_path = os.path.join(tmpdir, "weather.db")
+        crud.create_tables()
+        # Endpoints read what the ingest scenario wrote, so it always runs first.
+        if scenarios & {'ingest', 'endpoints'}:
+            report['results']['ingest'] = bench_ingest(args, cities, start)
+        if 'scheduler' in scenarios:
+            report['results']['scheduler_round'] = bench_scheduler_round(args)
+        if 'endpoints' in scenarios:
+            report['results']['endpoints'] = bench_endpoints(args, cities)
+        if 'alerts' in scenarios:
+            report['results']['alert_evaluation'] = bench_alert_evaluation(args)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+if __name__ == "__main__":
+    sys.exit(main())
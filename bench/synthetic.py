@@ -0,0 +1,72 @@
+import argparse
+import logging
+import math
+import random
+import time
+from app import crud
+from app.config import settings
+
+# Deterministic synthetic weather histories. Rows are produced lazily, so
+# histories of tens of millions of rows can be streamed into a database in
+# chunks without holding them in memory.
+
+CONDITIONS = ["Clear", "Clouds", "Rain", "Haze", "Mist", "Thunderstorm"]
+
+def city_names(count):
+    return [f"City{i:05d}" for i in range(count)]
+
+def generate_rows(cities, readings, start, interval=300, seed=42):
+    # Round-robin over cities per timestamp, as a polling scheduler would
+    # produce them. Temperature follows a daily cycle plus noise.
+    rng = random.Random(seed)
+    bases = {city: rng.uniform(5, 35) for city in cities}
+    for i in range(readings):
+        dt = start + i * interval
+        cycle = 6 * math.sin((dt % 86400) / 86400 * 2 * math.pi)
+        for city in cities:
+            temp = bases[city] + cycle + rng.gauss(0, 1.5)
+            yield {
+                'city': city,
+                'main': CONDITIONS[rng.randrange(len(CONDITIONS))],
+                'temp': temp,
+                'feels_like': temp + rng.gauss(1, 1),
+                'humidity': rng.randint(20, 100),
+                'wind_speed': round(rng.uniform(0, 12), 2),
+                'dt': dt
+            }
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def populate(cities, readings, start, interval=300, chunk_size=10000, seed=42):
+    total = 0
+    for chunk in chunked(generate_rows(cities, readings, start, interval, seed), chunk_size):
+        total += crud.save_weather_data_batch(chunk)
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill a database with a synthetic weather history")
+    parser.add_argument("--database", default=settings.database_path)
+    parser.add_argument("--cities", type=int, default=100)
+    parser.add_argument("--readings", type=int, default=2016, help="readings per city (2016 = 7 days at 5 min)")
+    parser.add_argument("--interval", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    settings.database_path = args.database
+    crud.create_tables()
+    start = int(time.time()) - args.readings * args.interval
+    started = time.perf_counter()
+    total = populate(city_names(args.cities), args.readings, start, args.interval, seed=args.seed)
+    print(f"Wrote {total:,} rows to {args.database} in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
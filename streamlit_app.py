@@ -9,6 +9,45 @@ BASE_URL = "http://127.0.0.1:8000"
 
 st.title("Weather Data Processing System")
 
+PAGE_SIZE = 500
+
+def get_json(path, params):
+    # Revalidates with the ETag of the previous response for the same URL;
+    # unchanged data comes back as an empty 304 and the held copy is reused.
+    cache = st.session_state.setdefault("http_cache", {})
+    key = (path, tuple(sorted(params.items())))
+    headers = {"If-None-Match": cache[key][0]} if key in cache else {}
+    response = requests.get(f"{BASE_URL}{path}", params=params, headers=headers)
+    if response.status_code == 304:
+        return cache[key][1]
+    if response.status_code != 200:
+        return None
+    payload = response.json()
+    if "ETag" in response.headers:
+        cache[key] = (response.headers["ETag"], payload)
+    return payload
+
+def fetch_pages(path, key, params=None, cursor=None):
+    # Follows next_cursor page by page; returns the rows plus the cursor of
+    # the last page so a later call can resume from there.
+    params = dict(params or {}, limit=PAGE_SIZE)
+    rows = []
+    progress = st.empty()
+    while True:
+        if cursor:
+            params["cursor"] = cursor
+        payload = get_json(path, params)
+        if payload is None:
+            progress.empty()
+            return None, cursor
+        rows.extend(payload[key])
+        cursor = payload["next_cursor"]
+        progress.caption(f"Loaded {len(rows)} rows...")
+        if not payload["has_more"]:
+            break
+    progress.empty()
+    return rows, cursor
+
 # Section to fetch weather data for a city
 st.header("Fetch Weather Data")
 city = st.text_input("Enter city name", "Delhi")
@@ -30,9 +69,8 @@ if st.button("Fetch Weather"):
 st.header("Daily Weather Summary")
 if st.button("Get Daily Summary"):
     start_time = time.time()
-    response = requests.get(f"{BASE_URL}/weather-summary/")
-    if response.status_code == 200:
-        summary = response.json()["daily_summary"]
+    summary, _ = fetch_pages("/weather-summary/", "daily_summary")
+    if summary is not None:
         elapsed_time = time.time() - start_time
         st.write(f"Data fetched in {elapsed_time:.2f} seconds")
         if summary:
@@ -87,15 +125,21 @@ st.header("Alerts")
 if st.button("Clear Alerts"):
     response = requests.delete(f"{BASE_URL}/clear-alerts/")
     if response.status_code == 200:
+        st.session_state.pop("alerts", None)
+        st.session_state.pop("alerts_cursor", None)
         st.success("All alerts cleared!")
     else:
         st.error("Error clearing alerts")
 
 # Function to fetch and display alerts
+# Alerts are paged by id, so each rerun only fetches alerts newer than the
+# ones already held in the session.
 def fetch_alerts():
-    response = requests.get(f"{BASE_URL}/alerts/")
-    if response.status_code == 200:
-        alerts = response.json()["alerts"]
+    new_alerts, cursor = fetch_pages("/alerts/", "alerts", cursor=st.session_state.get("alerts_cursor"))
+    if new_alerts is not None:
+        alerts = st.session_state.setdefault("alerts", [])
+        alerts.extend(new_alerts)
+        st.session_state["alerts_cursor"] = cursor
         if alerts:
             df_alerts = pd.DataFrame(alerts)
             df_alerts['alert_time'] = pd.to_datetime(df_alerts['alert_time'], unit='s')  # Convert from Unix timestamp
@@ -0,0 +1,295 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import json
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from fastapi.testclient import TestClient
+from app import crud, analytics, metrics, upstream
+from app.aiodb import pool
+from app.cache import weather_cache
+from app.writer import writer
+from bench.mock_openweather import start_mock_server
+from app.config import settings
+
+def make_row(city, dt, temp=25.0, main='Clear'):
+    return {'city': city, 'main': main, 'temp': temp, 'feels_like': temp - 1,
+            'humidity': 60, 'wind_speed': 3.0, 'dt': dt}
+
+class ApiTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.database_path = settings.database_path
+        settings.database_path = os.path.join(cls.tmpdir.name, 'weather.db')
+        with patch('app.scheduler.start_scheduler'):
+            from app.main import app
+        cls.client = TestClient(app)
+
+    @classmethod
+    def tearDownClass(cls):
+        settings.database_path = cls.database_path
+        cls.tmpdir.cleanup()
+
+    def setUp(self):
+        settings.database_path = os.path.join(self.tmpdir.name, f'{self.id()}.db')
+        crud.create_tables()
+
+class TestPagination(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        day = 86400
+        crud.save_weather_data_batch([make_row(city, 1625247600 + i * day, temp=40.0)
+                                      for city in ('Delhi', 'Mumbai', 'Chennai') for i in range(4)])
+        for city in ('Delhi', 'Mumbai', 'Chennai'):
+            crud.check_alert_thresholds(city, 30.0, 'Clear')
+
+    def collect(self, path, key, **params):
+        rows, cursor = [], None
+        while True:
+            if cursor:
+                params['cursor'] = cursor
+            payload = self.client.get(path, params=params).json()
+            rows.extend(payload[key])
+            cursor = payload['next_cursor']
+            if not payload['has_more']:
+                return rows
+
+    def test_alerts_keyset_pages(self):
+        alerts = self.collect('/alerts/', 'alerts', limit=5)
+        self.assertEqual(len(alerts), 12)
+        self.assertEqual([a['id'] for a in alerts], sorted(a['id'] for a in alerts))
+
+    def test_alerts_filters(self):
+        response = self.client.get('/alerts/', params={'city': 'Mumbai', 'start': 1625247600 + 86400,
+                                                       'end': 1625247600 + 2 * 86400})
+        alerts = response.json()['alerts']
+        self.assertEqual(len(alerts), 2)
+        self.assertTrue(all(a['city'] == 'Mumbai' for a in alerts))
+
+    def test_summary_keyset_pages(self):
+        summary = self.collect('/weather-summary/', 'daily_summary', limit=5)
+        self.assertEqual(len(summary), 12)
+        self.assertEqual(summary, self.client.get('/weather-summary/').json()['daily_summary'])
+
+    def test_ndjson_stream(self):
+        response = self.client.get('/alerts/', params={'format': 'ndjson', 'city': 'Delhi'})
+        self.assertEqual(response.headers['content-type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(len(rows), 4)
+        response = self.client.get('/weather-summary/', params={'format': 'ndjson'})
+        self.assertEqual(len(response.text.splitlines()), 12)
+
+    def test_resume_from_cursor(self):
+        payload = self.client.get('/alerts/', params={'limit': 100}).json()
+        self.assertFalse(payload['has_more'])
+        cursor = payload['next_cursor']
+        crud.save_alert_rule('Delhi', 'Clear', 35.0)
+        crud.save_weather_data_batch([make_row('Delhi', 1625247600 + 10 * 86400, temp=40.0)])
+        payload = self.client.get('/alerts/', params={'cursor': cursor}).json()
+        self.assertEqual(len(payload['alerts']), 1)
+        payload = self.client.get('/alerts/', params={'cursor': payload['next_cursor']}).json()
+        self.assertEqual(payload['alerts'], [])
+        self.assertIsNotNone(payload['next_cursor'])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/alerts/', params={'cursor': 'nope'}).status_code, 400)
+
+class TestAnalytics(ApiTestCase):
+
+    start = 1625270400
+
+    def setUp(self):
+        super().setUp()
+        crud.save_weather_data_batch([make_row('Delhi', self.start + i * 300, temp=20.0 + i) for i in range(10)] +
+                                     [make_row('Mumbai', self.start + i * 300, temp=10.0) for i in range(4)])
+
+    def test_heat_index(self):
+        hi = analytics.heat_index(np.array([(90 - 32) * 5 / 9, 20.0]), np.array([70.0, 50.0]))
+        self.assertAlmostEqual(hi[0] * 9 / 5 + 32, 105.9, places=1)
+        self.assertAlmostEqual(hi[1], 19.36, places=2)
+
+    def test_range_stats(self):
+        response = self.client.get('/analytics/stats', params={'start': self.start, 'end': self.start + 3600,
+                                                               'percentiles': [50]})
+        stats = response.json()['stats']
+        self.assertEqual(stats['Delhi']['count'], 10)
+        self.assertEqual(stats['Delhi']['mean_temp'], 24.5)
+        self.assertEqual(stats['Delhi']['percentiles'], {'50.0': 24.5})
+        self.assertEqual(stats['Delhi']['mean_feels_like_delta'], -1.0)
+        self.assertEqual(stats['Mumbai']['max_temp'], 10.0)
+
+    def test_compare_and_incremental_sync(self):
+        params = {'start': self.start, 'end': self.start + 86400}
+        cities = self.client.get('/analytics/compare', params=params).json()['cities']
+        self.assertEqual([(c['city'], c['rank']) for c in cities], [('Delhi', 1), ('Mumbai', 2)])
+        crud.save_weather_data_batch([make_row('Mumbai', self.start + 3000, temp=90.0)])
+        cities = self.client.get('/analytics/compare', params=params).json()['cities']
+        self.assertEqual(cities[0]['city'], 'Mumbai')
+        self.assertEqual(cities[0]['count'], 5)
+
+    def test_rolling_mean(self):
+        response = self.client.get('/analytics/rolling/Delhi', params={'start': self.start, 'window': 4})
+        points = response.json()['points']
+        self.assertEqual(len(points), 7)
+        self.assertEqual(points[0], {'ts': self.start + 900, 'rolling_mean_temp': 21.5})
+
+    def test_rolling_stats(self):
+        now = int(time.time())
+        crud.save_weather_data_batch([make_row('Delhi', now - 7200, temp=30.0),
+                                      make_row('Delhi', now - 600, temp=36.0)])
+        body = self.client.get("/stats/rolling/Delhi", params={'window': '3h'}).json()
+        self.assertEqual(body['latest'], {'dt': now - 600, 'temp': 36.0})
+        self.assertEqual(list(body['windows']), ['3h'])
+        self.assertEqual((body['windows']['3h']['min'], body['windows']['3h']['mean']), (30.0, 33.0))
+        self.assertEqual(len(self.client.get("/stats/rolling/Delhi").json()['windows']), 4)
+        self.assertEqual(self.client.get("/stats/rolling/Delhi", params={'window': '5h'}).status_code, 400)
+        self.assertEqual(self.client.get("/stats/rolling/Paris").status_code, 404)
+
+class TestMetrics(ApiTestCase):
+
+    def test_histogram_exposition(self):
+        histogram = metrics.Histogram('test_latency_seconds', 'Test latency.', ('kind',), buckets=(0.1, 1.0))
+        histogram.labels('a').observe(0.05)
+        histogram.labels('a').observe(0.5)
+        histogram.labels('a').observe(5)
+        lines = histogram.render()
+        self.assertIn('# TYPE test_latency_seconds histogram', lines)
+        self.assertIn('test_latency_seconds_bucket{kind="a",le="0.1"} 1', lines)
+        self.assertIn('test_latency_seconds_bucket{kind="a",le="1.0"} 2', lines)
+        self.assertIn('test_latency_seconds_bucket{kind="a",le="+Inf"} 3', lines)
+        self.assertIn('test_latency_seconds_count{kind="a"} 3', lines)
+
+    def test_metrics_endpoint(self):
+        self.client.get('/alerts/', params={'city': 'Delhi'})
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers['content-type'].startswith('text/plain'))
+        body = response.text
+        self.assertIn('weather_http_request_duration_seconds_count{method="GET",route="/alerts/",status="200"}', body)
+        self.assertIn('weather_function_duration_seconds_count{component="crud",function="fetch_alerts"}', body)
+        self.assertIn('weather_writer_queue_depth ', body)
+        self.assertNotIn('city=', body)
+
+    def test_profiler_toggle(self):
+        response = self.client.post('/profiler/start', params={'interval': 0.001})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.post('/profiler/start').status_code, 409)
+        for _ in range(20):
+            self.client.get('/alerts/')
+        report = self.client.post('/profiler/stop').json()
+        self.assertFalse(report['running'])
+        self.assertGreater(report['samples'], 0)
+        self.assertTrue(report['cumulative'])
+        self.assertEqual(self.client.post('/profiler/stop').status_code, 409)
+        collapsed = self.client.get('/profiler', params={'format': 'collapsed'}).text
+        self.assertRegex(collapsed.splitlines()[0], r' \d+$')
+
+class TestAsyncRoutes(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server, base_url = start_mock_server(latency=0)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.addCleanup(setattr, settings, 'openweather_base_url', settings.openweather_base_url)
+        settings.openweather_base_url = base_url
+        weather_cache.clear()
+        self.addCleanup(weather_cache.clear)
+        # Fetched readings are queued for the writer; store them in this
+        # test's database rather than whichever is current at the next flush.
+        self.addCleanup(writer.flush)
+
+    def test_fetch_weather_from_async_client(self):
+        first = self.client.get('/fetch-weather/Delhi').json()
+        second = self.client.get('/fetch-weather/delhi').json()
+        self.assertEqual(first, second)
+        self.assertEqual(first['city'], 'Delhi')
+        self.assertEqual(self.server.request_count, 1)
+
+    def test_upstream_error(self):
+        settings.openweather_base_url = 'http://127.0.0.1:9/data/2.5'
+        self.addCleanup(setattr, settings, 'fetch_retries', settings.fetch_retries)
+        settings.fetch_retries = 0
+        response = self.client.get('/fetch-weather/Delhi')
+        self.assertEqual(response.status_code, 502)
+        self.assertIn('Error fetching weather data', response.json()['detail'])
+
+    def test_upstream_unavailable(self):
+        self.addCleanup(setattr, settings, 'fetch_retries', settings.fetch_retries)
+        settings.fetch_retries = 0
+        self.server.faults.append("throttle")
+        response = self.client.get('/fetch-weather/Delhi')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['retry-after'], '1')
+        self.assertEqual(self.client.get('/fetch-weather/Delhi').status_code, 200)
+
+    def test_reads_share_pooled_connections(self):
+        crud.save_weather_data_batch([make_row('Delhi', 1625247600 + i * 3600, temp=40.0) for i in range(3)])
+        crud.check_alert_thresholds('Delhi', 30.0, 'Clear')
+        for _ in range(20):
+            self.assertEqual(len(self.client.get('/alerts/').json()['alerts']), 3)
+        self.assertLessEqual(len(pool._connections), settings.db_pool_size)
+
+class TestConditionalGet(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        crud.save_weather_data_batch([make_row(city, 1625247600 + i * 86400, temp=40.0)
+                                      for city in ('Delhi', 'Mumbai') for i in range(3)])
+        crud.check_alert_thresholds('Delhi', 30.0, 'Clear')
+
+    def test_unchanged_alerts_return_304(self):
+        first = self.client.get('/alerts/')
+        etag = first.headers['etag']
+        with patch('app.acrud.fetch_alerts') as fetch_alerts:
+            response = self.client.get('/alerts/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response.headers['etag'], etag)
+        fetch_alerts.assert_not_called()
+        # Another query over the same data is a different representation.
+        self.assertNotEqual(self.client.get('/alerts/', params={'city': 'Delhi'}).headers['etag'], etag)
+
+    def test_writes_change_the_etag(self):
+        etag = self.client.get('/alerts/').headers['etag']
+        crud.check_alert_thresholds('Mumbai', 30.0, 'Clear')
+        response = self.client.get('/alerts/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['alerts']), 6)
+        etag = response.headers['etag']
+        crud.clear_all_alerts()
+        response = self.client.get('/alerts/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['alerts'], [])
+
+    def test_summary_last_modified(self):
+        first = self.client.get('/weather-summary/')
+        headers = {'If-Modified-Since': first.headers['last-modified']}
+        self.assertEqual(self.client.get('/weather-summary/', headers=headers).status_code, 304)
+        # Alerts do not change the summary.
+        crud.check_alert_thresholds('Mumbai', 30.0, 'Clear')
+        self.assertEqual(self.client.get('/weather-summary/', headers={'If-None-Match': first.headers['etag']})
+                         .status_code, 304)
+        crud.save_weather_data_batch([make_row('Chennai', 1625247600, temp=30.0)])
+        response = self.client.get('/weather-summary/', headers={'If-None-Match': first.headers['etag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['daily_summary']), 7)
+
+    def test_large_responses_are_compressed(self):
+        crud.save_weather_data_batch([make_row(f'City{i}', 1625247600) for i in range(50)])
+        response = self.client.get('/weather-summary/', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['content-encoding'], 'gzip')
+        self.assertEqual(len(response.json()['daily_summary']), 56)
+        small = self.client.get('/cities/', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('content-encoding', small.headers)
+
+if __name__ == '__main__':
+    unittest.main()
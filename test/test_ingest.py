@@ -0,0 +1,443 @@
+import unittest
+import sys
+import os
+import tempfile
+import time
+import gzip
+import json
+import random
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import crud
+from app.config import settings
+from app.writer import WeatherWriter
+from app.alerts import alert_rules
+from app import retention, backfill
+from app.rolling import CitySeries, RollingStats, rolling_stats, parse_windows
+from app.migrations import LATEST_VERSION, get_schema_version, migrate
+
+def make_row(city, dt, temp=25.0, main='Clear'):
+    return {'city': city, 'main': main, 'temp': temp, 'feels_like': temp - 1,
+            'humidity': 60, 'wind_speed': 3.0, 'dt': dt}
+
+class IngestTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.database_path = settings.database_path
+        settings.database_path = os.path.join(self.tmpdir.name, 'weather.db')
+        crud.create_tables()
+
+    def tearDown(self):
+        settings.database_path = self.database_path
+        self.tmpdir.cleanup()
+
+    def count_rows(self, table='weather'):
+        with crud.get_db_connection() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+class TestBatchWriter(IngestTestCase):
+
+    def test_database_uses_wal(self):
+        with crud.get_db_connection() as conn:
+            self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+
+    def test_save_batch_single_transaction(self):
+        rows = [make_row('Delhi', 1625247600 + i * 60) for i in range(100)]
+        self.assertEqual(crud.save_weather_data_batch(rows), 100)
+        self.assertEqual(self.count_rows(), 100)
+
+    def test_flush_by_size(self):
+        writer = WeatherWriter(batch_size=10, flush_interval=60)
+        writer.submit_many([make_row('Delhi', 1625247600 + i) for i in range(25)])
+        deadline = time.monotonic() + 5
+        while writer.rows_written < 20 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(writer.rows_written, 20)
+        self.assertEqual(writer.batches_written, 2)
+        writer.close()
+        self.assertEqual(self.count_rows(), 25)
+
+    def test_flush_by_time(self):
+        writer = WeatherWriter(batch_size=1000, flush_interval=0.05)
+        writer.submit(make_row('Mumbai', 1625247600))
+        deadline = time.monotonic() + 5
+        while writer.rows_written < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.count_rows(), 1)
+        writer.close()
+
+    def test_close_drains_queue(self):
+        writer = WeatherWriter(batch_size=1000, flush_interval=60)
+        writer.submit_many([make_row('Chennai', 1625247600 + i) for i in range(50)])
+        writer.close()
+        self.assertEqual(self.count_rows(), 50)
+        self.assertEqual(writer.queue_depth(), 0)
+
+class TestDailyRollups(IngestTestCase):
+
+    def test_rollup_maintained_at_ingest(self):
+        crud.save_weather_data_batch([
+            make_row('Delhi', 1625247600, temp=30.0, main='Clear'),
+            make_row('Delhi', 1625251200, temp=20.0, main='Rain'),
+            make_row('Delhi', 1625254800, temp=25.0, main='Rain'),
+        ])
+        summary = crud.get_daily_summary()
+        self.assertEqual(len(summary), 1)
+        self.assertEqual(summary[0]['avg_temp'], 25.0)
+        self.assertEqual(summary[0]['max_temp'], 30.0)
+        self.assertEqual(summary[0]['min_temp'], 20.0)
+        self.assertEqual(summary[0]['dominant_condition'], 'Rain')
+
+    def test_summary_does_not_grow_tables(self):
+        crud.save_weather_data_batch([make_row('Delhi', 1625247600)])
+        crud.get_daily_summary()
+        crud.get_daily_summary()
+        self.assertEqual(self.count_rows('daily_rollup'), 1)
+        self.assertEqual(self.count_rows('daily_condition'), 1)
+
+    def test_summary_date_and_city_filters(self):
+        day = 86400
+        crud.save_weather_data_batch([make_row(city, 1625247600 + i * day)
+                                      for city in ('Delhi', 'Mumbai') for i in range(5)])
+        summary = crud.get_daily_summary(city='Mumbai', start_date='2021-07-04', end_date='2021-07-05')
+        self.assertEqual([row['date'] for row in summary], ['2021-07-04', '2021-07-05'])
+        self.assertTrue(all(row['city'] == 'Mumbai' for row in summary))
+
+class TestAlertEngine(IngestTestCase):
+
+    def test_rules_evaluated_at_ingest(self):
+        crud.save_alert_rule('Delhi', 'Clear', 35.0)
+        crud.save_alert_rule('Delhi', 'Clear', 40.0)
+        crud.save_weather_data_batch([make_row('Delhi', 1625247600, temp=38.0, main='Clear'),
+                                      make_row('Delhi', 1625251200, temp=30.0, main='Clear'),
+                                      make_row('Delhi', 1625254800, temp=45.0, main='Rain'),
+                                      make_row('Mumbai', 1625247600, temp=45.0, main='Clear')])
+        alerts = crud.fetch_alerts()
+        self.assertEqual([(a['city'], a['temp_threshold'], a['alert_time']) for a in alerts],
+                         [('Delhi', 35.0, '1625247600')])
+
+    def test_alerts_deduplicated(self):
+        crud.save_alert_rule('Delhi', 'Clear', 35.0)
+        crud.save_alert_rule('Delhi', 'Clear', 35.0)
+        row = make_row('Delhi', 1625247600, temp=38.0, main='Clear')
+        crud.save_weather_data_batch([row])
+        crud.save_weather_data_batch([row])
+        crud.check_alert_thresholds('Delhi', 35.0, 'Clear')
+        self.assertEqual(len(crud.fetch_alerts()), 1)
+        self.assertEqual(len(crud.load_alert_rules()), 1)
+
+    def test_rules_reloaded_and_deleted(self):
+        crud.save_alert_rule('Delhi', 'Clear', 35.0)
+        alert_rules.load([])
+        crud.create_tables()
+        self.assertEqual(alert_rules.match('Delhi', 'Clear', 36.0), [35.0])
+        rule_id = crud.load_alert_rules()[0]['id']
+        self.assertTrue(crud.delete_alert_rule(rule_id))
+        self.assertEqual(alert_rules.match('Delhi', 'Clear', 36.0), [])
+        self.assertFalse(crud.delete_alert_rule(rule_id))
+
+class TestRetention(IngestTestCase):
+
+    now = 1625270400 + 30 * 86400
+
+    def setUp(self):
+        super().setUp()
+        old = self.now - 10 * 86400
+        recent = self.now - 3600
+        crud.save_weather_data_batch([make_row('Delhi', old + i * 600, temp=20.0 + i) for i in range(12)] +
+                                     [make_row('Delhi', recent + i * 600, temp=30.0) for i in range(3)])
+
+    def test_compaction_rolls_up_and_deletes_raw(self):
+        result = retention.compact(now=self.now)
+        self.assertEqual(result['raw_deleted'], 12)
+        self.assertEqual(result['hourly_upserted'], 2)
+        self.assertEqual(self.count_rows('weather'), 3)
+        with crud.get_db_connection() as conn:
+            hours = conn.execute("SELECT temp_count, temp_min, temp_max FROM weather_hourly ORDER BY hour").fetchall()
+            self.assertEqual([tuple(h) for h in hours], [(6, 20.0, 25.0), (6, 26.0, 31.0)])
+            self.assertEqual(conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+        # Daily rollups outlive the raw rows.
+        self.assertEqual(sum(1 for row in crud.get_daily_summary() if row['city'] == 'Delhi'), 2)
+
+    def test_compaction_is_incremental(self):
+        retention.compact(now=self.now)
+        self.assertEqual(retention.compact(now=self.now)['raw_deleted'], 0)
+        retention.compact(now=self.now + 100 * 86400)
+        self.assertEqual(self.count_rows('weather_hourly'), 0)
+
+    def test_series_picks_coarsest_sufficient_tier(self):
+        retention.compact(now=self.now)
+        day = 86400
+        recent = retention.get_weather_series('Delhi', self.now - 2 * 3600, self.now, now=self.now)
+        self.assertEqual(recent['resolution'], 'raw')
+        self.assertEqual(len(recent['points']), 3)
+        month = retention.get_weather_series('Delhi', self.now - 20 * day, self.now, now=self.now)
+        self.assertEqual(month['resolution'], 'hourly')
+        self.assertEqual([p['count'] for p in month['points']], [6, 6, 3])
+        year = retention.get_weather_series('Delhi', self.now - 365 * day, self.now, now=self.now)
+        self.assertEqual(year['resolution'], 'daily')
+        self.assertEqual(sum(p['count'] for p in year['points']), 15)
+
+class TestForecastStore(IngestTestCase):
+
+    issued = 1625270400
+
+    def forecast(self, offset_hours, temp, main='Clear'):
+        return make_row('Delhi', self.issued + offset_hours * 3600, temp=temp, main=main)
+
+    def test_upsert_per_issue(self):
+        crud.save_forecasts([self.forecast(3, 20.0), self.forecast(6, 21.0)], self.issued)
+        crud.save_forecasts([self.forecast(3, 22.0), self.forecast(6, 23.0)], self.issued)
+        crud.save_forecasts([self.forecast(6, 24.0)], self.issued + 3600)
+        self.assertEqual(self.count_rows('forecast'), 3)
+        self.assertEqual(self.count_rows('weather'), 0)
+        issued_at, entries = crud.get_latest_forecast('Delhi')
+        self.assertEqual(issued_at, self.issued + 3600)
+        self.assertEqual([e['temp'] for e in entries], [24.0])
+
+    def test_forecast_error_by_lead_time(self):
+        crud.save_forecasts([self.forecast(3, 20.0), self.forecast(6, 21.0, main='Rain'),
+                             self.forecast(9, 30.0)], self.issued)
+        # Observations within 30 minutes of two targets; the nearest one wins.
+        crud.save_weather_data_batch([make_row('Delhi', self.issued + 3 * 3600 + 600, temp=22.0),
+                                      make_row('Delhi', self.issued + 3 * 3600 - 1500, temp=0.0),
+                                      make_row('Delhi', self.issued + 6 * 3600, temp=20.0),
+                                      make_row('Delhi', self.issued + 9 * 3600 + 3600, temp=0.0)])
+        errors = crud.get_forecast_error('Delhi')
+        self.assertEqual([e['lead_hours'] for e in errors], [3, 6, 9])
+        self.assertEqual((errors[0]['matched'], errors[0]['bias'], errors[0]['condition_accuracy']), (1, -2.0, 1.0))
+        self.assertEqual((errors[1]['bias'], errors[1]['rmse'], errors[1]['condition_accuracy']), (1.0, 1.0, 0.0))
+        self.assertEqual((errors[2]['forecasts'], errors[2]['matched'], errors[2]['mae']), (1, 0, None))
+        coarse = crud.get_forecast_error('Delhi', bucket_hours=24)
+        self.assertEqual([(e['lead_hours'], e['forecasts'], e['matched']) for e in coarse], [(0, 3, 2)])
+
+    def test_forecast_error_uses_indexes(self):
+        with crud.get_db_connection() as conn:
+            plan = " | ".join(row['detail'] for row in conn.execute("""
+                EXPLAIN QUERY PLAN
+                SELECT f.temp, o.temp, MIN(ABS(o.dt - f.target_dt))
+                FROM forecast f
+                LEFT JOIN weather o ON o.city = f.city AND o.dt BETWEEN f.target_dt - 1800 AND f.target_dt + 1800
+                WHERE f.city = 'Delhi' AND f.target_dt >= 0
+                GROUP BY f.city, f.target_dt, f.issued_at
+            """))
+        self.assertIn('SEARCH f USING PRIMARY KEY', plan)
+        self.assertIn('SEARCH o USING INDEX idx_weather_city_dt', plan)
+
+    def test_old_forecasts_compacted(self):
+        crud.save_forecasts([self.forecast(3, 20.0)], self.issued)
+        self.assertEqual(retention.compact(now=self.issued + 30 * 86400)['forecast_deleted'], 1)
+
+class TestBackfill(IngestTestCase):
+
+    def write(self, name, text):
+        path = os.path.join(self.tmpdir.name, name)
+        with (gzip.open(path, 'wt') if name.endswith('.gz') else open(path, 'w')) as f:
+            f.write(text)
+        return path
+
+    def csv_history(self, count=10):
+        lines = ["city,main,temp,feels_like,humidity,wind_speed,dt"]
+        lines += [f"{('Delhi', 'Mumbai')[i % 2]},Clear,{20 + i},{19 + i},50,2.5,{1625097600 + i * 3600}"
+                  for i in range(count)]
+        return self.write('history.csv', "\n".join(lines) + "\n")
+
+    def weather_objects(self):
+        with crud.get_db_connection() as conn:
+            return {row['name'] for row in conn.execute("SELECT name FROM sqlite_master WHERE tbl_name = 'weather'")}
+
+    def test_csv_import_rebuilds_rollups(self):
+        objects = self.weather_objects()
+        crud.save_weather_data_batch([make_row('Delhi', 1625097600, temp=99.0)])
+        totals = backfill.backfill([self.csv_history()], workers=1, chunk_size=3)
+        self.assertEqual((totals['records'], totals['inserted'], totals['rejected']), (10, 9, 0))
+        self.assertEqual(self.count_rows(), 10)
+        self.assertEqual(self.weather_objects(), objects)
+        self.assertEqual(self.count_rows('backfill_deferred'), 0)
+        delhi = crud.get_daily_summary(city='Delhi')[0]
+        self.assertEqual((delhi['max_temp'], delhi['min_temp']), (99.0, 22.0))
+        # The restored trigger keeps maintaining the rollups.
+        crud.save_weather_data_batch([make_row('Pune', 1625097600)])
+        self.assertEqual(crud.get_daily_summary(city='Pune')[0]['avg_temp'], 25.0)
+
+    def test_openweather_formats(self):
+        bulk = [{"city_name": "Delhi", "dt": 1625097600 + i * 3600, "weather": [{"main": "Haze"}],
+                 "main": {"temp": 300.15, "feels_like": 301.15, "humidity": 70}, "wind": {"speed": 1.5}}
+                for i in range(5)]
+        history = {"city": {"name": "Pune"}, "list": [dict(bulk[0], city_name=None)]}
+        lines = [json.dumps(dict(bulk[0], name="Mumbai", city_name=None)), "",
+                 json.dumps({"city": "Chennai", "main": "Rain", "temp": 30.5, "humidity": 90, "dt": 1625097600}),
+                 "{not json"]
+        paths = [self.write('bulk.json', json.dumps(bulk, indent=1)), self.write('history.json', json.dumps(history)),
+                 self.write('api.jsonl.gz', "\n".join(lines)),
+                 self.write('bulk.csv', "dt,city_name,temp,feels_like,humidity,wind_speed,weather_main\n"
+                                        "1625097600,Kolkata,310.15,,80,4.0,Rain\nbad,Kolkata,,,,,\n")]
+        totals = backfill.backfill(paths, workers=1, chunk_size=2)
+        self.assertEqual((totals['inserted'], totals['rejected']), (9, 2))
+        summary = {row['city']: row for row in crud.get_daily_summary()}
+        self.assertEqual(sorted(summary), ['Chennai', 'Delhi', 'Kolkata', 'Mumbai', 'Pune'])
+        self.assertEqual(summary['Delhi']['avg_temp'], 27.0)
+        self.assertEqual(summary['Delhi']['dominant_condition'], 'Haze')
+        self.assertEqual(summary['Chennai']['avg_temp'], 30.5)
+        self.assertEqual(summary['Kolkata']['max_temp'], 37.0)
+
+    def test_resumes_after_interruption(self):
+        path = self.csv_history()
+        parse_chunk = backfill.parse_chunk
+        calls = []
+
+        def failing_parse(*args):
+            calls.append(args)
+            if len(calls) == 3:
+                raise KeyboardInterrupt
+            return parse_chunk(*args)
+
+        with patch('app.backfill.parse_chunk', side_effect=failing_parse):
+            with self.assertRaises(KeyboardInterrupt):
+                backfill.backfill([path], workers=1, chunk_size=4)
+        # Committed chunks stay, and the deferred indexes are back.
+        self.assertEqual(self.count_rows(), 8)
+        self.assertEqual(self.count_rows('backfill_deferred'), 0)
+        self.assertIn('weather_daily_rollup', self.weather_objects())
+        with patch('app.backfill.parse_chunk', side_effect=backfill.parse_chunk) as parse:
+            totals = backfill.backfill([path], workers=1, chunk_size=4)
+            self.assertEqual(parse.call_count, 1)
+        self.assertEqual((totals['records'], totals['inserted']), (2, 2))
+        self.assertEqual(self.count_rows(), 10)
+        self.assertEqual(backfill.backfill([path], workers=1)['records'], 0)
+        self.assertEqual(backfill.backfill([path], workers=1, restart=True)['inserted'], 0)
+
+    def test_restores_indexes_left_by_killed_run(self):
+        with crud.get_db_connection() as conn:
+            backfill.defer_indexes(conn)
+        self.assertNotIn('idx_weather_dt', self.weather_objects())
+        backfill.backfill([])
+        self.assertIn('idx_weather_dt', self.weather_objects())
+
+    def test_parallel_workers(self):
+        totals = backfill.backfill([self.csv_history(100)], workers=2, chunk_size=7)
+        self.assertEqual(totals['inserted'], 100)
+        self.assertEqual(len(crud.get_daily_summary()), 10)
+
+class TestRollingStats(IngestTestCase):
+
+    def test_matches_brute_force(self):
+        windows = parse_windows("10m,1h,3h")
+        self.assertEqual(list(windows), ['10m', '1h', '3h'])
+        rng = random.Random(7)
+        series = CitySeries(50, windows.values())
+        readings = []
+        dt = now = 1625097600
+        for _ in range(500):
+            dt += rng.choice([60, 120, 300, 900])
+            temp = round(rng.uniform(-10, 45), 2)
+            self.assertTrue(series.append(dt, temp))
+            self.assertFalse(series.append(dt, temp))
+            readings.append((dt, temp))
+            now = max(now, dt + rng.choice([0, 0, 600, 3600]))
+            for seconds, stats in zip(windows.values(), series.stats(now)):
+                # The ring buffer keeps the last 50 readings only.
+                expected = [t for d, t in readings[-50:] if d > now - seconds]
+                self.assertEqual(stats['count'], len(expected))
+                if expected:
+                    self.assertEqual((stats['min'], stats['max']), (min(expected), max(expected)))
+                    self.assertAlmostEqual(stats['mean'], sum(expected) / len(expected), delta=0.0051)
+
+    def test_fed_by_ingest_and_rebuilt(self):
+        now = int(time.time())
+        crud.save_weather_data_batch([make_row('Delhi', now - 7200, temp=30.0),
+                                      make_row('Delhi', now - 1800, temp=36.0),
+                                      make_row(' delhi', now - 600, temp=33.0),
+                                      make_row('Mumbai', now - 90000, temp=28.0)])
+        stats = rolling_stats.get('Delhi', now)
+        self.assertEqual(stats['latest'], {'dt': now - 600, 'temp': 33.0})
+        self.assertEqual(stats['windows']['1h'],
+                         {'count': 2, 'min': 33.0, 'max': 36.0, 'mean': 34.5, 'since': now - 1800})
+        self.assertEqual(stats['windows']['3h']['mean'], 33.0)
+        self.assertIsNone(rolling_stats.get('Mumbai', now))
+        self.assertIsNone(rolling_stats.get('Paris', now))
+        rebuilt = RollingStats()
+        rebuilt.rebuild()
+        self.assertEqual(rebuilt.get('Delhi', now), stats)
+        self.assertEqual(len(rebuilt), 1)
+
+    def test_picks_up_rows_from_other_writers(self):
+        now = int(time.time())
+        crud.save_weather_data_batch([make_row('Delhi', now - 600, temp=30.0)])
+        # Rows written by another process never pass through this one's ingest path.
+        with crud.get_db_connection() as conn:
+            conn.execute("""
+                INSERT INTO weather (city, main, temp, feels_like, humidity, wind_speed, dt)
+                VALUES ('Delhi', 'Clear', 40.0, 39.0, 60, 3.0, ?)
+            """, (now - 60,))
+        self.assertEqual(rolling_stats.get('Delhi', now)['windows']['1h']['count'], 1)
+        with patch.object(settings, 'rolling_sync_interval', 0):
+            self.assertEqual(rolling_stats.get('Delhi', now)['windows']['1h']['max'], 40.0)
+
+class TestMigrations(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.database_path = settings.database_path
+        settings.database_path = os.path.join(self.tmpdir.name, 'weather.db')
+        # A pre-versioning database as created by the original create_tables.
+        with crud.get_db_connection() as conn:
+            conn.execute("""CREATE TABLE weather (id INTEGER PRIMARY KEY AUTOINCREMENT, city TEXT NOT NULL,
+                main TEXT NOT NULL, temp REAL NOT NULL, feels_like REAL NOT NULL, humidity INTEGER NOT NULL,
+                wind_speed REAL NOT NULL, dt INTEGER NOT NULL)""")
+            conn.execute("""CREATE TABLE daily_summary (id INTEGER PRIMARY KEY AUTOINCREMENT, city TEXT NOT NULL,
+                date TEXT NOT NULL)""")
+            conn.execute("""CREATE TABLE alerts (id INTEGER PRIMARY KEY AUTOINCREMENT, city TEXT NOT NULL,
+                condition TEXT NOT NULL, temp_threshold REAL NOT NULL, alert_time TEXT NOT NULL)""")
+            rows = [('Delhi', 'Rain', 10.0, 9.0, 80, 2.0, 1625247600),
+                    ('Delhi', 'Rain', 10.0, 9.0, 80, 2.0, 1625247600),
+                    ('Delhi', 'Clear', 20.0, 19.0, 60, 2.0, 1625251200)]
+            conn.executemany("INSERT INTO weather (city, main, temp, feels_like, humidity, wind_speed, dt) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.executemany("INSERT INTO alerts (city, condition, temp_threshold, alert_time) VALUES (?, ?, ?, ?)",
+                             [('Delhi', 'Rain', 5.0, '1625247600')] * 2)
+
+    def tearDown(self):
+        settings.database_path = self.database_path
+        self.tmpdir.cleanup()
+
+    def test_upgrade_in_place(self):
+        crud.create_tables()
+        with crud.get_db_connection() as conn:
+            self.assertEqual(get_schema_version(conn), LATEST_VERSION)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM weather").fetchone()[0], 2)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM alerts").fetchone()[0], 1)
+            indexes = {row['name'] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+            self.assertTrue({'idx_weather_city_dt', 'idx_weather_city_main_temp', 'idx_alerts_unique'} <= indexes)
+            tables = {row['name'] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            self.assertNotIn('daily_summary', tables)
+        self.assertEqual(crud.get_daily_summary()[0]['avg_temp'], 15.0)
+
+    def test_future_rows_moved_to_forecast(self):
+        with crud.get_db_connection() as conn:
+            conn.execute("INSERT INTO weather (city, main, temp, feels_like, humidity, wind_speed, dt) "
+                         "VALUES ('Delhi', 'Rain', 50.0, 49.0, 80, 2.0, ?)", (int(time.time()) + 86400,))
+        crud.create_tables()
+        self.assertEqual(len(crud.get_daily_summary()), 1)
+        self.assertEqual(crud.get_latest_forecast('Delhi')[1][0]['temp'], 50.0)
+
+    def test_repeated_rows_deduplicated(self):
+        crud.create_tables()
+        crud.save_weather_data_batch([make_row('Delhi', 1625251200, temp=40.0)])
+        summary = crud.get_daily_summary()
+        self.assertEqual(summary[0]['max_temp'], 20.0)
+        crud.check_alert_thresholds('Delhi', 5.0, 'Rain')
+        crud.check_alert_thresholds('Delhi', 5.0, 'Rain')
+        self.assertEqual(len(crud.fetch_alerts()), 1)
+
+    def test_migrate_is_idempotent(self):
+        crud.create_tables()
+        crud.create_tables()
+        with crud.get_db_connection() as conn:
+            self.assertEqual(migrate(conn), LATEST_VERSION)
+
+if __name__ == '__main__':
+    unittest.main()
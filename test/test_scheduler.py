@@ -0,0 +1,179 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import crud
+from app.config import settings
+from app.coordination import Coordinator, HashRing, LEASE_NAME, lease_holder
+from app import scheduler, registry
+
+class FakeClock:
+    def __init__(self, now=1700000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+class SchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # Cleanups run last-in first-out, so coordinators added by the
+        # tests are stopped before the database goes away.
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.addCleanup(setattr, settings, 'database_path', settings.database_path)
+        settings.database_path = os.path.join(tmpdir.name, 'weather.db')
+        crud.create_tables()
+        self.clock = FakeClock()
+
+    def coordinator(self, node_id, sharding=False):
+        # tick() is driven by the tests instead of the heartbeat thread.
+        coordinator = Coordinator(node_id, lease_ttl=30, heartbeat_interval=3600, sharding=sharding,
+                                  clock=self.clock)
+        coordinator.start()
+        self.addCleanup(coordinator.stop)
+        return coordinator
+
+class TestLeaderElection(SchedulerTestCase):
+
+    def test_single_leader(self):
+        a = self.coordinator('node-a')
+        b = self.coordinator('node-b')
+        self.assertTrue(a.is_leader)
+        self.assertFalse(b.is_leader)
+        cities = ['Delhi', 'Mumbai', 'Chennai']
+        self.assertEqual(a.assigned(cities), cities)
+        self.assertEqual(b.assigned(cities), [])
+        with crud.get_db_connection() as conn:
+            self.assertEqual(lease_holder(conn, LEASE_NAME, self.clock.now), 'node-a')
+
+    def test_failover_after_lease_expires(self):
+        a = self.coordinator('node-a')
+        b = self.coordinator('node-b')
+        self.clock.now += 20
+        a.tick()
+        b.tick()
+        self.assertTrue(a.is_leader)
+        self.assertFalse(b.is_leader)
+        # node-a stops renewing; its lease runs out 30s after the last renewal.
+        self.clock.now += 31
+        self.assertFalse(a.is_leader)
+        b.tick()
+        self.assertTrue(b.is_leader)
+        a.tick()
+        self.assertFalse(a.is_leader)
+
+    def test_stop_releases_lease(self):
+        a = self.coordinator('node-a')
+        b = self.coordinator('node-b')
+        a.stop()
+        b.tick()
+        self.assertTrue(b.is_leader)
+
+    def test_compaction_only_on_leader(self):
+        self.coordinator('node-a')
+        follower = self.coordinator('node-b')
+        with patch('app.scheduler.coordinator', follower), patch('app.scheduler.compact') as compact:
+            scheduler.compact_if_leader()
+        compact.assert_not_called()
+
+class TestSharding(SchedulerTestCase):
+
+    def test_cities_partitioned_across_nodes(self):
+        cities = [f'City{i}' for i in range(300)]
+        nodes = [self.coordinator(f'node-{i}', sharding=True) for i in range(3)]
+        for node in nodes:
+            node.tick()
+        shards = [set(node.assigned(cities)) for node in nodes]
+        self.assertEqual(set().union(*shards), set(cities))
+        self.assertEqual(sum(len(shard) for shard in shards), len(cities))
+        self.assertTrue(all(shard for shard in shards))
+
+    def test_rebalance_when_node_dies(self):
+        cities = [f'City{i}' for i in range(300)]
+        a, b, c = [self.coordinator(f'node-{i}', sharding=True) for i in range(3)]
+        for node in (a, b, c):
+            node.tick()
+        before = set(a.assigned(cities))
+        self.clock.now += 31
+        b.tick()
+        a.tick()
+        self.assertEqual(a.nodes, ['node-0', 'node-1'])
+        after = set(a.assigned(cities))
+        self.assertEqual(after | set(b.assigned(cities)), set(cities))
+        # Consistent hashing: node-0 keeps its cities and only gains node-2's.
+        self.assertTrue(before <= after)
+
+    def test_ring_is_stable(self):
+        ring = HashRing(['node-a', 'node-b'])
+        self.assertEqual(ring.owner('delhi'), HashRing(['node-b', 'node-a']).owner('delhi'))
+        self.assertIsNone(HashRing([]).owner('delhi'))
+
+def reading(city, temp, main='Clear'):
+    return {'city': city, 'main': main, 'temp': temp, 'feels_like': temp, 'humidity': 50,
+            'wind_speed': 2.0, 'dt': 1700000000}
+
+class TestCityRegistry(SchedulerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for name in ('upstream_requests_per_minute', 'poll_tick_seconds'):
+            self.addCleanup(setattr, settings, name, getattr(settings, name))
+
+    def schedule(self):
+        return {city['name']: city for city in registry.list_cities()}
+
+    def test_seeded_and_editable(self):
+        self.assertEqual(len(self.schedule()), 6)
+        self.assertTrue(registry.add_city('Pune'))
+        self.assertFalse(registry.add_city('pune'))
+        self.assertTrue(registry.remove_city('PUNE'))
+        self.assertFalse(registry.remove_city('Pune'))
+        self.assertNotIn('Pune', self.schedule())
+
+    def test_adaptive_interval(self):
+        self.assertEqual(registry.next_interval(300, None, (20.0, 'Clear')), 300)
+        self.assertEqual(registry.next_interval(300, (20.0, 'Clear'), (20.2, 'Clear')), 450)
+        self.assertEqual(registry.next_interval(300, (20.0, 'Clear'), (22.0, 'Clear')), 150)
+        self.assertEqual(registry.next_interval(300, (20.0, 'Clear'), (20.0, 'Rain')), 150)
+        self.assertEqual(registry.next_interval(settings.poll_interval_max, (20.0, 'Clear'), (20.0, 'Clear')),
+                         settings.poll_interval_max)
+        self.assertEqual(registry.next_interval(settings.poll_interval_min, (20.0, 'Clear'), (30.0, 'Clear')),
+                         settings.poll_interval_min)
+
+    def test_poll_due_respects_budget(self):
+        settings.upstream_requests_per_minute = 12
+        settings.poll_tick_seconds = 10
+        now = self.clock.now
+        with patch('app.scheduler.fetch_weather_data', side_effect=lambda city: reading(city, 25.0)) as fetch, \
+             patch('app.scheduler.fetch_weather_forecast') as forecast:
+            self.assertEqual(scheduler.poll_due(now), {'weather': 2, 'forecasts': 0})
+            self.assertEqual(fetch.call_count, 2)
+            forecast.assert_not_called()
+            for _ in range(2):
+                scheduler.poll_due(now)
+            self.assertEqual(fetch.call_count, 6)
+            # Everything polled; the spare budget now goes to forecasts.
+            self.assertEqual(scheduler.poll_due(now), {'weather': 0, 'forecasts': 2})
+        schedule = self.schedule()
+        for city in schedule.values():
+            self.assertEqual(city['last_temp'], 25.0)
+            self.assertGreaterEqual(city['next_poll_at'], now + 300 * (1 - registry.JITTER))
+            self.assertLessEqual(city['next_poll_at'], now + 300 * (1 + registry.JITTER))
+        self.assertEqual(len({city['next_poll_at'] for city in schedule.values()}), 6)
+
+    def test_interval_follows_conditions(self):
+        registry.record_observations({'Delhi': reading('Delhi', 25.0), 'Mumbai': reading('Mumbai', 25.0)}, 1000)
+        registry.record_observations({'Delhi': reading('Delhi', 25.1), 'Mumbai': reading('Mumbai', 29.0)}, 1300)
+        registry.record_observations({'Delhi': 'Error fetching weather data', 'Mumbai': reading('Mumbai', 33.0)}, 1600)
+        schedule = self.schedule()
+        self.assertEqual(schedule['Delhi']['poll_interval'], 450)
+        self.assertEqual(schedule['Delhi']['last_temp'], 25.1)
+        self.assertEqual(schedule['Mumbai']['poll_interval'], settings.poll_interval_min)
+
+if __name__ == '__main__':
+    unittest.main()
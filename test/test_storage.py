@@ -0,0 +1,132 @@
+import unittest
+import sys
+import os
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from app import crud, storage, analytics
+from app.config import settings
+
+DAY = 86400
+START = 1625097600  # 2021-07-01 00:00 UTC
+
+def make_params(city, dt, temp=25.0, main='Clear', humidity=60, wind_speed=3.0):
+    return (city, main, temp, temp - 1, humidity, wind_speed, dt)
+
+def sample_params():
+    params = []
+    for c, city in enumerate(('Delhi', 'Mumbai', 'Chennai')):
+        for day in range(4):
+            for hour in range(0, 24, 3):
+                dt = START + day * DAY + hour * 3600
+                main = ('Clear', 'Rain', 'Clouds')[(hour // 3 + day + c) % 3]
+                params.append(make_params(city, dt, temp=20.0 + c + hour * 0.37 + day,
+                                          main=main, humidity=40 + hour, wind_speed=1.5 + day))
+    # Repeated keys are ignored, and a one-all tie picks the first condition by name.
+    params.append(make_params('Delhi', START, temp=99.0))
+    params.extend([make_params('Pune', START + 60, main='Rain'), make_params('Pune', START + 120, main='Haze')])
+    return params
+
+class StorageParity:
+    # Runs against every backend; subclasses provide make_storage().
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.database_path = settings.database_path
+        settings.database_path = os.path.join(self.tmpdir.name, 'weather.db')
+        crud.create_tables()
+        self.storage = self.make_storage()
+        self.storage.save_weather(sample_params())
+
+    def tearDown(self):
+        self.storage.close()
+        settings.database_path = self.database_path
+        self.tmpdir.cleanup()
+
+    def test_daily_summary(self):
+        summary = self.storage.daily_summary()
+        self.assertEqual(len(summary), 13)
+        self.assertEqual(summary[0]['city'], 'Chennai')
+        pune = [row for row in summary if row['city'] == 'Pune']
+        self.assertEqual(pune[0]['dominant_condition'], 'Haze')
+        delhi = next(row for row in summary if row['city'] == 'Delhi')
+        self.assertEqual(delhi['date'], '2021-07-01')
+        self.assertEqual(delhi['max_temp'], 27.77)
+        self.assertEqual(delhi['min_temp'], 20.0)
+        self.assertEqual(delhi['avg_temp'], 23.89)
+
+    def test_filters_and_pages(self):
+        rows = self.storage.daily_summary(city='Mumbai', start_date='2021-07-02', end_date='2021-07-03')
+        self.assertEqual([row['date'] for row in rows], ['2021-07-02', '2021-07-03'])
+        first = self.storage.daily_summary(limit=5)
+        rest = self.storage.daily_summary(after=(first[-1]['city'], first[-1]['date']))
+        self.assertEqual(first + rest, self.storage.daily_summary())
+        self.assertEqual(list(self.storage.iter_daily_summary(city='Pune')),
+                         self.storage.daily_summary(city='Pune'))
+
+    def test_scan(self):
+        columns = self.storage.scan(['Delhi', 'Nowhere'], START + DAY, START + 2 * DAY - 1)
+        self.assertEqual(len(columns['Delhi']['dt']), 8)
+        self.assertTrue(np.all(np.diff(columns['Delhi']['dt']) > 0))
+        self.assertEqual(columns['Delhi']['wind_speed'][0], 2.5)
+        self.assertEqual(len(columns['Nowhere']['temp']), 0)
+        self.assertEqual(sorted(self.storage.scan(None, START, START + 4 * DAY)),
+                         ['Chennai', 'Delhi', 'Mumbai', 'Pune'])
+
+class TestSQLiteStorage(StorageParity, unittest.TestCase):
+
+    def make_storage(self):
+        return storage.SQLiteStorage()
+
+@unittest.skipUnless(storage.duckdb is not None, "duckdb is not installed")
+class TestDuckDBStorage(StorageParity, unittest.TestCase):
+
+    def make_storage(self):
+        return storage.DuckDBStorage(os.path.join(self.tmpdir.name, 'direct.duckdb'))
+
+    def test_matches_sqlite(self):
+        reference = storage.SQLiteStorage()
+        reference.save_weather(sample_params())
+        self.assertEqual(self.storage.daily_summary(), reference.daily_summary())
+        ours = self.storage.scan(None, START, START + 4 * DAY)
+        theirs = reference.scan(None, START, START + 4 * DAY)
+        for city, columns in theirs.items():
+            for name in storage.SCAN_COLUMNS:
+                np.testing.assert_array_equal(ours[city][name], columns[name])
+
+@unittest.skipUnless(storage.duckdb is not None, "duckdb is not installed")
+class TestDuckDBReplica(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.addCleanup(setattr, settings, 'database_path', settings.database_path)
+        self.addCleanup(setattr, settings, 'storage_backend', settings.storage_backend)
+        self.addCleanup(storage.close)
+        settings.database_path = os.path.join(self.tmpdir.name, 'weather.db')
+        crud.create_tables()
+        settings.storage_backend = 'duckdb'
+
+    def save(self, params):
+        crud.save_weather_data_batch([{'city': p[0], 'main': p[1], 'temp': p[2], 'feels_like': p[3],
+                                       'humidity': p[4], 'wind_speed': p[5], 'dt': p[6]} for p in params])
+
+    def test_reads_follow_sqlite_writes(self):
+        self.assertEqual(storage.get_storage().name, 'duckdb')
+        self.save(sample_params()[:40])
+        self.assertEqual(len(crud.get_daily_summary()), 5)
+        self.save(sample_params()[40:])
+        self.assertEqual(crud.get_daily_summary(), storage.SQLiteStorage().daily_summary())
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir.name, 'weather.duckdb')))
+
+    def test_analytics_scan_columnar_store(self):
+        self.save(sample_params())
+        stats = analytics.range_stats(['Delhi'], START, START + DAY - 1, [50])
+        self.assertEqual(stats['Delhi']['count'], 8)
+        settings.storage_backend = 'sqlite'
+        self.assertEqual(analytics.range_stats(['Delhi'], START, START + DAY - 1, [50]), stats)
+
+if __name__ == '__main__':
+    unittest.main()
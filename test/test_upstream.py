@@ -0,0 +1,289 @@
+import asyncio
+import unittest
+import sys
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import upstream
+from app.config import settings
+from app.cache import TTLCache
+from bench.mock_openweather import start_mock_server
+
+class TestUpstream(unittest.TestCase):
+
+    def setUp(self):
+        self.server, self.base_url = start_mock_server(latency=0.05)
+        self.addCleanup(setattr, settings, 'upstream_rate_limit', settings.upstream_rate_limit)
+        settings.upstream_rate_limit = False
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        upstream.close()
+
+    def test_fetch_many_runs_concurrently(self):
+        cities = [f"City{i}" for i in range(8)]
+        results = upstream.fetch_many(
+            lambda city: upstream.get_json(f"{self.base_url}/weather?q={city}&appid=test"), cities)
+        self.assertEqual(set(results), set(cities))
+        self.assertEqual(results["City3"]["name"], "City3")
+        self.assertEqual(self.server.request_count, 8)
+
+    def test_forecast_payload_shape(self):
+        data = upstream.get_json(f"{self.base_url}/forecast?q=Delhi&appid=test")
+        self.assertEqual(len(data["list"]), 40)
+        self.assertIn("temp", data["list"][0]["main"])
+
+    def test_async_client(self):
+        async def fetch_all():
+            results = await asyncio.gather(*[
+                upstream.get_json_async(f"{self.base_url}/weather?q=City{i}&appid=test") for i in range(20)])
+            client = upstream.get_async_client()
+            await upstream.aclose()
+            return results, client
+        start = time.perf_counter()
+        results, client = asyncio.run(fetch_all())
+        # All 20 requests overlap on one event loop thread.
+        self.assertLess(time.perf_counter() - start, 20 * 0.05)
+        self.assertEqual(results[7]["name"], "City7")
+        self.assertTrue(client.is_closed)
+
+    def test_session_is_shared(self):
+        self.assertIs(upstream.get_session(), upstream.get_session())
+        self.assertEqual(upstream.get_executor()._max_workers, settings.fetch_concurrency)
+
+class TestResilience(unittest.TestCase):
+
+    def setUp(self):
+        self.server, self.base_url = start_mock_server()
+        self.server.retry_after = 0
+        self.url = f"{self.base_url}/weather?q=Delhi&appid=test"
+        for name in ('fetch_retries', 'fetch_backoff_base', 'fetch_read_timeout', 'circuit_failure_threshold',
+                     'circuit_reset_timeout', 'upstream_rate_limit', 'upstream_burst', 'rate_limit_max_wait'):
+            self.addCleanup(setattr, settings, name, getattr(settings, name))
+        settings.fetch_backoff_base = 0.01
+        settings.upstream_rate_limit = False
+        self.addCleanup(upstream.close)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        upstream.close()
+
+    def test_retries_transient_failures(self):
+        self.server.faults.extend(["error", "drop"])
+        self.assertEqual(upstream.get_json(self.url)["name"], "Delhi")
+        self.assertEqual(self.server.request_count, 3)
+
+    def test_structured_error_after_retries(self):
+        settings.fetch_retries = 2
+        self.server.faults.extend(["unavailable"] * 3)
+        with self.assertRaises(upstream.UpstreamError) as caught:
+            upstream.get_json(self.url)
+        self.assertEqual((caught.exception.kind, caught.exception.status), ("http", 503))
+        self.assertEqual(caught.exception.attempts, 3)
+        self.assertEqual(caught.exception.retry_after, 0)
+        self.assertEqual(caught.exception.http_status, 503)
+
+    def test_client_errors_are_not_retried(self):
+        with self.assertRaises(upstream.UpstreamError) as caught:
+            upstream.get_json(f"{self.base_url}/nowhere?q=Delhi")
+        self.assertEqual(caught.exception.kind, "not_found")
+        self.assertEqual(caught.exception.http_status, 404)
+        self.assertEqual(self.server.request_count, 1)
+        self.assertEqual(upstream.get_breaker(urlsplit(self.url).netloc).failures, 0)
+
+    def test_read_timeout(self):
+        settings.fetch_read_timeout = 0.2
+        settings.fetch_retries = 0
+        self.server.hang_seconds = 1.0
+        self.server.faults.append("hang")
+        start = time.perf_counter()
+        with self.assertRaises(upstream.UpstreamError) as caught:
+            upstream.get_json(self.url)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual(caught.exception.kind, "timeout")
+        self.assertEqual(caught.exception.http_status, 504)
+
+    def test_throttle_honours_retry_after(self):
+        self.server.retry_after = 0.3
+        self.server.faults.append("throttle")
+        start = time.perf_counter()
+        self.assertEqual(upstream.get_json(self.url)["name"], "Delhi")
+        self.assertGreaterEqual(time.perf_counter() - start, 0.3)
+
+    def test_circuit_opens_and_recovers(self):
+        settings.fetch_retries = 0
+        settings.circuit_failure_threshold = 2
+        settings.circuit_reset_timeout = 0.2
+        self.server.faults.extend(["error", "error"])
+        for _ in range(2):
+            with self.assertRaises(upstream.UpstreamError):
+                upstream.get_json(self.url)
+        with self.assertRaises(upstream.UpstreamError) as caught:
+            upstream.get_json(self.url)
+        self.assertEqual(caught.exception.kind, "circuit_open")
+        self.assertEqual(self.server.request_count, 2)
+        time.sleep(0.2)
+        self.assertEqual(upstream.get_json(self.url)["name"], "Delhi")
+        self.assertEqual(upstream.get_breaker(urlsplit(self.url).netloc).state, "closed")
+
+    def test_request_budget(self):
+        settings.upstream_rate_limit = True
+        settings.upstream_burst = 1
+        settings.rate_limit_max_wait = 0
+        upstream.get_json(self.url)
+        with self.assertRaises(upstream.UpstreamError) as caught:
+            upstream.get_json(self.url)
+        self.assertEqual(caught.exception.kind, "rate_limited")
+        self.assertEqual(caught.exception.http_status, 503)
+        self.assertEqual(self.server.request_count, 1)
+
+    def test_async_client_retries(self):
+        self.server.faults.extend(["error", "drop"])
+
+        async def fetch():
+            try:
+                data = await upstream.get_json_async(self.url)
+                with self.assertRaises(upstream.UpstreamError) as caught:
+                    await upstream.get_json_async(f"{self.base_url}/nowhere?q=Delhi")
+                return data, caught.exception
+            finally:
+                await upstream.aclose()
+
+        data, error = asyncio.run(fetch())
+        self.assertEqual(data["name"], "Delhi")
+        self.assertEqual(error.kind, "not_found")
+        self.assertEqual(self.server.request_count, 4)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestTTLCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TTLCache(maxsize=2, ttl=600, clock=self.clock)
+
+    def test_entries_expire(self):
+        self.cache.put('delhi', {'temp': 30})
+        self.clock.now = 599
+        self.assertEqual(self.cache.get('delhi'), {'temp': 30})
+        self.clock.now = 600
+        self.assertIsNone(self.cache.get('delhi'))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_lru_eviction(self):
+        self.cache.put('delhi', 1)
+        self.cache.put('mumbai', 2)
+        self.cache.get('delhi')
+        self.cache.put('chennai', 3)
+        self.assertIsNone(self.cache.get('mumbai'))
+        self.assertEqual(self.cache.get('delhi'), 1)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_concurrent_misses_coalesce(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def loader(key):
+            calls.append(key)
+            started.set()
+            release.wait(5)
+            return {'city': key}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get_or_load('delhi', loader)))
+                   for _ in range(5)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while self.cache.stats()['coalesced'] < 4 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(calls, ['delhi'])
+        self.assertEqual(results, [{'city': 'delhi'}] * 5)
+        self.assertEqual(self.cache.get_or_load('delhi', loader), {'city': 'delhi'})
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_async_misses_coalesce(self):
+        calls = []
+
+        async def loader(key):
+            calls.append(key)
+            await asyncio.sleep(0.01)
+            return {'city': key}
+
+        async def load_many():
+            return await asyncio.gather(*[self.cache.get_or_load_async('delhi', loader) for _ in range(5)])
+
+        self.assertEqual(asyncio.run(load_many()), [{'city': 'delhi'}] * 5)
+        self.assertEqual(calls, ['delhi'])
+        self.assertEqual(self.cache.stats()['coalesced'], 4)
+        self.assertEqual(asyncio.run(self.cache.get_or_load_async('delhi', loader)), {'city': 'delhi'})
+
+    def test_async_failure_reaches_waiters(self):
+        async def loader(key):
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream down")
+
+        async def load_many():
+            return await asyncio.gather(*[self.cache.get_or_load_async('delhi', loader) for _ in range(3)],
+                                        return_exceptions=True)
+
+        results = asyncio.run(load_many())
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_uncacheable_results_not_stored(self):
+        result = self.cache.get_or_load('delhi', lambda key: "Error fetching",
+                                        cacheable=lambda value: isinstance(value, dict))
+        self.assertEqual(result, "Error fetching")
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_reservations_queue_behind_the_burst(self):
+        clock = FakeClock()
+        bucket = upstream.TokenBucket(rate=1.0, capacity=2, clock=clock)
+        self.assertEqual([bucket.reserve() for _ in range(4)], [0.0, 0.0, 1.0, 2.0])
+        self.assertIsNone(bucket.reserve(max_wait=2.5))
+        clock.now = 10
+        self.assertEqual(bucket.reserve(max_wait=0), 0.0)
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_half_open_allows_one_probe(self):
+        clock = FakeClock()
+        breaker = upstream.CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+        clock.now = 30
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertEqual(breaker.retry_after(), 30)
+        clock.now = 60
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+
+if __name__ == '__main__':
+    unittest.main()
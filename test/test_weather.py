@@ -2,6 +2,7 @@ import unittest
 from unittest.mock import patch, MagicMock
 import sys
 import os
+import tempfile
 
 # Ensure the parent directory is in the sys.path to find main.py and other modules
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -9,6 +10,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 from app import config
 from app import crud
 from app.scheduler import fetch_weather_data, start_scheduler
+from app.writer import writer
 
 class TestWeatherSystem(unittest.TestCase):
 
@@ -17,8 +19,17 @@ class TestWeatherSystem(unittest.TestCase):
         self.location = "your_location"
         config.settings.openweather_api_key = self.api_key
         config.settings.location = self.location
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.database_path = config.settings.database_path
+        config.settings.database_path = os.path.join(self.tmpdir.name, 'weather.db')
+        crud.create_tables()
 
-    @patch('app.scheduler.requests.get')
+    def tearDown(self):
+        writer.flush()
+        config.settings.database_path = self.database_path
+        self.tmpdir.cleanup()
+
+    @patch('app.upstream.requests.Session.get')
     def test_system_setup(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -27,10 +38,11 @@ class TestWeatherSystem(unittest.TestCase):
         response = fetch_weather_data(self.location)
         self.assertTrue(response)
         mock_get.assert_called_once_with(
-            f"http://api.openweathermap.org/data/2.5/weather?q={self.location}&appid={self.api_key}"
+            f"http://api.openweathermap.org/data/2.5/weather?q={self.location}&appid={self.api_key}",
+            timeout=(config.settings.fetch_connect_timeout, config.settings.fetch_read_timeout)
         )
 
-    @patch('app.scheduler.requests.get')
+    @patch('app.upstream.requests.Session.get')
     def test_data_retrieval(self, mock_get):
         mock_response = MagicMock()
         mock_response.json.return_value = {